@@ -5,6 +5,8 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 from builder import build
+from crawler import discover_links, fetch_pages
+import pandas as pd
 import requests
 import torch
 from fastapi import FastAPI, HTTPException
@@ -14,8 +16,18 @@ from arguments import create_parser
 
 app = FastAPI()
 
+# Seconds to wait for the target site; keeps a slow site from holding a worker thread
+FETCH_TIMEOUT = 20
+
 class InputData(BaseModel):
     url: str
+    crawl: bool = False
+    max_pages: int = 5
+    # Opt-in: drop trivial nodes before tokenization / overlap chunk windows (stride < 384)
+    prefilter: bool = False
+    chunk_stride: int = 384
+    # Short pages share model rows; scores are the same as unpacked (see model.forward_packed)
+    pack: bool = True
 
 
 def init_model():
@@ -28,16 +40,46 @@ def init_model():
 
 model, args = init_model()
 
+def merge_page_texts(pred_df, page_urls):
+    # Site-wide blocks (menus, footers) recur on every page; keep the first copy only
+    seen = set()
+    page_texts = []
+    for url in page_urls:
+        texts = []
+        for text in pred_df[pred_df['Url'] == url]['Text']:
+            key = text.strip()
+            if key in seen:
+                continue
+            seen.add(key)
+            texts.append(text)
+        if texts:
+            page_texts.append(''.join(texts))
+    return '\n'.join(page_texts)
+
+
+# A plain def: FastAPI runs it in its thread pool, so concurrent requests do not queue
+# behind each other's page fetches and inference on the event loop
 @app.post("/predict/")
-async def predict(input_data: InputData):
-    response = requests.get(input_data.url)
+def predict(input_data: InputData):
+    if not 0 < input_data.chunk_stride <= 384:
+        raise HTTPException(status_code=400, detail="chunk_stride must be between 1 and 384")
+
+    try:
+        response = requests.get(input_data.url, timeout=FETCH_TIMEOUT)
+    except requests.exceptions.RequestException:
+        raise HTTPException(status_code=400, detail="Error fetching URL")
     if response.status_code != 200:
         raise HTTPException(status_code=400, detail="Error fetching URL")
 
     html_content = response.content
-    text_nodes_df, data = build(input_data.url, html_content)
+    if input_data.crawl and input_data.max_pages > 1:
+        # Links are resolved against the URL after redirects (e.g. http -> https, apex -> www)
+        return crawl_site(response.url, html_content, response.headers.get('Content-Type'), input_data)
+
+    text_nodes_df, data = build(input_data.url, html_content, response.headers.get('Content-Type'),
+                                input_data.prefilter, input_data.chunk_stride)
     
-    pred_nodes = inference(args, model, data)
+    pred_nodes = inference(args, model, data, pack=input_data.pack)
     pred_nodes_df = save_predictions(pred_nodes)
     
     pred_df = get_text_spans_from_nodes(text_nodes_df, pred_nodes_df).dropna().sort_values(['TextNodeId'], ascending=[False])
@@ -46,5 +88,27 @@ async def predict(input_data: InputData):
     return {"Text": pred_df['Text'][0]}
 
 
+def crawl_site(url, html_content, content_type, input_data):
+    links = discover_links(url, html_content, input_data.max_pages - 1)
+    pages = [(url, html_content, content_type)] + fetch_pages(links, timeout=FETCH_TIMEOUT)
+
+    # Chunks of every page go through a single inference call so they share batches
+    text_nodes_dfs = []
+    data = []
+    for page_url, page_content, page_content_type in pages:
+        built = build(page_url, page_content, page_content_type, input_data.prefilter, input_data.chunk_stride)
+        if built is None:
+            continue
+        text_nodes_dfs.append(built[0])
+        data.extend(built[1])
+    if not data:
+        raise HTTPException(status_code=400, detail="Error parsing pages")
 
+    pred_nodes = inference(args, model, data, pack=input_data.pack)
+    pred_nodes_df = save_predictions(pred_nodes)
+
+    text_nodes_df = pd.concat(text_nodes_dfs, ignore_index=True)
+    pred_df = get_text_spans_from_nodes(text_nodes_df, pred_nodes_df).dropna().sort_values(['TextNodeId'], ascending=[False])
 
+    page_urls = [page[0] for page in pages]
+    return {"Text": merge_page_texts(pred_df, page_urls), "Pages": page_urls}
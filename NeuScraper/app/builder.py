@@ -3,7 +3,8 @@ from api import CommonCrawlApi
 import warnings
 import json
 from bs4 import BeautifulSoup
-import chardet
+from encoding_resolver import decode_html
+from node_filter import is_boilerplate_node
 import pandas as pd
 
 CSV_COLUMN_NAMES = ['Url', 'TextNodeId', 'Text']
@@ -12,20 +13,26 @@ JSON_COLUMN_NAMES = ['TokenId', 'NodeIds', 'Url']
 
 class FeatureExtractorApplierProcessor:
     
-    def __init__(self):
+    def __init__(self, prefilter=False, chunk_stride=384):
         self.comment = 'This is the constant comment for all rows returned'
         self.chunk_size = 384
+        # Nodes near a window edge get context from the next window
+        self.chunk_stride = chunk_stride
         self.max_token_length = 50
+        # Drop nodes that can never be primary content before tokenization
+        self.prefilter = prefilter
 
 
     def _chunk_nodes(self, node_texts, node_seq, node_url):
         chunks = []
 
-        for i in range(0, len(node_texts), self.chunk_size):
-            start = i
-            end = i + self.chunk_size
+        # Windows overlap when chunk_stride < chunk_size; the last one ends with the document
+        for start in range(0, len(node_texts), self.chunk_stride):
+            end = start + self.chunk_size
             chunk = (node_texts[start:end], node_seq[start:end], node_url[start:end])
             chunks.append(chunk)
+            if end >= len(node_texts):
+                break
         return chunks
     
     def add_node_id(self,html_str):
@@ -60,10 +67,6 @@ class FeatureExtractorApplierProcessor:
 
         return soup
     
-    def detect_encoding(self, html_content):
-        result = chardet.detect(html_content)
-        return result['encoding']
-    
    
     def Apply(self, url, api):
 
@@ -77,16 +80,19 @@ class FeatureExtractorApplierProcessor:
         for node_id, node in api.all_nodes.items():
             if node.is_textnode:
                 text = node.html_node.text.strip('\r\n\t\xa0 ') 
-                if len(text) > 0:
-                    node_sequence.append(node_id)
-                    node_texts_tokens.append(tokenizer.tokenize_sequence(text))
-                    node_url.append(url)
-
+                if len(text) == 0:
+                    continue
             elif node.html_node.name in ["ol", "dl", "table"]: # List and Table element nodes
                 text = node.html_node.text.strip('\r\n\t\xa0 ')
-                node_sequence.append(node_id)
-                node_texts_tokens.append(tokenizer.tokenize_sequence(text))
-                node_url.append(url)
+            else:
+                continue
+
+            # NodeIds carry the original node ids, so dropped nodes simply get no prediction
+            if self.prefilter and is_boilerplate_node(node, text):
+                continue
+            node_sequence.append(node_id)
+            node_texts_tokens.append(tokenizer.tokenize_sequence(text))
+            node_url.append(url)
 
         # Chunk Document
         chunks = self._chunk_nodes(node_texts_tokens, node_sequence, node_url)
@@ -100,26 +106,18 @@ class FeatureExtractorApplierProcessor:
 
 
 
-def build(url, raw_html):
+def build(url, raw_html, content_type=None, prefilter=False, chunk_stride=384):
 
-    generator = FeatureExtractorApplierProcessor()
+    # Both stay off by default until their effect on model F1 has been measured
+    generator = FeatureExtractorApplierProcessor(prefilter=prefilter, chunk_stride=chunk_stride)
 
     text_nodes_data = []
     json_data = []
 
-    try:
-        html_content = raw_html.decode('utf-8')
-    except UnicodeDecodeError: 
-        # try to figure out encoding if not utf-8
-
-        guess = chardet.detect(raw_html)['encoding']
-        if not guess or guess == 'UTF-8': return
-
-        try:
-            html_content = raw_html.decode(guess)
-        except (UnicodeDecodeError, LookupError):
-            # still cant figure out encoding, give up
-            return
+    html_content = decode_html(raw_html, content_type)
+    if html_content is None:
+        # cant figure out encoding, give up
+        return
 
     html_soup = generator.add_node_id(html_content)
     api = CommonCrawlApi(html_soup=html_soup)
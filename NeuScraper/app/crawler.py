@@ -0,0 +1,101 @@
+import re
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+# Path / anchor keywords that usually lead to descriptive company pages (en + id)
+LINK_KEYWORDS = {
+    "about": 3.0, "tentang": 3.0, "profile": 2.5, "profil": 2.5, "company": 2.0,
+    "perusahaan": 2.0, "product": 2.5, "produk": 2.5, "service": 2.5, "layanan": 2.5,
+    "solution": 2.0, "solusi": 2.0, "what-we-do": 2.0, "portfolio": 1.5, "client": 1.0,
+    "klien": 1.0, "team": 1.0, "tim": 1.0, "history": 1.0, "sejarah": 1.0,
+    "vision": 1.0, "visi": 1.0, "industr": 1.0, "contact": 0.5, "kontak": 0.5,
+}
+SKIP_KEYWORDS = (
+    "login", "signin", "sign-in", "register", "cart", "checkout", "privacy",
+    "terms", "cookie", "wp-admin", "feed", "tag/", "category/", "author/", "search",
+)
+SKIP_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".zip", ".rar",
+    ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".mp4", ".mp3", ".css", ".js",
+)
+
+
+def _host(url):
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def normalize_link(url):
+    url = urldefrag(url)[0]
+    parsed = urlparse(url)
+    path = parsed.path.rstrip("/") or "/"
+    return f"{parsed.scheme}://{parsed.netloc.lower()}{path}"
+
+
+def score_link(url, anchor_text):
+    path = urlparse(url).path.lower()
+    target = path + " " + (anchor_text or "").lower()
+    if path.endswith(SKIP_EXTENSIONS) or any(k in target for k in SKIP_KEYWORDS):
+        return None
+
+    score = sum(weight for keyword, weight in LINK_KEYWORDS.items() if keyword in target)
+    # Shallow pages tend to be section landing pages rather than articles
+    depth = len([p for p in path.split("/") if p])
+    score -= 0.5 * max(depth - 1, 0)
+    if re.search(r"\d{4}/\d{2}|\?p=|page/\d+", url):
+        score -= 2.0
+    return score
+
+
+def discover_links(base_url, html, limit):
+    """Return up to `limit` same-site links from `html`, best scoring first."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=UserWarning, module='bs4')
+        soup = BeautifulSoup(html, 'html.parser')
+
+    base_host = _host(base_url)
+    seen = {normalize_link(base_url)}
+    candidates = []
+    for a in soup.find_all("a", href=True):
+        href = a["href"].strip()
+        if href.startswith(("mailto:", "tel:", "javascript:", "#")):
+            continue
+        url = urljoin(base_url, href)
+        if urlparse(url).scheme not in ("http", "https") or _host(url) != base_host:
+            continue
+        link = normalize_link(url)
+        if link in seen:
+            continue
+        seen.add(link)
+        score = score_link(link, a.get_text(" ", strip=True))
+        if score is not None and score > 0:
+            candidates.append((score, len(candidates), link))
+
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+    return [link for _, _, link in candidates[:limit]]
+
+
+def fetch_pages(urls, max_workers=4, timeout=20):
+    """Fetch `urls` concurrently, returning `[(url, raw bytes, content type)]` for the successful ones."""
+    if not urls:
+        return []
+    session = requests.Session()
+
+    def fetch(url):
+        try:
+            response = session.get(url, timeout=timeout)
+        except requests.exceptions.RequestException:
+            return None
+        content_type = response.headers.get("Content-Type", "html")
+        if response.status_code != 200 or "html" not in content_type:
+            return None
+        return url, response.content, content_type
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = [page for page in executor.map(fetch, urls) if page is not None]
+    session.close()
+    return pages
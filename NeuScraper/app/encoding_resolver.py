@@ -0,0 +1,118 @@
+import codecs
+import re
+
+import chardet
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Browsers treat these labels as windows-1252, and so do real pages
+LABEL_ALIASES = {
+    'iso-8859-1': 'cp1252',
+    'iso8859-1': 'cp1252',
+    'latin1': 'cp1252',
+    'latin-1': 'cp1252',
+    'us-ascii': 'cp1252',
+    'ascii': 'cp1252',
+}
+
+HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+META_CHARSET_RE = re.compile(
+    rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.I
+)
+
+META_SCAN_BYTES = 4096
+DETECT_PREFIX_BYTES = 64 * 1024
+
+
+def normalize_label(label):
+    if not label:
+        return None
+    if isinstance(label, bytes):
+        label = label.decode('ascii', 'ignore')
+    label = label.strip().lower()
+    label = LABEL_ALIASES.get(label, label)
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def _looks_utf8(prefix):
+    # Incremental decoding tolerates a multi-byte character cut at the prefix end
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _declared_utf8(encoding, prefix):
+    # Servers commonly send a default ISO-8859-1 charset with UTF-8 pages. Non-ASCII
+    # text that also happens to be valid UTF-8 is very unlikely to be real cp1252
+    return encoding == 'cp1252' and not prefix.isascii() and _looks_utf8(prefix)
+
+
+def resolve_encoding(raw, content_type=None):
+    """Return `(encoding, source)` for a raw HTML body.
+
+    Checks, in order: a byte order mark, the Content-Type header charset,
+    a <meta> charset in the first few KB, UTF-8 validity of a bounded
+    prefix and finally chardet over that prefix. A declared single-byte
+    legacy charset (latin-1/cp1252/ascii) loses to UTF-8 when the prefix
+    is valid, non-ASCII UTF-8. Only the prefix is ever scanned, so the
+    cost does not grow with the size of the document.
+    """
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding, 'bom'
+
+    prefix = raw[:DETECT_PREFIX_BYTES]
+    if content_type:
+        match = HEADER_CHARSET_RE.search(content_type)
+        encoding = normalize_label(match.group(1)) if match else None
+        if encoding:
+            if _declared_utf8(encoding, prefix):
+                return 'utf-8', 'header-utf8'
+            return encoding, 'header'
+
+    match = META_CHARSET_RE.search(raw[:META_SCAN_BYTES])
+    encoding = normalize_label(match.group(1)) if match else None
+    if encoding:
+        if _declared_utf8(encoding, prefix):
+            return 'utf-8', 'meta-utf8'
+        return encoding, 'meta'
+
+    if _looks_utf8(prefix):
+        return 'utf-8', 'utf8-prefix'
+
+    encoding = normalize_label(chardet.detect(prefix)['encoding'])
+    return encoding, 'detector'
+
+
+def decode_html(raw, content_type=None):
+    """Decode `raw` with the resolved encoding, or return None if that fails.
+
+    Declared charsets are sometimes wrong, so a failed strict decode falls
+    back to the prefix detector before giving up.
+    """
+    encoding, source = resolve_encoding(raw, content_type)
+    if encoding:
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+
+    if source != 'detector':
+        encoding = normalize_label(chardet.detect(raw[:DETECT_PREFIX_BYTES])['encoding'])
+        if encoding:
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                pass
+    return None
@@ -2,7 +2,8 @@ import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader, IterableDataset
 from model import ContentExtractionTextEncoder
-from processing import wrapped_commoncrawl_process_fn, content_extraction_collate_fn
+from processing import wrapped_commoncrawl_process_fn, content_extraction_collate_fn, pack_rows
+import numpy as np
 import pandas as pd
 
 
@@ -21,11 +22,6 @@ class SamplesDataset(IterableDataset):
             for rec in x:
                 yield rec
 
-def pad_list(x, max_len):
-    list_len = len(x)
-    x.extend([0] * (max_len - list_len))
-    return x
-
 class ContentExtractionDeepModel(nn.Module):
     def __init__(self, args):
         # TODO: Add config file
@@ -68,59 +64,67 @@ class ContentExtractionDeepModel(nn.Module):
         model.load_state_dict(model_dict) 
 
     
-def inference(args, model,corpus_data):
+def accumulate_node_scores(node_scores, output, urls, node_ids):
+    """Add each node's task scores to `node_scores[(url, node)] = [sum, count]`.
+
+    Overlapping windows score a node more than once; the sums are averaged
+    by `threshold_node_scores`. Urls and node ids are per slot, so packed
+    rows holding several documents unpack correctly.
+    """
+    output = output.float().cpu().numpy()
+    for row, (row_urls, row_nodes) in enumerate(zip(urls, node_ids)):
+        for slot, (url, node) in enumerate(zip(row_urls[: output.shape[1]], row_nodes)):
+            entry = node_scores.get((url, node))
+            if entry is None:
+                node_scores[(url, node)] = [output[row, slot].copy(), 1]
+            else:
+                entry[0] += output[row, slot]
+                entry[1] += 1
+
+
+def threshold_node_scores(node_scores, tasks, thresholds):
+    predicted_nodes = {task: {thr: {} for thr in thresholds} for task in tasks}
+    if not node_scores:
+        return predicted_nodes
+
+    keys = list(node_scores)
+    mean_scores = np.stack([total / count for total, count in node_scores.values()])
+    for idx, task in enumerate(tasks):
+        for thr in thresholds:
+            for i in np.flatnonzero(mean_scores[:, idx] > thr):
+                url, node = keys[i]
+                predicted_nodes[task][thr].setdefault(url, set()).add(node)
+    return predicted_nodes
+
+
+def inference(args, model, corpus_data, pack=True):
     thresholds = [0.1, 0.25, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+    tasks = ['Primary', 'Heading', 'Title', 'Paragraph', 'Table', 'List']
     data_process_fn = wrapped_commoncrawl_process_fn(args)
+    if pack:
+        # Short pages and chunk tails share rows instead of each padding one to max_sequence_len;
+        # the model scores every packed page as if it had its own row
+        corpus_data = pack_rows(corpus_data, args.max_sequence_len)
     dataset = SamplesDataset(corpus_data, data_process_fn)
     dataloader = DataLoader(
             dataset, batch_size=256, num_workers=0, collate_fn=content_extraction_collate_fn, drop_last=False
         )
 
-    predicted_nodes = {}
-    added_urls = set()
-    tasks = ['Primary', 'Heading', 'Title', 'Paragraph', 'Table', 'List']
-    
-    for task in tasks:
-        predicted_nodes[task] = {}
-        for thr in thresholds:
-            predicted_nodes[task][thr]={}
-    
+    node_scores = {}
     model.eval()
 
     for val_step, batch in enumerate(dataloader):
-        model.eval()
-
-        padded_list = [pad_list(x, args.max_sequence_len) for x in batch[3]]
-        node_ids_batch = torch.tensor(padded_list).to(args.device)
         urls = batch[2]
-        batch = batch[:2]
-        batch = tuple(t.to(args.device) for t in batch)
+        node_ids = batch[3]
+        inputs = batch[:2] + batch[4:]
+        inputs = tuple(t.to(args.device) for t in inputs)
 
         with torch.no_grad():
-            output = model(batch)
-        
-        for thr in thresholds:
-            predictions = (output > thr)
-            for idx, task in enumerate(tasks):
-                task_predictions = predictions[:, :, idx].squeeze()
-                pred_nodes = torch.where(task_predictions, node_ids_batch, 0).cpu().numpy()
-                for batch_idx, doc in enumerate(pred_nodes): # each element of the batch
-                    elements = set(doc)
-
-                    if 0 in elements:
-                        elements.remove(0)
-                    curr_url = urls[batch_idx]
-
-                    if len(curr_url)==0:
-                        continue
-                    else:
-                        curr_url = curr_url[0]
-
-                    if curr_url not in predicted_nodes[task][thr]:
-                        predicted_nodes[task][thr][curr_url] = set()
-                    predicted_nodes[task][thr][curr_url].update(elements)
+            output = model(inputs)
 
-    return predicted_nodes
+        accumulate_node_scores(node_scores, output, urls, node_ids)
+
+    return threshold_node_scores(node_scores, tasks, thresholds)
 
 def get_text_spans_from_nodes(text_nodes_df, pred_nodes_df):
     text_pred_nodes_df = pd.merge(pred_nodes_df, text_nodes_df, how='left', on=['Url', 'TextNodeId'])
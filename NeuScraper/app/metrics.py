@@ -17,8 +17,11 @@ classes_weight_map = {
 
 class ContentExtractionLoss:
 
-    def __init__(self):
+    def __init__(self, debug=False):
         self.classes_weight_map = classes_weight_map
+        # Print per-class diagnostics when a loss is not finite (costs one device sync per step)
+        self.debug = debug
+        self.weight_tensors = {}
 
     def get_weight_map(self):
         return self.classes_weight_map
@@ -29,6 +32,16 @@ class ContentExtractionLoss:
 
         for k in self.classes_weight_map:
             self.classes_weight_map[k] = weight_map_loaded[str(k)]
+        self.weight_tensors = {}
+
+    def get_weight_tensors(self, device):
+        """
+        Positive, negative and class weights as [num_classes] tensors, cached per device
+        """
+        if device not in self.weight_tensors:
+            weights = [self.classes_weight_map[i][1:4] for i in range(len(self.classes_weight_map))]
+            self.weight_tensors[device] = torch.tensor(weights, dtype=torch.float, device=device).t().contiguous()
+        return self.weight_tensors[device]
 
     def single_class_weighted_crossentropy(self, y_true, y_pred, pos_weight, neg_weight):
         pos_loss = y_true * log(y_pred) * pos_weight
@@ -37,42 +50,44 @@ class ContentExtractionLoss:
         return mean(logloss, -1), pos_loss, neg_loss
 
     def weighted_crossentropy(self, y_true, y_pred):
-        y_pred = torch.clamp(y_pred, min=eps, max=(1.0 - eps))
+        # In float32 even under autocast: 1 - eps rounds to 1.0 in fp16/bf16 and log(1 - y_pred) would be -inf
+        y_pred = torch.clamp(y_pred.float(), min=eps, max=(1.0 - eps))
         y_true = torch.clamp(y_true, min=eps, max=(1.0 - eps))
-        num_classes = y_pred.size()[2]
-
-        loss = 0.0
-        class_loss_list = torch.zeros(2, num_classes)
-
-        for i in range(num_classes):
-            positive_weight = self.classes_weight_map[i][1]
-            negative_weight = self.classes_weight_map[i][2]
-            class_weight = self.classes_weight_map[i][3]
-
-            weighted_ce_loss, pos_loss, neg_loss = self.single_class_weighted_crossentropy(
-                y_true[:, :, i], y_pred[:, :, i], positive_weight, negative_weight
-            )
-            class_loss_list[0][i] = pos_loss.mean()
-            class_loss_list[1][i] = neg_loss.mean()
-
-            if not math.isfinite(neg_loss.mean().item()):
-                torch.set_printoptions(profile="full")
-                print(self.classes_weight_map[i][0] + " encounter infinity loss!!!!!!!!\n")
-                nan_in_neg_loss = torch.isnan(neg_loss)
-                print("Any nan in neg loss: \n")
-                print(nan_in_neg_loss[nan_in_neg_loss])
-                inf_in_neg_loss = torch.isinf(neg_loss)
-                print("Any inf in neg loss: \n")
-                print(inf_in_neg_loss[inf_in_neg_loss])
-                filter_invalid_loss = inf_in_neg_loss | nan_in_neg_loss
-
-                print("invalid negative loss: \n")
-                print(neg_loss[filter_invalid_loss])
-                print("invalid Y predict \n")
-                print(y_pred[:, :, i][filter_invalid_loss])
-                print("y_true: \n")
-                print(y_true[:, :, i][filter_invalid_loss])
-                torch.set_printoptions(profile="default")
-            loss += class_weight * weighted_ce_loss
-
-        return loss.mean(), class_loss_list
\ No newline at end of file
+        positive_weight, negative_weight, class_weight = self.get_weight_tensors(y_pred.device)
+
+        # All classes at once on [batch, seq_len, num_classes]. The loss is linear in the weights,
+        # so they are applied to the [batch, num_classes] means rather than broadcast per node
+        # In place where possible: fresh full-size temporaries dominate the cost on CPU
+        pos_loss = log(y_pred).mul_(y_true)
+        neg_loss = torch.rsub(y_pred, 1).log_()
+        neg_loss.addcmul_(neg_loss, y_true, value=-1)
+        pos_mean = mean(pos_loss, 1)
+        neg_mean = mean(neg_loss, 1)
+        weighted_ce_loss = -(pos_mean * positive_weight + neg_mean * negative_weight)
+        loss = (weighted_ce_loss * class_weight).sum(-1)
+        class_loss_list = torch.stack([pos_mean.mean(0) * positive_weight, neg_mean.mean(0) * negative_weight])
+
+        if self.debug and not torch.isfinite(class_loss_list[1]).all():
+            self.print_invalid_loss(y_true, y_pred, neg_loss * negative_weight, class_loss_list[1])
+
+        return loss.mean(), class_loss_list
+
+    def print_invalid_loss(self, y_true, y_pred, neg_loss, class_neg_loss):
+        torch.set_printoptions(profile="full")
+        for i in torch.nonzero(~torch.isfinite(class_neg_loss)).flatten().tolist():
+            print(self.classes_weight_map[i][0] + " encounter infinity loss!!!!!!!!\n")
+            nan_in_neg_loss = torch.isnan(neg_loss[:, :, i])
+            print("Any nan in neg loss: \n")
+            print(nan_in_neg_loss[nan_in_neg_loss])
+            inf_in_neg_loss = torch.isinf(neg_loss[:, :, i])
+            print("Any inf in neg loss: \n")
+            print(inf_in_neg_loss[inf_in_neg_loss])
+            filter_invalid_loss = inf_in_neg_loss | nan_in_neg_loss
+
+            print("invalid negative loss: \n")
+            print(neg_loss[:, :, i][filter_invalid_loss])
+            print("invalid Y predict \n")
+            print(y_pred[:, :, i][filter_invalid_loss])
+            print("y_true: \n")
+            print(y_true[:, :, i][filter_invalid_loss])
+        torch.set_printoptions(profile="default")
\ No newline at end of file
@@ -88,19 +88,77 @@ class ContentExtractionTextEncoder(nn.Module):
         self.text_roberta = XLMRobertaModel(text_roberta_config)
 
 
+    def segment_positions(self, segment_ids):
+        """Index of every slot within its own segment, restarting at each boundary."""
+        slots = torch.arange(segment_ids.size(1), device=segment_ids.device).expand_as(segment_ids)
+        boundary = torch.ones_like(segment_ids, dtype=torch.bool)
+        boundary[:, 1:] = segment_ids[:, 1:] != segment_ids[:, :-1]
+        starts = torch.where(boundary, slots, torch.zeros_like(slots)).cummax(dim=1).values
+        return slots - starts
+
+    def encode_nodes(self, token_ids, token_masks):
+        """Pooled text_roberta output of each node: [nodes, max_token_len] -> [nodes, text_in_emb_dim]."""
+        return self.text_roberta(input_ids=token_ids, attention_mask=token_masks).pooler_output
+
     def forward(self, x):
-        [token_ids, token_masks] = x
+        token_ids, token_masks = x[0], x[1]
         seq_len = self.max_sequence_len
         text_in_emb_dim = self.text_in_emb_dim
         max_token_len = self.max_token_len
 
-        token_ids = token_ids.view(-1, max_token_len)  # [batch * max_sequence_len, max_token_len]
-        token_masks = token_masks.view(-1, max_token_len)  # [batch * max_sequence_len, max_token_len]
+        if len(x) > 2:
+            # Packed rows hold several documents, numbered 1, 2, ... (0 is padding)
+            return self.forward_packed(token_ids, token_masks, x[2])
 
-        features = []
+        if token_ids.is_floating_point():
+            # Node embeddings precomputed by precompute_embeddings.py with the frozen text encoder
+            all_text_emb = token_ids.view(-1, seq_len, text_in_emb_dim).to(self.textlinear.weight.dtype)
+        else:
+            token_ids = token_ids.view(-1, max_token_len)  # [batch * max_sequence_len, max_token_len]
+            token_masks = token_masks.view(-1, max_token_len)  # [batch * max_sequence_len, max_token_len]
+            all_text_emb = self.encode_nodes(token_ids, token_masks).reshape(-1, seq_len, text_in_emb_dim)
+
+        return self.classify_nodes(all_text_emb)
 
-        text_output = self.text_roberta(input_ids=token_ids, attention_mask=token_masks)
-        all_text_emb = text_output.pooler_output.reshape(-1, seq_len, text_in_emb_dim)
+    def forward_packed(self, token_ids, token_masks, segment_ids):
+        """
+        Score packed rows exactly as if each document had its own row
+
+        Nodes are encoded independently, so only the real nodes of the packed rows (and one padding
+        node) go through text_roberta. Each document is then laid out at the start of its own
+        max_sequence_len row, filled up with the padding node's embedding, which is what the node
+        encoder saw in training. Scores come back in the packed layout.
+        """
+        seq_len = self.max_sequence_len
+        max_token_len = self.max_token_len
+        if token_ids.is_floating_point():
+            raise ValueError("packed rows need token ids, not precomputed embeddings")
+
+        real = segment_ids.view(-1) > 0
+        token_ids = token_ids.view(-1, max_token_len)[real]
+        token_masks = token_masks.view(-1, max_token_len)[real]
+        # Padding slots of an unpacked row hold all-zero token ids and masks
+        padding = torch.zeros(1, max_token_len, dtype=token_ids.dtype, device=token_ids.device)
+        node_emb = self.encode_nodes(torch.cat([token_ids, padding]), torch.cat([token_masks, padding.to(token_masks.dtype)]))
+
+        # Slot of every real node in the per-document layout: document index * seq_len + position
+        docs_per_row = segment_ids.max(dim=1).values
+        first_doc = torch.cumsum(docs_per_row, 0) - docs_per_row
+        doc_index = first_doc.unsqueeze(1) + segment_ids - 1
+        target = (doc_index * seq_len + self.segment_positions(segment_ids)).view(-1)[real]
+
+        num_docs = int(docs_per_row.sum())
+        all_text_emb = node_emb[-1:].repeat(num_docs * seq_len, 1)
+        all_text_emb[target] = node_emb[:-1]
+        doc_output = self.classify_nodes(all_text_emb.view(num_docs, seq_len, -1))
+
+        output = doc_output.new_zeros(real.shape[0], doc_output.shape[-1])
+        output[real] = doc_output.view(num_docs * seq_len, -1)[target]
+        return output.view(segment_ids.shape[0], seq_len, -1)
+
+    def classify_nodes(self, all_text_emb):
+        """Node encoder and classifier over rows of node embeddings: [rows, max_sequence_len, text_in_emb_dim]."""
+        features = []
 
         text_x = self.textlinear(all_text_emb)
         features.append(text_x)
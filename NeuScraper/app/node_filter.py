@@ -0,0 +1,47 @@
+import re
+
+# Text under these elements is never rendered as page content
+SKIP_PARENTS = {"script", "style", "template", "noscript", "textarea"}
+CODE_PARENTS = ["pre", "code"]
+
+# Script / stylesheet remnants that leak into text nodes (inline handlers,
+# unclosed <script> bodies, CSS rules, JSON blobs, HTML comments)
+CODE_RE = re.compile(
+    r"^\s*(?:"
+    r"<!--|//|/\*|\{\s*\"|\[\s*\{|@media|@import|@font-face"
+    r"|(?:var|let|const)\s+[\w$]+\s*=|function\s*[\w$]*\s*\(|(?:window|document|jQuery)\.|\$\("
+    r"|[.#]?[\w-]+(?:\s*[,>]\s*[.#]?[\w-]+)*\s*\{[^}]*:[^}]*\}"
+    r")"
+)
+CODE_CHARS = set("{}();=<>[]")
+# Punctuation and operators that join inline elements within prose
+# ("<a>A</a>, <a>B</a>", "Vec<<a>T</a>>")
+PROSE_PUNCTUATION = set(".,;:!?'\"()[]-+*/=<>&%")
+
+
+def is_code_like(text):
+    if CODE_RE.match(text):
+        return True
+    # Prose rarely has more than one code punctuation character per 8 characters
+    return len(text) >= 40 and sum(c in CODE_CHARS for c in text) * 8 > len(text)
+
+
+def is_separator(text):
+    return not any(c.isalnum() or c in PROSE_PUNCTUATION for c in text)
+
+
+def is_boilerplate_node(node, text):
+    """True for nodes that can never be primary content.
+
+    Covers text inside script/style-like elements and, outside <pre>/<code>,
+    symbol-only strings (separators, bullets, icons) and code remnants. The
+    rules only look at the node itself, so they are safe to apply before
+    the model.
+    """
+    parent = node.html_node.parent
+    if node.is_textnode and parent is not None and parent.name in SKIP_PARENTS:
+        return True
+    # Code shown in <pre>/<code> is visible and can be the page's content
+    if node.html_node.find_parent(CODE_PARENTS) is not None:
+        return False
+    return is_separator(text) or is_code_like(text)
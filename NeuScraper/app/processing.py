@@ -21,6 +21,19 @@ def wrapped_commoncrawl_process_fn(args):
 
     return fn
 
+def wrapped_packing_process_fn(args):
+    # Rows stay parsed dicts; the packing collate function turns them into tensors
+    def fn(line, i):
+        return [parse_data_file_json(line)]
+
+    return fn
+
+def wrapped_packing_collate_fn(args, labels=False):
+    def fn(batch):
+        return content_extraction_packing_collate_fn(batch, args, labels)
+
+    return fn
+
 def parse_data_file_json(doc_json):
     """
     Extract Text token id, Offsets, Labels, Visual Features from JSON
@@ -60,6 +73,8 @@ def generate_data_as_tensors(data, args, eval_mode=False):
     if eval_mode:
         tensors.append(data['Url'])
         tensors.append(data['NodeIds'])
+        if 'SegmentIds' in data:
+            tensors.append(generate_segment_tensor(data, args))
     return [tensors]
 
 def generate_commoncrawl_data_as_tensors(data, args, eval_mode=False):
@@ -83,9 +98,47 @@ def generate_commoncrawl_data_as_tensors(data, args, eval_mode=False):
 
     tensors.append(data['Url'])
     tensors.append(data['NodeIds'])
+    if 'SegmentIds' in data:
+        tensors.append(generate_segment_tensor(data, args))
     return [tensors]
 
 
+def generate_segment_tensor(data, args):
+    segment_ids = torch.tensor(data['SegmentIds'][0 : args.max_sequence_len], dtype=torch.long)
+    return F.pad(segment_ids, (0, args.max_sequence_len - segment_ids.shape[0]))
+
+
+def pack_documents(docs, max_len):
+    """
+    Pack parsed chunk rows into as few rows of at most max_len nodes as possible
+    """
+    # First-fit decreasing; each packed row numbers its documents in SegmentIds (1, 2, ...)
+    docs = sorted(docs, key=lambda data: len(data['NodeIds']), reverse=True)
+    fields = [key for key in ('TokenId', 'Labels', 'NodeIds', 'Url') if docs and key in docs[0]]
+
+    packed = []
+    for data in docs:
+        size = min(len(data['NodeIds']), max_len)
+        target = next((row for row in packed if len(row['NodeIds']) + size <= max_len), None)
+        if target is None:
+            target = {key: [] for key in fields + ['SegmentIds']}
+            packed.append(target)
+        segment = target['SegmentIds'][-1] + 1 if target['SegmentIds'] else 1
+        for key in fields:
+            target[key].extend(data[key][:size])
+        target['SegmentIds'].extend([segment] * size)
+
+    return packed
+
+
+def pack_rows(rows, max_len):
+    """
+    Pack chunk rows (JSON lines) into as few rows of at most max_len nodes as possible
+    """
+    packed = pack_documents([parse_data_file_json(row) for row in rows], max_len)
+    return [ujson.dumps(row) for row in packed]
+
+
 def content_extraction_process_fn(line, i, args, eval_mode=False):
     data = parse_data_file_json(line)
     tensors = generate_data_as_tensors(data, args, eval_mode)
@@ -113,3 +166,17 @@ def content_extraction_collate_fn(batch):
         final_batch.append(field)
 
     return final_batch
+
+
+def content_extraction_packing_collate_fn(batch, args, labels=False):
+    """
+    Pack a batch of parsed chunk rows into shared max_sequence_len rows, then tensorize
+    """
+    # Fields keep the unpacked layout (Url and NodeIds per slot), with SegmentIds appended last
+    rows = []
+    for data in pack_documents(batch, args.max_sequence_len):
+        if labels:
+            rows.extend(generate_data_as_tensors(data, args, eval_mode=True))
+        else:
+            rows.extend(generate_commoncrawl_data_as_tensors(data, args))
+    return content_extraction_collate_fn(rows)
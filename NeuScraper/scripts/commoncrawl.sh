@@ -3,4 +3,5 @@ path=commoncrawl/encoded/
 
 CUDA_VISIBLE_DEVICES=1 python src/scraper/commoncrawl.py  \
 	--model_path ${parser_path} \
-	--corpus_root_path ${path}
\ No newline at end of file
+	--corpus_root_path ${path} \
+	--pack
\ No newline at end of file
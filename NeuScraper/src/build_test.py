@@ -12,13 +12,17 @@ from multiprocessing import Pool
 from argparse import ArgumentParser
 from tokenization import TokenizerProcessor
 from api import AnnotateHtml, AnnotateHtmlApi
+from node_filter import is_boilerplate_node
 
 class FeatureExtractorApplierProcessor:
-    def __init__(self):
+    def __init__(self, prefilter=False, chunk_stride=384):
         self.comment = 'This is the constant comment for all rows returned'
         self.chunk_size = 384
+        self.chunk_stride = chunk_stride
         self.max_token_length = 50
         self.tokenizer = TokenizerProcessor(self.max_token_length)
+        # Drop nodes that can never be primary content before tokenization
+        self.prefilter = prefilter
 
 
     def _get_html_from_warc(self, cw22id, cw22root_path):
@@ -92,12 +96,13 @@ class FeatureExtractorApplierProcessor:
     def _chunk_nodes(self, node_texts, labels, node_seq, node_url):
         chunks = []
 
-        for i in range(0, len(node_texts), self.chunk_size):
-            start = i
-            end = i + self.chunk_size
+        # Windows overlap when chunk_stride < chunk_size; the last one ends with the document
+        for start in range(0, len(node_texts), self.chunk_stride):
+            end = start + self.chunk_size
             chunk = (node_texts[start:end], labels[start:end], node_seq[start:end], node_url[start:end])
             chunks.append(chunk)
-            start += self.chunk_size
+            if end >= len(node_texts):
+                break
         
         return chunks
 
@@ -109,16 +114,19 @@ class FeatureExtractorApplierProcessor:
         for node_id, node in api.all_nodes.items():
             if node.is_textnode:
                 text = node.html_node.text.strip('\r\n\t\xa0 ') 
-                if len(text) > 0:
-                    node_sequence.append(node_id)
-                    node_texts_tokens.append(self.tokenizer.tokenize_sequence(text))
-                    node_url.append(api.url)
-
+                if len(text) == 0:
+                    continue
             elif node.html_node.name in ["ol", "dl", "table"]:
                 text = node.html_node.text.strip('\r\n\t\xa0 ')
-                node_sequence.append(node_id)
-                node_texts_tokens.append(self.tokenizer.tokenize_sequence(text))
-                node_url.append(api.url)
+            else:
+                continue
+
+            # NodeIds carry the original node ids, so dropped nodes simply get no prediction
+            if self.prefilter and is_boilerplate_node(node, text):
+                continue
+            node_sequence.append(node_id)
+            node_texts_tokens.append(self.tokenizer.tokenize_sequence(text))
+            node_url.append(api.url)
 
         node_to_annotation = self._get_annotation_labels(api)
         labels = self._compute_labels(node_sequence, node_to_annotation)
@@ -180,12 +188,14 @@ if __name__ == "__main__":
 
     parser = ArgumentParser()
     parser.add_argument('--path', required=True)
+    parser.add_argument('--prefilter', action='store_true', help="Skip script remnants, punctuation-only and other trivial nodes before tokenization")
+    parser.add_argument('--chunk_stride', type=int, default=384, help="Nodes between chunk starts; below 384 chunks overlap")
     args = parser.parse_args()
 
     if not os.path.exists('data/test/'):
         os.makedirs('data/test/')
 
-    generator = FeatureExtractorApplierProcessor()
+    generator = FeatureExtractorApplierProcessor(prefilter=args.prefilter, chunk_stride=args.chunk_stride)
 
     cw22root_path = args.path
     vdom_path = cw22root_path + "/vdom/en/en00/en0001/en0001-01.zip"
@@ -0,0 +1,58 @@
+# Copyright (c) 2023 OpenMatch
+# Author: Zhipeng Xu
+# All rights reserved.
+
+import json
+import math
+import evaluator
+import pandas as pd
+from argparse import ArgumentParser
+from run_eval import sort
+
+CHUNK_SIZE = 384
+
+
+def oracle_scores(gt_df, kept):
+    """Metrics of a perfect model that only sees the nodes in `kept`."""
+    positive_text, negative_text = evaluator.get_primary_ground_truth_text_dicts(gt_df)
+
+    primary = gt_df[gt_df['JudgmentIsPrimary']]
+    primary = primary[[(url, node) in kept for url, node in zip(primary['Url'], primary['TextNodeId'])]]
+    pred_df = primary.assign(Task='Primary').sort_values(['TextNodeId'], ascending=[False])
+    pred_df = pred_df.groupby(['Url', 'Task'], as_index=False).agg({'Text': ''.join})
+    pred_df = sort(pred_df, gt_df)
+
+    return evaluator.compute_primary_task_metrics_from_text(pred_df, positive_text, negative_text)
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser()
+    parser.add_argument('--gold', default="data/test/GoldLabels.csv")
+    parser.add_argument('--features', default="data/test/TestNodes.json", help="Features built with build_test.py --prefilter")
+    args = parser.parse_args()
+
+    gt_df = pd.read_csv(args.gold, lineterminator='\n').dropna()
+    gt_df["TextNodeId"] = gt_df["TextNodeId"].astype(int)
+
+    kept = set()
+    filtered_chunks = 0
+    with open(args.features, 'r', encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            kept.update(zip(row['Url'], row['NodeIds']))
+            filtered_chunks += 1
+
+    all_nodes = set(zip(gt_df['Url'], gt_df['TextNodeId']))
+    primary_nodes = set(zip(gt_df[gt_df['JudgmentIsPrimary']]['Url'], gt_df[gt_df['JudgmentIsPrimary']]['TextNodeId']))
+    dropped = all_nodes - kept
+    chunks = sum(math.ceil(n / CHUNK_SIZE) for n in gt_df.groupby('Url').size())
+
+    print("Nodes: %d, dropped by pre-filter: %d (%.1f%%)" % (len(all_nodes), len(dropped), 100.0 * len(dropped) / len(all_nodes)))
+    print("Primary nodes dropped: %d of %d" % (len(primary_nodes & dropped), len(primary_nodes)))
+    print("Chunks: %d -> %d (%.2fx fewer model inputs)" % (chunks, filtered_chunks, chunks / max(filtered_chunks, 1)))
+
+    _, _, _, full_f1 = oracle_scores(gt_df, all_nodes)
+    precision, recall, accuracy, fscore = oracle_scores(gt_df, kept)
+    print("Oracle F1 without pre-filter: %f" % full_f1)
+    print("Oracle F1 with pre-filter: Acc: %f Prec: %f Rec: %f F1: %f" % (accuracy, precision, recall, fscore))
@@ -8,6 +8,15 @@ def create_parser():
     parser.add_argument("--output_dir", type=str, help="model output directory")
     parser.add_argument("--checkpoint_path", default="", type=str, help="checkpoint_path")
     parser.add_argument("--log_dir", type=str, help="log directory")
+    parser.add_argument("--shard_data", action="store_true", help="read binary shards built by shards.py instead of JSON lines")
+    parser.add_argument(
+        "--cached_embeddings",
+        action="store_true",
+        help="train on node embeddings written by precompute_embeddings.py; needs --shard_data and --freeze_text_encoder",
+    )
+    parser.add_argument("--global_shuffle", action="store_true", help="shuffle training rows across files in blocks instead of within each file")
+    parser.add_argument("--shuffle_block_size", default=32, type=int, help="contiguous rows read together with --global_shuffle")
+    parser.add_argument("--shuffle_buffer_blocks", default=8, type=int, help="blocks shuffled together in memory with --global_shuffle")
     parser.add_argument(
         "--textemb_inference_model_dir",
         default="xlm-roberta-base",
@@ -42,8 +51,9 @@ def create_parser():
     parser.add_argument(
         "--fp16",
         action="store_true",
-        help="Whether to use 16-bit (mixed) precision (through NVIDIA apex) instead of 32-bit",
+        help="Whether to use 16-bit (mixed) precision (native torch autocast with loss scaling) instead of 32-bit",
     )
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast, on GPU or CPU; needs no loss scaling")
     parser.add_argument(
         "--fp16_opt_level",
         type=str,
@@ -58,6 +68,12 @@ def create_parser():
         help="If > 0: set total number of training steps to perform. Override num_train_epochs.",
     )
     parser.add_argument("--max_grad_norm", default=1.0, type=float, help="Max gradient norm.")
+    parser.add_argument("--debug_loss", action="store_true", help="print per-class diagnostics when the loss is not finite")
+    parser.add_argument(
+        "--fast_train",
+        action="store_true",
+        help="keep the loss on device until logging_steps, clamp gradients in one fused pass and skip the per-step barrier",
+    )
     parser.add_argument(
         "--gradient_accumulation_steps", default=1, type=float, help="gradient accumulate every n steps"
     )
@@ -0,0 +1,66 @@
+import math
+import time
+from argparse import ArgumentParser
+
+import torch
+from torch import log, mean
+from metrics import ContentExtractionLoss, eps
+
+
+def legacy_weighted_crossentropy(weight_map, y_true, y_pred):
+    # Behaviour before vectorization: one pass per class, .item() per class for the NaN check
+    y_pred = torch.clamp(y_pred.float(), min=eps, max=(1.0 - eps))
+    y_true = torch.clamp(y_true, min=eps, max=(1.0 - eps))
+    num_classes = y_pred.size()[2]
+
+    loss = 0.0
+    class_loss_list = torch.zeros(2, num_classes)
+    for i in range(num_classes):
+        pos_loss = y_true[:, :, i] * log(y_pred[:, :, i]) * weight_map[i][1]
+        neg_loss = (1 - y_true[:, :, i]) * log(1 - y_pred[:, :, i]) * weight_map[i][2]
+        class_loss_list[0][i] = pos_loss.mean()
+        class_loss_list[1][i] = neg_loss.mean()
+        if not math.isfinite(neg_loss.mean().item()):
+            pass
+        loss += weight_map[i][3] * mean(-(pos_loss + neg_loss), -1)
+    return loss.mean(), class_loss_list
+
+
+def timed(fn, repeats, device):
+    fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=128)
+    parser.add_argument("--max_sequence_len", type=int, default=384)
+    parser.add_argument("--num_classes", type=int, default=6)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    shape = (args.batch_size, args.max_sequence_len, args.num_classes)
+    y_true = (torch.rand(shape, device=device) > 0.8).float()
+    y_pred = torch.rand(shape, device=device)
+    loss_calculator = ContentExtractionLoss()
+    weight_map = loss_calculator.get_weight_map()
+
+    legacy_loss, legacy_class_loss = legacy_weighted_crossentropy(weight_map, y_true, y_pred)
+    loss, class_loss = loss_calculator.weighted_crossentropy(y_true, y_pred)
+    print("Max difference: loss %.2e, class loss %.2e" % (
+        (loss - legacy_loss).abs().item(), (class_loss.cpu() - legacy_class_loss).abs().max().item()))
+
+    legacy_time = timed(lambda: legacy_weighted_crossentropy(weight_map, y_true, y_pred), args.repeats, device)
+    vectorized_time = timed(lambda: loss_calculator.weighted_crossentropy(y_true, y_pred), args.repeats, device)
+    print("Inputs %s on %s" % (list(shape), device))
+    print("per-class loop: %.3f ms" % (legacy_time * 1000))
+    print("vectorized:     %.3f ms (%.1fx)" % (vectorized_time * 1000, legacy_time / vectorized_time))
@@ -1,38 +1,21 @@
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, IterableDataset
+from torch.utils.data import DataLoader
 from model import ContentExtractionTextEncoder
 from arguments import create_parser
-from processing import wrapped_commoncrawl_process_fn, content_extraction_collate_fn
-import pandas as pd
+from processing import content_extraction_collate_fn, wrapped_packing_collate_fn
+from inference import make_dataset, NodeScoreStream
+import numpy as np
+import csv
+import multiprocessing as mp
+from queue import Queue
+import json
 import re
-from tqdm import tqdm
+import time
 import os
 
 
 
-class SamplesDataset(IterableDataset):
-    def __init__(self, data_path, fn):
-        self.data = []
-        with open(data_path, "r") as f:
-            for line in f:
-                self.data.append(line)
-        self.fn = fn
-
-    def __len__(self):
-        return len(self.data)
-
-    def __iter__(self):
-        for row in self.data:
-            x = self.fn(row, 0)
-            for rec in x:
-                yield rec
-
-def pad_list(x, max_len):
-    list_len = len(x)
-    x.extend([0] * (max_len - list_len))
-    return x
-
 class ContentExtractionDeepModel(nn.Module):
     def __init__(self, args):
         # TODO: Add config file
@@ -75,74 +58,88 @@ class ContentExtractionDeepModel(nn.Module):
         model.load_state_dict(model_dict) 
 
     
-def eval_on_leaderboard_set_vectorized(args, model,corpus_data_path):
-    thresholds = [0.1, 0.25, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+def eval_on_leaderboard_set_vectorized(args, model, corpus_data_path, model_id, stats=None):
     #corpus_data_path = args.corpus_data_path
-    data_process_fn = wrapped_commoncrawl_process_fn(args)
-    dataset = SamplesDataset(corpus_data_path, data_process_fn)
+    # Short pages share 384-node rows with --pack, so each batch needs fewer rows
+    dataset = make_dataset(args, corpus_data_path)
+    collate_fn = wrapped_packing_collate_fn(args) if args.pack else content_extraction_collate_fn
     dataloader = DataLoader(
-            dataset, batch_size=256, num_workers=0, collate_fn=content_extraction_collate_fn, drop_last=False
+            dataset, batch_size=256, num_workers=args.val_dataloader_worker_count, collate_fn=collate_fn, drop_last=False
         )
 
-    predicted_nodes = {}
-    added_urls = set()
-    tasks = ['Primary', 'Heading', 'Title', 'Paragraph', 'Table', 'List']
-    
-    for task in tasks:
-        predicted_nodes[task] = {}
-        for thr in thresholds:
-            predicted_nodes[task][thr]={}
-    
+    # Pages are thresholded and written as soon as their last row is scored, so memory does not grow with the file
+    stream = NodeScoreStream(args.chunk_stride < args.max_sequence_len, args.val_dataloader_worker_count)
     model.eval()
 
-    for val_step, batch in enumerate(dataloader):
-        model.eval()
-
-        padded_list = [pad_list(x, args.max_sequence_len) for x in batch[3]]
-        node_ids_batch = torch.tensor(padded_list).to(args.device)
-        urls = batch[2]
-        batch = batch[:2]
-        batch = tuple(t.to(args.device) for t in batch)
-
-        with torch.no_grad():
-            output = model(batch)
-        
-        for thr in thresholds:
-            predictions = (output > thr)
-            for idx, task in enumerate(tasks):
-                task_predictions = predictions[:, :, idx].squeeze()
-                pred_nodes = torch.where(task_predictions, node_ids_batch, 0).cpu().numpy()
-                for batch_idx, doc in enumerate(pred_nodes): # each element of the batch
-                    elements = set(doc)
-
-                    if 0 in elements:
-                        elements.remove(0)
-                    curr_url = urls[batch_idx]
-
-                    if len(curr_url)==0:
-                        continue
-                    else:
-                        curr_url = curr_url[0]
-
-                    if curr_url not in predicted_nodes[task][thr]:
-                        predicted_nodes[task][thr][curr_url] = set()
-                    predicted_nodes[task][thr][curr_url].update(elements)
-
-    return predicted_nodes
-
-def save_predictions(pred_nodes, model_id):
-    thresholds = [0.9]
-    tasks = ['Primary', 'Heading', 'Title', 'Paragraph', 'Table', 'List']
-    
-    for idx, task in enumerate(tasks):
-        if task == "Primary":
-            rows = []
-            task_thr = thresholds[idx]
-            task_pred_nodes = pred_nodes[task][task_thr]
-            for url, nodes in task_pred_nodes.items():
-                rows.extend([(url, int(node), task) for node in nodes])
-            res_df = pd.DataFrame(rows, columns=['Url', 'TextNodeId', 'Task'])
-    res_df.to_csv('commoncrawl/temp/' + model_id + ".tsv", sep='\t', encoding='utf-8', index=False)
+    # Written under a temporary name so an interrupted run never leaves a partial file
+    output_path = 'commoncrawl/temp/' + model_id + ".tsv"
+    nodes = 0
+    with open(output_path + ".part", 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['Url', 'TextNodeId', 'Task'])
+
+        for val_step, batch in enumerate(dataloader):
+            urls = batch[2]
+            node_ids = batch[3]
+            batch = batch[:2] + batch[4:]
+            batch = tuple(t.to(args.device) for t in batch)
+
+            with torch.no_grad():
+                output = model(batch)
+
+            nodes += save_predictions(writer, stream.add_batch(output, urls, node_ids))
+            if stats is not None:
+                stats['rows'] = stats.get('rows', 0) + len(node_ids)
+
+        nodes += save_predictions(writer, stream.finish())
+    os.replace(output_path + ".part", output_path)
+
+    if stats is not None:
+        stats['nodes'] = nodes
+        stats['pages'] = stream.pages
+
+def save_predictions(writer, pages):
+    """
+    Write the Primary nodes of completed pages; returns the number of nodes scored
+    """
+    threshold = 0.9
+    nodes = 0
+    for url, page_nodes, scores in pages:
+        nodes += len(page_nodes)
+        for node in np.asarray(page_nodes)[scores[:, 0] > threshold]:
+            writer.writerow([url, int(node), 'Primary'])
+    return nodes
+
+
+def marker_path(corpus_data):
+    model_id = re.sub(r'\.[^.]*$', "", corpus_data)
+    return os.path.join('commoncrawl/done', model_id + ".json")
+
+
+def shard_worker(worker_id, device, args, queue):
+    """
+    Process shards from queue until a None sentinel, with one model copy per worker
+    """
+    args.device = device
+    if args.threads_per_worker > 0:
+        torch.set_num_threads(args.threads_per_worker)
+    model = ContentExtractionDeepModel(args)
+
+    for corpus_data in iter(queue.get, None):
+        model_id = re.sub(r'\.[^.]*$', "", corpus_data)
+        data_path = os.path.join(args.corpus_root_path, corpus_data)
+
+        stats = {'worker': worker_id, 'device': device}
+        start = time.time()
+        eval_on_leaderboard_set_vectorized(args, model, data_path, model_id, stats)
+        stats['seconds'] = time.time() - start
+
+        # The marker is written last: a shard without one is redone on restart
+        with open(marker_path(corpus_data), 'w') as f:
+            json.dump(stats, f)
+        print("[worker %d %s] %s: %d pages, %d nodes, %d rows in %.1f s (%.1f pages/s)" % (
+            worker_id, device, model_id, stats.get('pages', 0), stats.get('nodes', 0),
+            stats.get('rows', 0), stats['seconds'], stats.get('pages', 0) / max(stats['seconds'], 1e-9)), flush=True)
 
 
 
@@ -150,23 +147,47 @@ if __name__ == "__main__":
     parser = create_parser()
 
     parser.add_argument("--model_path", type=str, help="model directory")
-    parser.add_argument("--data_path", type=str, help="model directory")
-
-    if not os.path.exists('commoncrawl/temp'):
-        os.makedirs('commoncrawl/temp')
+    parser.add_argument("--corpus_root_path", type=str, help="directory of encoded CommonCrawl files or shards")
+    parser.add_argument("--pack", action="store_true", help="pack several pages into each model row")
+    parser.add_argument("--chunk_stride", type=int, default=384, help="--chunk_stride the files were built with; below --max_sequence_len overlapping scores are averaged")
+    parser.add_argument("--num_workers", type=int, default=1, help="worker processes, each with its own model copy")
+    parser.add_argument("--devices", type=str, default="", help="comma separated devices assigned to workers round-robin, e.g. cuda:0,cuda:1")
+    parser.add_argument("--threads_per_worker", type=int, default=0, help="torch threads per worker; 0 splits the CPU cores evenly on cpu")
+
+    for directory in ['commoncrawl/temp', 'commoncrawl/done']:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
     
     args = parser.parse_args()
-    args.device = 'cuda' if torch.cuda.is_available() else 'cpu'
     args.n_gpu = 0
 
-
-    model = ContentExtractionDeepModel(args)
-
-    for corpus_data in tqdm(os.listdir(args.corpus_root_path)):
-        pattern = re.compile(r'\.[^.]*$')
-        model_id = re.sub(pattern, "", corpus_data)
-        print(model_id)
-        data_path = args.data_path + corpus_data
-        
-        pred_nodes = eval_on_leaderboard_set_vectorized(args, model, data_path)
-        save_predictions(pred_nodes, model_id)
\ No newline at end of file
+    devices = args.devices.split(',') if args.devices else ['cuda' if torch.cuda.is_available() else 'cpu']
+    if args.threads_per_worker == 0 and all(device == 'cpu' for device in devices):
+        args.threads_per_worker = max(1, os.cpu_count() // args.num_workers)
+
+    corpus = sorted(os.listdir(args.corpus_root_path))
+    shards = [corpus_data for corpus_data in corpus if not os.path.exists(marker_path(corpus_data))]
+    print("%d shards to process, %d already done" % (len(shards), len(corpus) - len(shards)))
+
+    start = time.time()
+    if args.num_workers <= 1:
+        queue = Queue()
+        for corpus_data in shards + [None]:
+            queue.put(corpus_data)
+        shard_worker(0, devices[0], args, queue)
+    else:
+        # spawn: CUDA cannot be used in forked children
+        ctx = mp.get_context('spawn')
+        queue = ctx.Queue()
+        for corpus_data in shards + [None] * args.num_workers:
+            queue.put(corpus_data)
+        workers = [
+            ctx.Process(target=shard_worker, args=(i, devices[i % len(devices)], args, queue))
+            for i in range(args.num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    print("Processed %d shards in %.1f s" % (len(shards), time.time() - start))
@@ -18,10 +18,22 @@ class DistributedAccessDataset(IterableDataset):
 
         self.records = records
         self.fn = fn
+        self.worker_offsets = None
+        self.first_worker = 0
 
     def change_seed(self, seed):
         self.records.change_seed(seed)
 
+    def fast_forward(self, worker_offsets, first_worker=0):
+        """
+        Start the next pass with worker i skipping its first worker_offsets[i] records
+
+        The DataLoader always asks its worker 0 first, so worker ids are rotated to make
+        first_worker's stream come first, as it would have without the interruption.
+        """
+        self.worker_offsets = worker_offsets
+        self.first_worker = first_worker if worker_offsets else 0
+
     def __len__(self):
         return len(self.records)
 
@@ -34,10 +46,12 @@ class DistributedAccessDataset(IterableDataset):
             worker_id = worker_info.id
             num_workers = worker_info.num_workers
 
+        worker_id = (worker_id + self.first_worker) % num_workers
         total_worker = num_workers * self.num_replicas
         worker_no = self.rank * num_workers + worker_id
 
-        for i, record in enumerate(self.records.get_dist_iter(worker_no, total_worker)):
+        skip = self.worker_offsets[worker_id] if self.worker_offsets else 0
+        for i, record in enumerate(self.records.get_dist_iter(worker_no, total_worker, skip)):
             rows = self.fn(record, i)
             for rec in rows:
                 yield rec
@@ -1,8 +1,9 @@
+import json
 import logging
 import mmap
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import pickle
 
 import numpy as np
 import torch
@@ -22,6 +23,8 @@ def is_first_worker():
 
 
 OFFSET_CACHE_DIR = str(Path.home()) + "/cache/"
+OFFSET_SCAN_BYTES = 1 << 26
+MANIFEST_NAME = "manifest.json"
 
 
 class LineShuffler:
@@ -37,13 +40,15 @@ class LineShuffler:
         if self.offsetmap_cache is None:
             file_dir = os.path.dirname(filepath)
             file_name = os.path.basename(filepath)
-            self.offsetmap_cache = filepath + "_offsets"
+            self.offsetmap_cache = filepath + "_offsets.npy"
             if not os.path.exists(self.offsetmap_cache) and not os.access(
                     file_dir, os.W_OK | os.X_OK):
                 os.makedirs(OFFSET_CACHE_DIR, exist_ok=True)
-                self.offsetmap_cache = OFFSET_CACHE_DIR + file_name + "_offsets"
+                self.offsetmap_cache = OFFSET_CACHE_DIR + file_name + "_offsets.npy"
         with open(self.path, "rb") as f:
-            self.offset_map = self.gen_offset_map(f)
+            # Line starts followed by the end of the file
+            self.offsets = self.gen_offset_map(f)
+        self.offset_map = self.offsets[:-1]
         self.total_number = len(self.offset_map)
         self.change_seed(seed, magic_num)
 
@@ -59,18 +64,20 @@ class LineShuffler:
 
     def open(self):
         self.f = open(self.path, "rb", buffering=0)
-        self.mm = mmap.mmap(self.f.fileno(), 0, prot=mmap.PROT_READ)
+        # An empty file cannot be mapped, and has no lines to read anyway
+        self.mm = mmap.mmap(self.f.fileno(), 0, prot=mmap.PROT_READ) if self.total_number else None
 
     def close(self):
-        self.mm.close()
+        if self.mm is not None:
+            self.mm.close()
         self.f.close()
 
-    def get_dist_iter(self, worker_no, total_worker):
+    def get_dist_iter(self, worker_no, total_worker, skip=0):
         start = len(self.ix_array) // total_worker * worker_no + min(
             len(self.ix_array) % total_worker, worker_no)
         end = len(self.ix_array) // total_worker * (worker_no + 1) + min(
             len(self.ix_array) % total_worker, worker_no + 1)
-        worker_array = self.ix_array[start:end]
+        worker_array = self.ix_array[start + skip:end]
 
         for ix in worker_array:
             line = self.__getitem__(ix)
@@ -89,29 +96,172 @@ class LineShuffler:
             yield line
 
     def __getitem__(self, key):
-        offset = self.offset_map[key]
+        offset = int(self.offset_map[key])
         self.mm.seek(offset)
         line = self.mm.readline().decode(self.encoding)
         return line
 
+    def read_block(self, start, end):
+        """
+        Lines start to end - 1, read with one sequential slice
+        """
+        lines = self.mm[int(self.offsets[start]):int(self.offsets[end])].split(b"\n")
+        last = lines.pop()
+        lines = [line.decode(self.encoding) + "\n" for line in lines]
+        if last:
+            # The final line of a file without a trailing newline
+            lines.append(last.decode(self.encoding))
+        return lines
+
     def __len__(self):
         return self.total_number
 
     def gen_new_offset_map(self, f):
-        offset_map = []
-        offset = f.tell()
-        for _ in tqdm(f):
-            offset_map.append(offset)
-            offset = f.tell()
+        """
+        Start offset of every line, followed by the file size
+        """
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return np.zeros(1, dtype=np.uint64)
 
+        line_starts = [np.zeros(1, dtype=np.uint64)]
+        with mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ) as mm:
+            for start in tqdm(range(0, size, OFFSET_SCAN_BYTES), desc=os.path.basename(self.path)):
+                chunk = np.frombuffer(mm, dtype=np.uint8, count=min(OFFSET_SCAN_BYTES, size - start), offset=start)
+                line_starts.append(np.flatnonzero(chunk == ord("\n")).astype(np.uint64) + np.uint64(start + 1))
+                del chunk
+        offset_map = np.concatenate(line_starts)
+        # A trailing newline does not start another line
+        if offset_map[-1] != size:
+            offset_map = np.append(offset_map, np.uint64(size))
         return offset_map
 
+    def is_stale(self, offset_map):
+        # The last entry is the file size at indexing time
+        return int(offset_map[-1]) != os.path.getsize(self.path) or os.path.getmtime(
+            self.offsetmap_cache) < os.path.getmtime(self.path)
+
     def gen_offset_map(self, f):
         if os.path.exists(self.offsetmap_cache):
-            with open(self.offsetmap_cache, "rb") as om:
-                offset_map = pickle.load(om)
-        else:
-            offset_map = self.gen_new_offset_map(f)
-            with open(self.offsetmap_cache, "wb") as om:
-                pickle.dump(offset_map, om)
-        return offset_map
+            offset_map = np.load(self.offsetmap_cache, mmap_mode="r")
+            if not self.is_stale(offset_map):
+                return np.asarray(offset_map)
+            logger.info("Offset map %s is stale, rebuilding", self.offsetmap_cache)
+
+        offset_map = self.gen_new_offset_map(f)
+        # Written under a temporary name, as several workers may index the same file
+        tmp_path = "%s.%d.part" % (self.offsetmap_cache, os.getpid())
+        with open(tmp_path, "wb") as om:
+            np.save(om, offset_map)
+        os.replace(tmp_path, self.offsetmap_cache)
+        return np.asarray(np.load(self.offsetmap_cache, mmap_mode="r"))
+
+
+def index_line_file(path):
+    """
+    Build (or validate) the offset map of a JSON lines file; returns its line count and offset map path
+    """
+    shuffler = LineShuffler(path)
+    return len(shuffler), shuffler.offsetmap_cache
+
+
+class DatasetManifest:
+    """
+    Record count and offset map path of every file in a data directory, kept in manifest.json
+
+    The first worker updates the manifest, indexing new or changed files in parallel;
+    every other rank and DataLoader worker only reads it.
+    """
+    def __init__(self, dir_path, files, index_fn=index_line_file, num_threads=None):
+        self.files = files
+        self.index_fn = index_fn
+        self.num_threads = num_threads or min(32, os.cpu_count() or 1)
+        self.path = os.path.join(dir_path, MANIFEST_NAME)
+        if not os.access(dir_path, os.W_OK | os.X_OK):
+            os.makedirs(OFFSET_CACHE_DIR, exist_ok=True)
+            self.path = OFFSET_CACHE_DIR + os.path.basename(os.path.normpath(dir_path)) + "_" + MANIFEST_NAME
+        self.entries = {}
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _is_current(self, file, entry):
+        stat = os.stat(file)
+        return entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def _index(self, file):
+        stat = os.stat(file)
+        lines, offsets = self.index_fn(file)
+        return file, {"size": stat.st_size, "mtime": stat.st_mtime, "lines": lines, "offsets": offsets}
+
+    def update(self):
+        entries = self._read()
+        stale = [file for file in self.files if not self._is_current(file, entries.get(file))]
+        if stale:
+            logger.info("Indexing %d of %d data files", len(stale), len(self.files))
+            with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+                entries.update(executor.map(self._index, stale))
+            tmp_path = "%s.%d.part" % (self.path, os.getpid())
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        self.entries = entries
+
+    def load(self):
+        self.entries = self._read()
+        missing = [file for file in self.files if file not in self.entries]
+        if missing:
+            raise ValueError("%s has no entry for %s" % (self.path, missing[0]))
+
+    def lines(self, file):
+        return self.entries[file]["lines"]
+
+    def offsets(self, file):
+        return self.entries[file]["offsets"]
+
+    def __len__(self):
+        return sum(self.lines(file) for file in self.files)
+
+
+class BlockShuffleSampler:
+    """
+    Global shuffle across files that keeps reads mostly sequential
+
+    Each file is cut into blocks of block_size contiguous records. The blocks of all files
+    are permuted together and dealt to workers round-robin. A worker takes buffer_blocks
+    blocks at a time, reads them sorted by (file, start), and yields the buffer in shuffled
+    order. Everything follows from (seed, worker), so a stream can be resumed after any
+    number of records.
+    """
+    def __init__(self, lengths, block_size=32, buffer_blocks=8, seed=0):
+        self.block_size = block_size
+        self.buffer_blocks = buffer_blocks
+        self.seed = seed
+        self.blocks = [(file_no, start, min(start + block_size, length))
+                       for file_no, length in enumerate(lengths)
+                       for start in range(0, length, block_size)]
+
+    def worker_blocks(self, worker_no, total_worker):
+        order = np.random.RandomState(self.seed).permutation(len(self.blocks))
+        return [self.blocks[i] for i in order[worker_no::total_worker]]
+
+    def iter_buffers(self, worker_no, total_worker, skip=0):
+        """
+        Yield (blocks, order): the blocks to read and the order to emit their records in,
+        after dropping the first `skip` records of this worker's stream
+        """
+        blocks = self.worker_blocks(worker_no, total_worker)
+        for buffer_no, first in enumerate(range(0, len(blocks), self.buffer_blocks)):
+            # Sorted, so the reads within a buffer only move forward through each file
+            buffer = sorted(blocks[first:first + self.buffer_blocks])
+            size = sum(end - start for _, start, end in buffer)
+            if skip >= size:
+                # Whole buffers are skipped without reading them
+                skip -= size
+                continue
+            order = np.random.RandomState([self.seed, worker_no, buffer_no]).permutation(size)
+            yield buffer, order[skip:]
+            skip = 0
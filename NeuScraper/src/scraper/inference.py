@@ -3,7 +3,10 @@ import torch.nn as nn
 from torch.utils.data import DataLoader, IterableDataset
 from model import ContentExtractionTextEncoder
 from arguments import create_parser
-from processing import wrapped_eval_process_fn, content_extraction_collate_fn
+from processing import wrapped_eval_process_fn, wrapped_commoncrawl_process_fn, content_extraction_collate_fn
+from processing import wrapped_packing_process_fn, wrapped_packing_collate_fn
+from shards import ShardDataset, is_shard, wrapped_shard_process_fn, wrapped_shard_packing_process_fn
+import numpy as np
 import pandas as pd
 import os
 
@@ -11,26 +14,39 @@ import os
 
 
 class SamplesDataset(IterableDataset):
+    """
+    Streams a JSON lines file; each DataLoader worker parses the lines starting in its own byte range
+    """
     def __init__(self, data_path, fn):
-        self.data = []
-        with open(data_path, "r") as f:
-            for line in f:
-                self.data.append(line)
+        self.data_path = data_path
         self.fn = fn
 
-    def __len__(self):
-        return len(self.data)
-
     def __iter__(self):
-        for row in self.data:
-            x = self.fn(row, 0)
-            for rec in x:
-                yield rec
-
-def pad_list(x, max_len):
-    list_len = len(x)
-    x.extend([0] * (max_len - list_len))
-    return x
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is None:  # single-process data loading
+            worker_id = 0
+            num_workers = 1
+        else:
+            worker_id = worker_info.id
+            num_workers = worker_info.num_workers
+
+        size = os.path.getsize(self.data_path)
+        start = size * worker_id // num_workers
+        end = size * (worker_id + 1) // num_workers
+
+        with open(self.data_path, "rb") as f:
+            if start > 0:
+                # Skip the line that started in the previous worker's range
+                f.seek(start - 1)
+                f.readline()
+            i = 0
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                for rec in self.fn(line.decode("utf-8"), i):
+                    yield rec
+                i += 1
 
 class ContentExtractionDeepModel(nn.Module):
     def __init__(self, args):
@@ -74,60 +90,131 @@ class ContentExtractionDeepModel(nn.Module):
         model.load_state_dict(model_dict) 
 
     
+class NodeScoreStream:
+    """
+    Collects node scores batch by batch and hands back each page once it is complete
+
+    The rows of a page are consecutive lines of the input, read by one DataLoader worker, and
+    workers take turns producing batches, so a page missing from the last `num_workers` batches
+    has no rows left. Pages in each worker's first batch may have started in the previous
+    worker's range and are kept until `finish`. Only overlapping windows (chunk_stride below
+    max_sequence_len) score a node more than once; without overlap rows are handed back as they
+    arrive and no scores are kept. Urls and node ids are per slot, so packed rows holding several
+    documents unpack correctly.
+    """
+    def __init__(self, overlapping=True, num_workers=0):
+        self.overlapping = overlapping
+        self.window = max(1, num_workers)
+        self.scores = {}
+        self.last_batch = {}
+        self.held = set()
+        self.batches = 0
+        self.pages = 0
+
+    def add_batch(self, output, urls, node_ids):
+        """
+        Add one batch of model output; returns (url, node ids, task scores) for the pages it completes
+        """
+        output = output.float().cpu().numpy()
+        batch = self.batches
+        self.batches += 1
+
+        pieces = {}
+        for row, (row_urls, row_nodes) in enumerate(zip(urls, node_ids)):
+            for slot, (url, node) in enumerate(zip(row_urls[: output.shape[1]], row_nodes)):
+                self.last_batch[url] = batch
+                if not self.overlapping:
+                    piece = pieces.setdefault(url, ([], []))
+                    piece[0].append(node)
+                    piece[1].append(output[row, slot])
+                    continue
+                page = self.scores.setdefault(url, {})
+                entry = page.get(node)
+                if entry is None:
+                    page[node] = [output[row, slot].copy(), 1]
+                else:
+                    entry[0] += output[row, slot]
+                    entry[1] += 1
+        if batch < self.window:
+            self.held.update(self.last_batch)
+
+        completed = [(url, nodes, np.stack(scores)) for url, (nodes, scores) in pieces.items()]
+        done = [url for url, last in self.last_batch.items() if batch - last >= self.window and url not in self.held]
+        for url in done:
+            completed.extend(self._complete(url))
+        return completed
+
+    def finish(self):
+        """
+        Hand back every page still open after the last batch
+        """
+        completed = []
+        for url in list(self.last_batch):
+            completed.extend(self._complete(url))
+        return completed
+
+    def _complete(self, url):
+        del self.last_batch[url]
+        self.pages += 1
+        if not self.overlapping:
+            return []
+        page = self.scores.pop(url)
+        return [(url, list(page), np.stack([total / count for total, count in page.values()]))]
+
+
+def threshold_page_scores(predicted_nodes, pages, tasks, thresholds):
+    for url, nodes, scores in pages:
+        nodes = np.asarray(nodes)
+        for idx, task in enumerate(tasks):
+            for thr in thresholds:
+                selected = nodes[scores[:, idx] > thr]
+                if len(selected):
+                    predicted_nodes[task][thr].setdefault(url, set()).update(selected.tolist())
+    return predicted_nodes
+
+
+def make_dataset(args, data_path, labels=False):
+    """
+    Dataset over a JSON lines file or a binary shard built by shards.py
+    """
+    if is_shard(data_path):
+        if args.pack:
+            return ShardDataset(data_path, wrapped_shard_packing_process_fn(args))
+        return ShardDataset(data_path, wrapped_shard_process_fn(args, eval_mode=True))
+    if args.pack:
+        # Short chunks share 384-node rows, so each batch needs fewer rows
+        return SamplesDataset(data_path, wrapped_packing_process_fn(args))
+    if labels:
+        return SamplesDataset(data_path, wrapped_eval_process_fn(args))
+    return SamplesDataset(data_path, wrapped_commoncrawl_process_fn(args))
+
+
 def eval_on_leaderboard_set_vectorized(args, model):
     thresholds = [0.1, 0.25, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+    tasks = ['Primary', 'Heading', 'Title', 'Paragraph', 'Table', 'List']
     data_path = args.data_path
-    data_process_fn = wrapped_eval_process_fn(args)
-    dataset = SamplesDataset(data_path, data_process_fn)
+    dataset = make_dataset(args, data_path, labels=True)
+    collate_fn = wrapped_packing_collate_fn(args, labels=True) if args.pack else content_extraction_collate_fn
     dataloader = DataLoader(
-            dataset, batch_size=args.val_batch_size, num_workers=0, collate_fn=content_extraction_collate_fn, drop_last=False
+            dataset, batch_size=args.val_batch_size, num_workers=args.val_dataloader_worker_count, collate_fn=collate_fn, drop_last=False
         )
 
-    predicted_nodes = {}
-    added_urls = set()
-    tasks = ['Primary', 'Heading', 'Title', 'Paragraph', 'Table', 'List']
-    
-    for task in tasks:
-        predicted_nodes[task] = {}
-        for thr in thresholds:
-            predicted_nodes[task][thr]={}
-    
+    predicted_nodes = {task: {thr: {} for thr in thresholds} for task in tasks}
+    stream = NodeScoreStream(args.chunk_stride < args.max_sequence_len, args.val_dataloader_worker_count)
     model.eval()
 
     for val_step, batch in enumerate(dataloader):
-        model.eval()
-
-        padded_list = [pad_list(x, args.max_sequence_len) for x in batch[4]]
-        node_ids_batch = torch.tensor(padded_list).to(args.device)
         urls = batch[3]
-        batch = batch[:2]
+        node_ids = batch[4]
+        batch = batch[:2] + batch[5:]
         batch = tuple(t.to(args.device) for t in batch)
 
         with torch.no_grad():
             output = model(batch)
-        
-        for thr in thresholds:
-            predictions = (output > thr)
-            for idx, task in enumerate(tasks):
-                task_predictions = predictions[:, :, idx].squeeze()
-                pred_nodes = torch.where(task_predictions, node_ids_batch, 0).cpu().numpy()
-                for batch_idx, doc in enumerate(pred_nodes): # each element of the batch
-                    elements = set(doc)
-
-                    if 0 in elements:
-                        elements.remove(0)
-                    curr_url = urls[batch_idx]
-
-                    if len(curr_url)==0:
-                        continue
-                    else:
-                        curr_url = curr_url[0]
-
-                    if curr_url not in predicted_nodes[task][thr]:
-                        predicted_nodes[task][thr][curr_url] = set()
-                    predicted_nodes[task][thr][curr_url].update(elements)
 
-    return predicted_nodes
+        threshold_page_scores(predicted_nodes, stream.add_batch(output, urls, node_ids), tasks, thresholds)
+
+    return threshold_page_scores(predicted_nodes, stream.finish(), tasks, thresholds)
 
 def save_predictions(pred_nodes, args):
     thresholds = [0.9,0.25,0.25,0.1,0.1,0.1]
@@ -149,7 +236,9 @@ if __name__ == "__main__":
     parser = create_parser()
 
     parser.add_argument("--model_path", type=str, help="model directory")
-    parser.add_argument("--data_path",type=str, help="data path")
+    parser.add_argument("--data_path",type=str, help="JSON lines file or binary shard directory")
+    parser.add_argument("--pack", action="store_true", help="pack several chunks into each model row")
+    parser.add_argument("--chunk_stride", type=int, default=384, help="--chunk_stride the input was built with; below --max_sequence_len overlapping scores are averaged")
 
     if not os.path.exists('temp/'):
         os.makedirs('temp/')
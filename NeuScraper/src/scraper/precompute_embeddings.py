@@ -0,0 +1,47 @@
+import os
+import logging
+import torch
+import torch.distributed as dist
+
+from arguments import create_parser
+from model import ContentExtractionTextEncoder
+from shards import TokenShard, encoder_fingerprint, write_shard_embeddings
+from trainer import setup_distributed, setup_mixed_precision, autocast, load_model, list_shard_dirs
+
+logger = logging.getLogger(__name__)
+
+
+def embed_shards(args, model, shard_dirs):
+    """
+    Run the frozen text encoder once over every node of the shards; trainer.py --cached_embeddings reads the results
+    """
+    fingerprint = encoder_fingerprint(model.text_roberta)
+    model.eval()
+
+    def embed_fn(token_ids, token_masks):
+        with torch.no_grad(), autocast(args):
+            return model.encode_nodes(token_ids.to(args.device), token_masks.to(args.device)).float().cpu()
+
+    for shard_path in shard_dirs:
+        shard = TokenShard(shard_path)
+        if shard.embedding_meta is not None and shard.embedding_meta["encoder"] == fingerprint:
+            logger.info("%s: embeddings are up to date", shard_path)
+            continue
+        write_shard_embeddings(shard, embed_fn, args.embed_batch_size, fingerprint)
+
+
+if __name__ == "__main__":
+    parser = create_parser()
+    parser.add_argument("--embed_batch_size", default=4096, type=int, help="nodes encoded per forward pass")
+    args = parser.parse_args()
+
+    setup_distributed(args, logger)
+    setup_mixed_precision(args, logger)
+
+    # Same weights the trainer starts from: --checkpoint_path, or the pretrained encoder
+    model, _, _, _, _ = load_model(args, ContentExtractionTextEncoder(args))
+    model.to(args.device)
+
+    shard_dirs = list_shard_dirs(os.path.join(args.data_dir, "train")) + list_shard_dirs(os.path.join(args.data_dir, "val"))
+    rank, world_size = (dist.get_rank(), dist.get_world_size()) if dist.is_initialized() else (0, 1)
+    embed_shards(args, model, shard_dirs[rank::world_size])
@@ -0,0 +1,350 @@
+import os
+import glob
+import hashlib
+import ujson
+import numpy as np
+import torch
+import torch.nn.functional as F
+from argparse import ArgumentParser
+from torch.utils.data import IterableDataset
+from tqdm import tqdm
+
+
+# A shard is a directory holding one encoded JSON lines file in binary form:
+#   offsets.npy   int64 [rows + 1]            first node of each row
+#   tokens.bin    int32 [nodes, max_token_len] token ids, truncated and ending with </s>
+#   node_ids.bin  int32 [nodes]
+#   url_ids.bin   int32 [nodes]               index into urls.txt
+#   labels.bin    uint8 [nodes, num_classes]  training and test data only
+#   urls.txt      one url per line
+# and, once precompute_embeddings.py has run over it:
+#   embeddings.bin  float16 [nodes, text_in_emb_dim] pooled output of the frozen text encoder
+#   embeddings.json encoder fingerprint and the embedding of a padding node
+SHARD_SUFFIX = ".shard"
+EMBEDDINGS_META = "embeddings.json"
+
+
+def is_shard(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "offsets.npy"))
+
+
+def convert_to_shard(data_path, shard_path, max_token_len):
+    """
+    Convert a JSON lines file of chunk rows into a shard directory
+    """
+    os.makedirs(shard_path, exist_ok=True)
+    offsets = [0]
+    urls = {}
+    files = {name: open(os.path.join(shard_path, name + ".bin.part"), "wb") for name in ("tokens", "node_ids", "url_ids", "labels")}
+
+    with open(data_path, "r", encoding="utf-8") as f:
+        for line in tqdm(f, desc=os.path.basename(data_path)):
+            data = ujson.loads(line)
+            token_ids = np.asarray(data["TokenId"], dtype=np.int32)[:, :max_token_len]
+            # Same truncation as processing.py: keep max_token_len - 1 tokens, then </s>
+            token_ids[:, -1] = 2
+            files["tokens"].write(token_ids.tobytes())
+            files["node_ids"].write(np.asarray(data["NodeIds"], dtype=np.int32).tobytes())
+            files["url_ids"].write(np.asarray([urls.setdefault(url, len(urls)) for url in data["Url"]], dtype=np.int32).tobytes())
+            if "Labels" in data:
+                files["labels"].write(np.asarray(data["Labels"], dtype=np.uint8).tobytes())
+            offsets.append(offsets[-1] + len(token_ids))
+
+    for name, handle in files.items():
+        handle.close()
+        part = os.path.join(shard_path, name + ".bin.part")
+        if os.path.getsize(part) == 0 and name == "labels":
+            os.remove(part)
+        else:
+            os.replace(part, os.path.join(shard_path, name + ".bin"))
+    with open(os.path.join(shard_path, "urls.txt"), "w", encoding="utf-8") as f:
+        f.writelines(url + "\n" for url in urls)
+    # Written last: a directory without offsets.npy is an unfinished conversion
+    np.save(os.path.join(shard_path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    return len(offsets) - 1
+
+
+class TokenShard:
+    """
+    Memory-mapped view of a shard; rows are sliced without copying
+    """
+    def __init__(self, shard_path):
+        self.path = shard_path
+        self.offsets = np.load(os.path.join(shard_path, "offsets.npy"), mmap_mode="r")
+        num_nodes = int(self.offsets[-1])
+        self.tokens = self._map("tokens", np.int32, num_nodes, matrix=True)
+        self.node_ids = self._map("node_ids", np.int32, num_nodes)
+        self.url_ids = self._map("url_ids", np.int32, num_nodes)
+        self.labels = None
+        if os.path.exists(os.path.join(shard_path, "labels.bin")):
+            self.labels = self._map("labels", np.uint8, num_nodes, matrix=True)
+        with open(os.path.join(shard_path, "urls.txt"), "r", encoding="utf-8") as f:
+            self.urls = f.read().splitlines()
+        self.embeddings = None
+        self.embedding_meta = None
+        if os.path.exists(os.path.join(shard_path, EMBEDDINGS_META)):
+            with open(os.path.join(shard_path, EMBEDDINGS_META), "r") as f:
+                self.embedding_meta = ujson.load(f)
+            self.embeddings = self._map("embeddings", np.float16, num_nodes, matrix=True)
+
+    def _map(self, name, dtype, num_nodes, matrix=False):
+        path = os.path.join(self.path, name + ".bin")
+        shape = (num_nodes,)
+        if matrix:
+            # Row width is not stored; it follows from the file size
+            shape = (num_nodes, os.path.getsize(path) // (np.dtype(dtype).itemsize * max(num_nodes, 1)))
+        if num_nodes == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    @property
+    def max_token_len(self):
+        return self.tokens.shape[1]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        row = {
+            "TokenId": self.tokens[start:end],
+            "NodeIds": self.node_ids[start:end],
+            "UrlIds": self.url_ids[start:end],
+        }
+        if self.labels is not None:
+            row["Labels"] = self.labels[start:end]
+        if self.embeddings is not None:
+            row["Embeddings"] = self.embeddings[start:end]
+        return row
+
+
+def index_shard(path):
+    """
+    Row count of a shard, in the form dataset_utils.DatasetManifest expects
+    """
+    return len(TokenShard(path)), None
+
+
+def check_shard(shard, args):
+    if shard.max_token_len != args.max_token_len:
+        raise ValueError("%s was built with max_token_len=%d, but --max_token_len is %d" % (shard.path, shard.max_token_len, args.max_token_len))
+
+
+def encoder_fingerprint(text_encoder):
+    """
+    Hash of every parameter and buffer of the text encoder, so cached embeddings from any other weights are rejected
+    """
+    digest = hashlib.sha1()
+    for name, tensor in sorted(text_encoder.state_dict().items()):
+        tensor = tensor.detach().cpu()
+        # The same weights hash the same whether the encoder is held in float32, float16 or bfloat16
+        if tensor.is_floating_point():
+            tensor = tensor.float()
+        digest.update(name.encode("utf-8"))
+        digest.update(str(tuple(tensor.shape)).encode("utf-8"))
+        digest.update(np.ascontiguousarray(tensor.numpy()))
+    return digest.hexdigest()
+
+
+def write_shard_embeddings(shard, embed_fn, batch_size, fingerprint):
+    """
+    Run embed_fn(token_ids, token_masks) over every node of a shard, batch_size nodes at a time,
+    and store the results as embeddings.bin
+    """
+    num_nodes = int(shard.offsets[-1])
+    if os.path.exists(os.path.join(shard.path, EMBEDDINGS_META)):
+        os.remove(os.path.join(shard.path, EMBEDDINGS_META))
+    # A node of padding tokens, as generate_shard_row_as_tensors fills rows shorter than max_sequence_len
+    padding = embed_fn(torch.zeros(1, shard.max_token_len, dtype=torch.long), torch.zeros(1, shard.max_token_len, dtype=torch.long))
+    dim = padding.shape[1]
+
+    part = os.path.join(shard.path, "embeddings.bin.part")
+    if num_nodes == 0:
+        open(part, "wb").close()
+    else:
+        embeddings = np.memmap(part, dtype=np.float16, mode="w+", shape=(num_nodes, dim))
+        for start in tqdm(range(0, num_nodes, batch_size), desc=os.path.basename(shard.path)):
+            token_ids = torch.from_numpy(shard.tokens[start:start + batch_size].astype(np.int64))
+            embeddings[start:start + len(token_ids)] = embed_fn(token_ids, torch.where(token_ids != 1, 1, 0)).numpy()
+        embeddings.flush()
+        del embeddings
+    os.replace(part, os.path.join(shard.path, "embeddings.bin"))
+
+    # Written last: embeddings.bin without its metadata is an unfinished precompute
+    with open(os.path.join(shard.path, EMBEDDINGS_META), "w") as f:
+        ujson.dump({"dim": dim, "encoder": fingerprint, "padding": padding[0].tolist()}, f)
+
+
+def check_embeddings(shard, args):
+    if shard.embeddings is None:
+        raise ValueError("%s has no cached node embeddings; run precompute_embeddings.py first" % shard.path)
+    if shard.embedding_meta["encoder"] != args.encoder_fingerprint:
+        raise ValueError("%s embeddings were computed with a different text encoder than --checkpoint_path; "
+                         "rerun precompute_embeddings.py" % shard.path)
+
+
+def generate_shard_embedding_row_as_tensors(shard, row, args):
+    """
+    Like generate_shard_row_as_tensors, with each node's cached embedding in place of its token ids
+    """
+    num_nodes = min(len(row["NodeIds"]), args.max_sequence_len)
+    padding = torch.tensor(shard.embedding_meta["padding"], dtype=torch.float16)
+    embeddings = padding.repeat(args.max_sequence_len, 1)
+    embeddings[:num_nodes] = torch.from_numpy(np.array(row["Embeddings"][:num_nodes]))
+    node_masks = F.pad(torch.ones(num_nodes, dtype=torch.long), (0, args.max_sequence_len - num_nodes))
+
+    y = torch.from_numpy(row["Labels"][:num_nodes].astype(np.float32)).flatten()
+    y = F.pad(y, (0, args.num_classes * args.max_sequence_len - y.shape[0]))
+    return [[embeddings, node_masks, y]]
+
+
+def generate_shard_row_as_tensors(shard, row, args, eval_mode=False):
+    """
+    Same tensors as processing.generate_data_as_tensors (or the commoncrawl variant without labels)
+    """
+    num_nodes = min(len(row["NodeIds"]), args.max_sequence_len)
+    token_ids = torch.from_numpy(row["TokenId"][:num_nodes].astype(np.int64)).flatten()
+    token_masks = torch.where(token_ids != 1, 1, 0)
+
+    token_ids = F.pad(token_ids, (0, args.max_token_len * args.max_sequence_len - token_ids.shape[0]))
+    token_masks = F.pad(token_masks, (0, args.max_token_len * args.max_sequence_len - token_masks.shape[0]))
+    tensors = [token_ids, token_masks]
+
+    if shard.labels is not None:
+        y = torch.from_numpy(row["Labels"][:num_nodes].astype(np.float32)).flatten()
+        tensors.append(F.pad(y, (0, args.num_classes * args.max_sequence_len - y.shape[0])))
+
+    if eval_mode:
+        tensors.append([shard.urls[j] for j in row["UrlIds"]])
+        tensors.append(row["NodeIds"].tolist())
+    return [tensors]
+
+
+def shard_row_as_dict(shard, row):
+    """
+    Row in the parsed JSON layout, for processing.pack_documents
+    """
+    data = {"TokenId": row["TokenId"].tolist(), "NodeIds": row["NodeIds"].tolist(), "Url": [shard.urls[j] for j in row["UrlIds"]]}
+    if shard.labels is not None:
+        data["Labels"] = row["Labels"].tolist()
+    return data
+
+
+def wrapped_shard_process_fn(args, eval_mode=False):
+    def fn(record, i):
+        shard, row = record
+        check_shard(shard, args)
+        return generate_shard_row_as_tensors(shard, row, args, eval_mode)
+
+    return fn
+
+
+def wrapped_shard_embedding_process_fn(args):
+    def fn(record, i):
+        shard, row = record
+        check_embeddings(shard, args)
+        return generate_shard_embedding_row_as_tensors(shard, row, args)
+
+    return fn
+
+
+def wrapped_shard_packing_process_fn(args):
+    def fn(record, i):
+        shard, row = record
+        check_shard(shard, args)
+        return [shard_row_as_dict(shard, row)]
+
+    return fn
+
+
+class ShardDataset(IterableDataset):
+    """
+    Iterates the rows of a shard; each DataLoader worker takes a contiguous range of rows
+    """
+    def __init__(self, shard_path, fn):
+        self.shard_path = shard_path
+        self.fn = fn
+
+    def __iter__(self):
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is None:  # single-process data loading
+            worker_id = 0
+            num_workers = 1
+        else:
+            worker_id = worker_info.id
+            num_workers = worker_info.num_workers
+
+        # Opened in the worker, so forked or spawned workers map the files themselves
+        shard = TokenShard(self.shard_path)
+        start = len(shard) * worker_id // num_workers
+        end = len(shard) * (worker_id + 1) // num_workers
+        for i in range(start, end):
+            for rec in self.fn((shard, shard[i]), i - start):
+                yield rec
+
+
+class ShardShuffler:
+    """
+    Drop-in replacement for dataset_utils.LineShuffler that yields (shard, row) records
+    """
+    def __init__(self, shard_path, seed=-1, magic_num=1):
+        self.path = shard_path
+        self.shard = TokenShard(shard_path)
+        self.total_number = len(self.shard)
+        self.change_seed(seed, magic_num)
+
+    def change_seed(self, seed, magic_num=1):
+        if seed >= 0:
+            self.ix_array = np.random.RandomState(seed).permutation(self.total_number)
+        else:
+            self.ix_array = np.arange(self.total_number)
+        self.ix_array = self.ix_array[:(len(self.ix_array) // magic_num * magic_num)]
+        self.seed = seed
+
+    def get_dist_iter(self, worker_no, total_worker, skip=0):
+        start = len(self.ix_array) // total_worker * worker_no + min(len(self.ix_array) % total_worker, worker_no)
+        end = len(self.ix_array) // total_worker * (worker_no + 1) + min(len(self.ix_array) % total_worker, worker_no + 1)
+        for ix in self.ix_array[start + skip:end]:
+            yield self[ix]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def __iter__(self):
+        for ix in self.ix_array:
+            yield self[ix]
+
+    def __getitem__(self, key):
+        return self.shard, self.shard[key]
+
+    def read_block(self, start, end):
+        return [self[ix] for ix in range(start, end)]
+
+    def __len__(self):
+        return self.total_number
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--input", type=str, required=True, help="JSON lines file or directory of them")
+    parser.add_argument("--output", type=str, help="output directory (defaults to next to the input files)")
+    parser.add_argument("--max_token_len", type=int, default=5, help="tokens kept per node, including </s>")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        files = sorted(glob.glob(os.path.join(args.input, "**", "*.json"), recursive=True))
+    else:
+        files = [args.input]
+
+    for data_path in files:
+        name = os.path.splitext(os.path.basename(data_path))[0] + SHARD_SUFFIX
+        shard_path = os.path.join(args.output or os.path.dirname(data_path), name)
+        if is_shard(shard_path):
+            continue
+        rows = convert_to_shard(data_path, shard_path, args.max_token_len)
+        json_size = os.path.getsize(data_path)
+        shard_size = sum(os.path.getsize(os.path.join(shard_path, f)) for f in os.listdir(shard_path))
+        print("%s: %d rows, %.1f MB -> %.1f MB" % (shard_path, rows, json_size / 1e6, shard_size / 1e6))
@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pytest
+
+import dataset_utils
+from dataset_utils import BlockShuffleSampler, DatasetManifest, LineShuffler, index_line_file
+
+
+def scanned_offsets(path):
+    offsets = [0]
+    with open(path, "rb") as f:
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"\n",
+    b'{"a": 1}\n{"b": 2}\n',
+    b'{"a": 1}\n{"b": 2}',
+    b"first\n\n\nlast line without newline",
+])
+def test_offset_map_matches_a_line_scan(tmp_path, content):
+    path = tmp_path / "data.json"
+    path.write_bytes(content)
+
+    with LineShuffler(str(path)) as shuffler:
+        assert shuffler.offsets.tolist() == scanned_offsets(path)
+        assert [shuffler[i] for i in range(len(shuffler))] == content.decode().splitlines(keepends=True)
+
+
+def test_offset_map_spans_scan_chunks(tmp_path, monkeypatch):
+    # Chunk boundaries land before, on and after newlines
+    monkeypatch.setattr(dataset_utils, "OFFSET_SCAN_BYTES", 7)
+    lines = ["%d %s\n" % (i, "x" * (i % 11)) for i in range(200)]
+    path = tmp_path / "data.json"
+    path.write_text("".join(lines) + "tail")
+
+    with LineShuffler(str(path)) as shuffler:
+        assert shuffler.offsets.tolist() == scanned_offsets(path)
+        assert shuffler.offsets.dtype == np.uint64
+        assert shuffler.read_block(0, len(shuffler)) == lines + ["tail"]
+
+
+def test_stale_offset_maps_are_rebuilt(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("a\nb\n")
+    assert len(LineShuffler(str(path))) == 2
+
+    # Appended lines change the size
+    with open(path, "a") as f:
+        f.write("c\n")
+    assert len(LineShuffler(str(path))) == 3
+
+    # A rewrite of the same size is caught by its modification time
+    path.write_text("abcde\n")
+    cache = str(path) + "_offsets.npy"
+    mtime = os.path.getmtime(path) - 10
+    os.utime(cache, (mtime, mtime))
+    shuffler = LineShuffler(str(path))
+    assert shuffler.offsets.tolist() == [0, 6]
+    assert not shuffler.is_stale(np.load(shuffler.offsetmap_cache))
+
+
+def test_manifest_only_indexes_new_or_changed_files(tmp_path):
+    files = []
+    for name, lines in [("a.json", 3), ("b.json", 5)]:
+        files.append(str(tmp_path / name))
+        (tmp_path / name).write_text("x\n" * lines)
+    indexed = []
+
+    def index_fn(file):
+        indexed.append(file)
+        return index_line_file(file)
+
+    DatasetManifest(str(tmp_path), files, index_fn).update()
+    assert sorted(indexed) == files
+
+    with open(files[1], "a") as f:
+        f.write("x\n")
+    indexed.clear()
+    DatasetManifest(str(tmp_path), files, index_fn).update()
+    assert indexed == [files[1]]
+
+    manifest = DatasetManifest(str(tmp_path), files)
+    manifest.load()
+    assert [manifest.lines(file) for file in files] == [3, 6]
+    assert len(manifest) == 9
+    with pytest.raises(ValueError):
+        DatasetManifest(str(tmp_path), files + [str(tmp_path / "c.json")]).load()
+
+
+def sampled_records(sampler, worker_no, total_worker, skip=0):
+    stream = []
+    for blocks, order in sampler.iter_buffers(worker_no, total_worker, skip):
+        records = [(file_no, i) for file_no, start, end in blocks for i in range(start, end)]
+        stream.extend(records[i] for i in order)
+    return stream
+
+
+def test_block_shuffle_covers_every_record_once():
+    lengths = [100, 37, 0, 250]
+    sampler = BlockShuffleSampler(lengths, block_size=8, buffer_blocks=3, seed=7)
+    streams = [sampled_records(sampler, worker_no, 3) for worker_no in range(3)]
+
+    records = [record for stream in streams for record in stream]
+    assert sorted(records) == [(file_no, i) for file_no, length in enumerate(lengths) for i in range(length)]
+    assert streams[0] != sorted(streams[0])
+
+
+@pytest.mark.parametrize("skip", [0, 1, 23, 24, 25, 57, 128, 129, 10000])
+def test_skipping_matches_dropping_the_start_of_the_stream(skip):
+    # Buffers hold 24 records, less where a file ends inside a block
+    sampler = BlockShuffleSampler([100, 37, 250], block_size=8, buffer_blocks=3, seed=7)
+    for worker_no in range(2):
+        assert sampled_records(sampler, worker_no, 2, skip) == sampled_records(sampler, worker_no, 2)[skip:]
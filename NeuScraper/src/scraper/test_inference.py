@@ -0,0 +1,80 @@
+import json
+import random
+import types
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from inference import NodeScoreStream, SamplesDataset
+from processing import content_extraction_collate_fn, wrapped_commoncrawl_process_fn
+
+ARGS = types.SimpleNamespace(max_sequence_len=8, max_token_len=4)
+
+
+def write_chunks(path, stride):
+    rng = random.Random(0)
+    with open(path, "w") as f:
+        for page in range(60):
+            num_nodes = rng.randint(1, 30)
+            for start in range(0, num_nodes, stride):
+                nodes = list(range(start, min(start + ARGS.max_sequence_len, num_nodes)))
+                f.write(json.dumps({
+                    "TokenId": [[0, node + 3, 5, 6] for node in nodes],
+                    "NodeIds": nodes,
+                    "Url": ["http://%d.example/" % page] * len(nodes),
+                }) + "\n")
+                if start + ARGS.max_sequence_len >= num_nodes:
+                    break
+
+
+def fake_model(token_ids):
+    # Depends on the slot as well as the node, so overlapping windows score a node differently
+    nodes = token_ids.view(len(token_ids), ARGS.max_sequence_len, ARGS.max_token_len)[..., 1].float()
+    x = nodes * 0.37 + torch.arange(ARGS.max_sequence_len) * 0.5
+    return torch.stack([torch.sigmoid(torch.sin(x)), torch.sigmoid(torch.cos(x))], dim=-1)
+
+
+def batches(path, num_workers):
+    dataset = SamplesDataset(str(path), wrapped_commoncrawl_process_fn(ARGS))
+    for batch in DataLoader(dataset, batch_size=4, num_workers=num_workers, collate_fn=content_extraction_collate_fn):
+        yield fake_model(batch[0]), batch[2], batch[3]
+
+
+def mean_scores(path):
+    totals = {}
+    for output, urls, node_ids in batches(path, 0):
+        for row, (row_urls, row_nodes) in enumerate(zip(urls, node_ids)):
+            for slot, (url, node) in enumerate(zip(row_urls, row_nodes)):
+                total = totals.setdefault(url, {}).setdefault(node, [0, 0])
+                total[0] = total[0] + output[row, slot].numpy()
+                total[1] += 1
+    return {url: {node: total / count for node, (total, count) in page.items()} for url, page in totals.items()}
+
+
+@pytest.mark.parametrize("num_workers", [0, 2, 3])
+@pytest.mark.parametrize("stride", [3, ARGS.max_sequence_len])
+def test_streamed_scores_match_whole_file_scores(tmp_path, num_workers, stride):
+    path = tmp_path / "chunks.json"
+    write_chunks(path, stride)
+    expected = mean_scores(path)
+
+    stream = NodeScoreStream(stride < ARGS.max_sequence_len, num_workers)
+    pages = []
+    for output, urls, node_ids in batches(path, num_workers):
+        pages.extend(stream.add_batch(output, urls, node_ids))
+    streamed = len(pages)
+    pages.extend(stream.finish())
+
+    # Pages are handed back while the file is still being read, each node once
+    assert streamed > 0
+    scores = {}
+    for url, nodes, page_scores in pages:
+        for node, node_scores in zip(nodes, page_scores):
+            assert (url, node) not in scores
+            scores[url, node] = node_scores
+    assert scores.keys() == {(url, node) for url, page in expected.items() for node in page}
+    for (url, node), node_scores in scores.items():
+        np.testing.assert_allclose(node_scores, expected[url][node], rtol=1e-6)
+    assert stream.pages == len(expected)
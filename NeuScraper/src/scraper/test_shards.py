@@ -0,0 +1,75 @@
+import json
+import random
+import types
+
+import pytest
+import torch
+
+from processing import (wrapped_commoncrawl_process_fn, wrapped_eval_process_fn, wrapped_packing_collate_fn,
+                        wrapped_packing_process_fn, wrapped_process_fn)
+from shards import (ShardDataset, TokenShard, convert_to_shard, wrapped_shard_packing_process_fn,
+                    wrapped_shard_process_fn)
+
+ARGS = types.SimpleNamespace(max_sequence_len=6, max_token_len=5, num_classes=2)
+
+
+def encoded_rows(labels):
+    rng = random.Random(0)
+    rows = []
+    # Some rows are longer than max_sequence_len, and some tokens are padding
+    for i, num_nodes in enumerate([1, 4, 6, 9, 3]):
+        row = {
+            "TokenId": [[0] + [rng.choice([1, rng.randrange(3, 250000)]) for _ in range(7)] for _ in range(num_nodes)],
+            "NodeIds": list(range(100 * i, 100 * i + num_nodes)),
+            "Url": ["http://%d.example/" % (i // 2)] * num_nodes,
+        }
+        if labels:
+            row["Labels"] = [[rng.randrange(2), rng.randrange(2)] for _ in range(num_nodes)]
+        rows.append(row)
+    return rows
+
+
+def write_data(tmp_path, labels):
+    lines = [json.dumps(row) for row in encoded_rows(labels)]
+    data_path = tmp_path / "data.json"
+    data_path.write_text("".join(line + "\n" for line in lines))
+    shard_path = str(tmp_path / "data.shard")
+    assert convert_to_shard(str(data_path), shard_path, ARGS.max_token_len) == len(lines)
+    return lines, shard_path
+
+
+def assert_same_fields(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        if torch.is_tensor(e):
+            assert a.dtype == e.dtype
+            assert torch.equal(a, e)
+        else:
+            assert a == e
+
+
+@pytest.mark.parametrize("labels, eval_mode, line_fn", [
+    (True, False, wrapped_process_fn),
+    (True, True, wrapped_eval_process_fn),
+    (False, True, wrapped_commoncrawl_process_fn),
+])
+def test_shard_rows_match_processed_lines(tmp_path, labels, eval_mode, line_fn):
+    lines, shard_path = write_data(tmp_path, labels)
+    expected = [tensors for i, line in enumerate(lines) for tensors in line_fn(ARGS)(line, i)]
+
+    actual = list(ShardDataset(shard_path, wrapped_shard_process_fn(ARGS, eval_mode)))
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert_same_fields(a, e)
+
+
+@pytest.mark.parametrize("labels", [True, False])
+def test_packed_shard_rows_match_packed_lines(tmp_path, labels):
+    lines, shard_path = write_data(tmp_path, labels)
+    collate_fn = wrapped_packing_collate_fn(ARGS, labels=labels)
+    expected = collate_fn([row for i, line in enumerate(lines) for row in wrapped_packing_process_fn(ARGS)(line, i)])
+
+    shard = TokenShard(shard_path)
+    process_fn = wrapped_shard_packing_process_fn(ARGS)
+    actual = collate_fn([row for i in range(len(shard)) for row in process_fn((shard, shard[i]), i)])
+    assert_same_fields(actual, expected)
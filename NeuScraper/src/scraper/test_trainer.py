@@ -0,0 +1,73 @@
+import json
+import socket
+import types
+
+import pytest
+import torch.distributed as dist
+from torch.utils.data import DataLoader
+
+from dataset import DistributedAccessDataset
+from trainer import ContentExtractionTrainer, DirectoryDataIteratorW_OffSetMap
+
+BATCH_SIZE = 4
+NUM_WORKERS = 2
+STEPS = 40
+
+
+@pytest.fixture(scope="module", autouse=True)
+def process_group():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    dist.init_process_group("gloo", init_method="tcp://127.0.0.1:%d" % port, rank=0, world_size=1)
+    yield
+    dist.destroy_process_group()
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for file_no, lines in enumerate([50, 70, 90]):
+        with open(tmp_path / ("part%d.json" % file_no), "w") as f:
+            for i in range(lines):
+                f.write(json.dumps({"id": file_no * 1000 + i}) + "\n")
+    return tmp_path
+
+
+def record_id(line, i):
+    return [json.loads(line)["id"]]
+
+
+def batches(dataset, limit):
+    result = []
+    for batch in DataLoader(dataset, batch_size=BATCH_SIZE, num_workers=NUM_WORKERS):
+        if len(result) == limit:
+            break
+        result.append(batch.tolist())
+    return result
+
+
+@pytest.mark.parametrize("global_shuffle", [False, True])
+def test_resumed_epoch_continues_after_the_saved_step(data_dir, global_shuffle):
+    records = DirectoryDataIteratorW_OffSetMap(str(data_dir), seed=42, global_shuffle=global_shuffle,
+                                               block_size=8, buffer_blocks=2)
+    dataset = DistributedAccessDataset(records, record_id)
+    trainer = types.SimpleNamespace(train_dataloader_worker_count=NUM_WORKERS)
+    args = types.SimpleNamespace(world_size=1, train_batch_size=BATCH_SIZE)
+    full = batches(dataset, STEPS)
+
+    for steps in [1, 2, 7, STEPS - 1]:
+        position = ContentExtractionTrainer.get_data_position(trainer, args, dataset, 0, steps)
+        assert ContentExtractionTrainer.resume_data_position(trainer, args, dataset, position) == steps
+        assert batches(dataset, STEPS - steps) == full[steps:]
+        dataset.fast_forward(None)
+
+
+def test_position_from_another_batch_size_restarts_the_epoch(data_dir):
+    dataset = DistributedAccessDataset(DirectoryDataIteratorW_OffSetMap(str(data_dir), seed=42), record_id)
+    trainer = types.SimpleNamespace(train_dataloader_worker_count=NUM_WORKERS)
+    position = ContentExtractionTrainer.get_data_position(
+        trainer, types.SimpleNamespace(world_size=1, train_batch_size=8), dataset, 0, 5)
+
+    args = types.SimpleNamespace(world_size=1, train_batch_size=BATCH_SIZE)
+    assert ContentExtractionTrainer.resume_data_position(trainer, args, dataset, position) == 0
+    assert dataset.worker_offsets is None
@@ -1,10 +1,13 @@
 import os, sys
+import contextlib
 
 dir_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(dir_path)
 
 from dataset import DistributedAccessDataset
-from dataset_utils import LineShuffler
+from dataset_utils import LineShuffler, DatasetManifest, BlockShuffleSampler, MANIFEST_NAME, index_line_file
+from shards import ShardShuffler, SHARD_SUFFIX, is_shard, index_shard, wrapped_shard_process_fn
+from shards import encoder_fingerprint, wrapped_shard_embedding_process_fn
 from prettytable import PrettyTable
 
 import torch
@@ -70,6 +73,60 @@ def setup_distributed(args, logger):
         print("set dist: gpu="+str(args.n_gpu)+" rank="+str(torch.distributed.get_rank()))
 
 
+def setup_mixed_precision(args, logger):
+    """
+    Resolve --fp16 / --bf16 into args.amp_dtype, falling back to float32 where autocast is unavailable
+    """
+    args.amp_dtype = None
+    if not (args.fp16 or args.bf16):
+        return
+    device_type = torch.device(args.device).type
+    if not hasattr(torch, "autocast"):
+        logger.warning("torch %s has no torch.autocast, training in float32", torch.__version__)
+        return
+
+    if device_type == "cuda" and not args.bf16:
+        args.amp_dtype = torch.float16
+    elif device_type == "cuda" and not torch.cuda.is_bf16_supported():
+        logger.warning("This GPU has no bfloat16 support, using float16 with loss scaling")
+        args.amp_dtype = torch.float16
+    elif device_type == "cpu" and not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+        logger.warning("This CPU has no bfloat16 support, training in float32")
+        return
+    else:
+        if args.fp16 and not args.bf16:
+            logger.warning("float16 autocast is slow on CPU, using bfloat16")
+        args.amp_dtype = torch.bfloat16
+    logger.info("Mixed precision: %s autocast on %s", args.amp_dtype, device_type)
+
+
+def autocast(args):
+    if getattr(args, "amp_dtype", None) is None:
+        return contextlib.nullcontext()
+    return torch.autocast(torch.device(args.device).type, dtype=args.amp_dtype)
+
+
+def create_grad_scaler(args):
+    # Only float16 needs loss scaling; a disabled scaler passes everything through
+    enabled = getattr(args, "amp_dtype", None) == torch.float16
+    if hasattr(torch.amp, "GradScaler"):
+        return torch.amp.GradScaler(torch.device(args.device).type, enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled)
+
+
+def clamp_gradients(model, limit=0.1):
+    # One fused pass over all gradients instead of a Python hook per parameter
+    grads = [p.grad for p in model.parameters() if p.grad is not None]
+    if not grads:
+        return
+    if hasattr(torch, "_foreach_clamp_min_"):
+        torch._foreach_clamp_min_(grads, -limit)
+        torch._foreach_clamp_max_(grads, limit)
+    else:
+        for grad in grads:
+            grad.clamp_(-limit, limit)
+
+
 def load_model_and_setup_training(args, model):
     print("*** enter load_model_and_setup_training *** ")
     logger.info("***enter load_model_and_setup_training ***")
@@ -85,8 +142,12 @@ def load_model_and_setup_training(args, model):
     if optimizer_state_dict is not None:
         optimizer.load_state_dict(optimizer_state_dict)
 
-    for p in model.parameters():
-        p.register_hook(lambda grad: torch.clamp(grad, -0.1, 0.1))
+    # With float16 loss scaling the gradients seen by hooks are scaled; train_step clamps them after unscaling.
+    # In fast_train mode train_step clamps all gradients at once before the optimizer step.
+    if getattr(args, "amp_dtype", None) != torch.float16 and not args.fast_train:
+        for p in model.parameters():
+            if p.requires_grad:
+                p.register_hook(lambda grad: torch.clamp(grad, -0.1, 0.1))
 
     if args.local_rank != -1:
         model = torch.nn.parallel.DistributedDataParallel(
@@ -103,7 +164,7 @@ def is_first_worker():
     return not dist.is_available() or not dist.is_initialized() or dist.get_rank() == 0
 
 
-def save_checkpoint(args, epoch, global_step, model, tokenizer, weight_map, result, optimizer, scheduler):
+def save_checkpoint(args, epoch, global_step, model, tokenizer, weight_map, result, optimizer, scheduler, data_position=None):
     if global_step < 0:
         output_dir = args.output_dir
     else:
@@ -119,6 +180,7 @@ def save_checkpoint(args, epoch, global_step, model, tokenizer, weight_map, resu
         "model_state_dict": model.state_dict(),
         "optimizer_state_dict": optimizer.state_dict(),
         "scheduler_state_dict": scheduler.state_dict(),
+        "data_position": data_position,
     }
 
     torch.save(checkpoint_state_dict, os.path.join(output_dir, "training_state_checkpoint_{}.tar".format(global_step)))
@@ -181,6 +243,10 @@ def load_checkpoint(args, model):
         epoch = checkpoint_state_dict["epoch"]
         last_global_step = checkpoint_state_dict["last_global_step"]
         scheduler_state_dict = checkpoint_state_dict["scheduler_state_dict"]
+        # Resume inside the saved epoch instead of starting the next one
+        args.data_position = checkpoint_state_dict.get("data_position")
+        if args.data_position is not None:
+            epoch = args.data_position["epoch"] - 1
     else:
         epoch = 0
         last_global_step = 0
@@ -207,13 +273,23 @@ def initialize_model_weights(args, model):
 def list_pt_files(base_dir):
     d = []
     for (dir_path, dir_names, file_names) in os.walk(base_dir):
-        d.extend(os.path.join(dir_path, f) for f in file_names if (("tsv" in f or "json" in f) and not "offset" in f))
+        # Shard directories (e.g. their embeddings.json) are not JSON lines inputs
+        dir_names[:] = [name for name in dir_names if not name.endswith(SHARD_SUFFIX)]
+        d.extend(os.path.join(dir_path, f) for f in file_names if (("tsv" in f or "json" in f) and not "offset" in f and not MANIFEST_NAME in f))
     return d
 
 
+def list_shard_dirs(base_dir):
+    d = []
+    for (dir_path, dir_names, file_names) in os.walk(base_dir):
+        d.extend(os.path.join(dir_path, f) for f in dir_names if f.endswith(SHARD_SUFFIX) and is_shard(os.path.join(dir_path, f)))
+    return sorted(d)
+
+
 class DirectoryDataIteratorW_OffSetMap:
-    def __init__(self, dir_path, encoding="utf-8", seed=-1, no_shuffle=False):
-        self.files = list_pt_files(dir_path)
+    def __init__(self, dir_path, encoding="utf-8", seed=-1, no_shuffle=False, shards=False,
+                 global_shuffle=False, block_size=32, buffer_blocks=8):
+        self.files = list_shard_dirs(dir_path) if shards else list_pt_files(dir_path)
         if len(self.files) == 0:
             raise ValueError("Data directory contains 0 files")
 
@@ -221,28 +297,75 @@ class DirectoryDataIteratorW_OffSetMap:
         self.state_cnt = 0
         self.encoding = encoding
         self.seed=seed
+        self.shards = shards
+
+        # Indexed once by the first worker; other ranks wait, then read the manifest
+        self.manifest = DatasetManifest(dir_path, self.files, index_shard if shards else index_line_file)
+        if is_first_worker():
+            self.manifest.update()
+        if dist.is_initialized():
+            dist.barrier()
+        self.manifest.load()
 
-    def get_dist_iter(self, worker_no, total_worker):
+        self.sampler = None
+        if global_shuffle and not no_shuffle and seed >= 0:
+            self.sampler = BlockShuffleSampler([self.manifest.lines(file) for file in self.files], block_size, buffer_blocks, seed)
+
+    def change_seed(self, seed):
+        self.seed = seed
+        if self.sampler is not None:
+            self.sampler.seed = seed
+
+    def _open(self, file, seed):
+        if self.shards:
+            return ShardShuffler(file, seed=seed)
+        return LineShuffler(file, seed=seed, encoding=self.encoding, offsetmap_cache=self.manifest.offsets(file))
+
+    def get_dist_iter(self, worker_no, total_worker, skip=0):
+        if self.sampler is not None:
+            yield from self._block_shuffled_iter(worker_no, total_worker, skip)
+            return
+        yield from self._file_shuffled_iter(worker_no, total_worker, skip)
+
+    def _file_shuffled_iter(self, worker_no, total_worker, skip):
         for file in self.files:
             seed = self._get_seed()
-            with LineShuffler(file, seed=seed, encoding=self.encoding) as f:
-                for i, record in enumerate(f.get_dist_iter(worker_no, total_worker)):
+            lines = self.manifest.lines(file)
+            worker_lines = lines // total_worker + (1 if worker_no < lines % total_worker else 0)
+            if skip >= worker_lines:
+                # Files read before the resume point are not opened
+                skip -= worker_lines
+                continue
+            with self._open(file, seed) as f:
+                for i, record in enumerate(f.get_dist_iter(worker_no, total_worker, skip)):
                     yield record
+            skip = 0
+
+    def _block_shuffled_iter(self, worker_no, total_worker, skip):
+        readers = {}
+        try:
+            for blocks, order in self.sampler.iter_buffers(worker_no, total_worker, skip):
+                # Blocks are read front to back, then emitted from memory in shuffled order
+                records = []
+                for file_no, start, end in blocks:
+                    if file_no not in readers:
+                        readers[file_no] = self._open(self.files[file_no], -1).__enter__()
+                    records.extend(readers[file_no].read_block(start, end))
+                for i in order.tolist():
+                    yield records[i]
+        finally:
+            for reader in readers.values():
+                reader.__exit__(None, None, None)
                       
     def __iter__(self):
         for file in self.files:
             seed = self._get_seed()
-            with LineShuffler(file, seed=seed, encoding=self.encoding) as f:
+            with self._open(file, seed) as f:
                 for i, record in enumerate(f.__iter__()):
                     yield record
 
     def __len__(self):
-        total_rows = 0
-        for file in self.files:
-            seed = self._get_seed()
-            with LineShuffler(file, seed=seed, encoding=self.encoding) as f:
-                total_rows = total_rows + f.__len__()
-        return total_rows
+        return len(self.manifest)
     
     def _get_seed(self):
         if self.no_shuffle:
@@ -282,6 +405,7 @@ class ContentExtractionTrainer:
         self.process_fn = data_process_fn
         self.tokenizer = tokenizer
         self.tr_loss = 0.0
+        self.tr_loss_pending = None
         self.logging_loss = 0.0
         self.logging_loss_scalar = 0.0
         self.val_metrics_result = {}
@@ -291,6 +415,7 @@ class ContentExtractionTrainer:
         self.val_data_path = os.path.join(os.path.abspath(args.data_dir), "val/")
         self.train_dataloader_worker_count = args.train_dataloader_worker_count
         self.val_dataloader_worker_count = args.val_dataloader_worker_count
+        self.scaler = create_grad_scaler(args)
 
         if is_first_worker():
             self.tb_writer = SummaryWriter(log_dir=args.log_dir)
@@ -306,7 +431,9 @@ class ContentExtractionTrainer:
         foundNan = False
 
         logger.info("init data loader")
-        train_datapath_iterator = DirectoryDataIteratorW_OffSetMap(self.train_data_path, seed=42)
+        train_datapath_iterator = DirectoryDataIteratorW_OffSetMap(
+            self.train_data_path, seed=42, shards=args.shard_data, global_shuffle=args.global_shuffle,
+            block_size=args.shuffle_block_size, buffer_blocks=args.shuffle_buffer_blocks)
         train_sds = DistributedAccessDataset(train_datapath_iterator, self.process_fn)
         train_dataloader = DataLoader(
             train_sds, batch_size=args.train_batch_size, num_workers= self.train_dataloader_worker_count, collate_fn=content_extraction_collate_fn)
@@ -339,6 +466,7 @@ class ContentExtractionTrainer:
             logger.info("Scheduler loaded from checkpoint.")
             logger.info(self.scheduler_state_dict)
 
+        data_position = getattr(args, "data_position", None)
         for epoch in range(self.epoch, self.epoch + args.epoch):
             logger.info("\n-----------------------------------------------")
             logger.info("start epoch " + str(epoch) + " Worker "+str(dist.get_rank())+" nan:"+("yes" if foundNan else "no"))
@@ -346,8 +474,17 @@ class ContentExtractionTrainer:
                 break
             # Data loader
             logger.info("Starting epoch " + str(epoch))
+            if args.global_shuffle:
+                train_sds.change_seed(42 + epoch)
+            start_step = 0
+            if data_position is not None:
+                start_step = self.resume_data_position(args, train_sds, data_position)
+                data_position = None
+                if start_step >= total_steps_per_process_per_epoch:
+                    train_sds.fast_forward(None)
+                    continue
             # TODO RECORD TIMES
-            for step, batch in tqdm(enumerate(train_dataloader)):
+            for step, batch in tqdm(enumerate(train_dataloader, start_step), initial=start_step):
                 if args.max_steps != -1 and 0 < args.max_steps < self.global_step:
                     logger.info("Reach max step, break training")
                     break
@@ -376,11 +513,18 @@ class ContentExtractionTrainer:
                             self.val_metrics_result,
                             self.optimizer,
                             self.scheduler,
+                            self.get_data_position(args, train_sds, epoch, step + 1),
                         )
-                dist.barrier()          
+                    if args.fast_train:
+                        dist.barrier()
+                if not args.fast_train:
+                    dist.barrier()
+
+            train_sds.fast_forward(None)
 
             logger.info("Completed epoch " + str(epoch) + " Worker "+str(dist.get_rank())+" nan:"+("yes" if foundNan else "no"))
 
+        self.sync_tr_loss()
         if is_first_worker():
             self.tb_writer.close()
 
@@ -395,7 +539,8 @@ class ContentExtractionTrainer:
         labels = batch[2]
         batch = batch[:2]
 
-        output = self.model(batch)
+        with autocast(args):
+            output = self.model(batch)
 
         labels = labels.to(self.model.device).view(-1, args.max_sequence_len, args.num_classes)
         loss, class_loss = self.loss_calculator.weighted_crossentropy(labels, output)
@@ -406,17 +551,23 @@ class ContentExtractionTrainer:
             loss = loss / args.gradient_accumulation_steps
 
         if (step + 1) % args.gradient_accumulation_steps == 0:
-            loss.backward()
+            self.scaler.scale(loss).backward()
         else:
             with self.model.no_sync():
-                loss.backward()
+                self.scaler.scale(loss).backward()
 
-        self.tr_loss += loss.item()
+        if args.fast_train:
+            # Stays on device; read back only at logging steps
+            loss = loss.detach().float()
+            self.tr_loss_pending = loss if self.tr_loss_pending is None else self.tr_loss_pending + loss
+        else:
+            self.tr_loss += loss.item()
 
-        if not math.isfinite(loss.item()):
-            logger.info("Step that has nan loss: " + str(step))
+            if not math.isfinite(loss.item()):
+                logger.info("Step that has nan loss: " + str(step))
 
         if (self.global_step % args.logging_steps) == 0 and self.global_step != 0:
+            self.sync_tr_loss()
             logs = {}
 
             loss_scalar = (self.tr_loss - self.logging_loss) / args.logging_steps
@@ -441,11 +592,56 @@ class ContentExtractionTrainer:
                 self.tb_writer.add_scalar("epoch", epoch, self.global_step)
 
         if (step + 1) % args.gradient_accumulation_steps == 0:
-            self.optimizer.step()
+            if self.scaler.is_enabled():
+                self.scaler.unscale_(self.optimizer)
+                clamp_gradients(self.model)
+            elif args.fast_train:
+                clamp_gradients(self.model)
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
             self.scheduler_factory.step()
             self.model.zero_grad()
             self.global_step += 1
 
+    def sync_tr_loss(self):
+        """
+        Adds the loss accumulated on device in fast_train mode to tr_loss
+        """
+        if self.tr_loss_pending is None:
+            return
+        pending = self.tr_loss_pending.item()
+        self.tr_loss_pending = None
+        if not math.isfinite(pending):
+            logger.info("Nan loss since the last logging step")
+        self.tr_loss += pending
+
+    def get_data_position(self, args, train_sds, epoch, steps):
+        """
+        Records each local DataLoader worker has consumed after `steps` batches of this epoch
+        """
+        # The DataLoader takes batches from its workers round-robin
+        num_workers = max(1, self.train_dataloader_worker_count)
+        return {
+            "epoch": epoch,
+            "step": steps,
+            "seed": train_sds.records.seed,
+            "world_size": args.world_size,
+            "num_workers": num_workers,
+            "batch_size": args.train_batch_size,
+            "worker_offsets": [len(range(worker_id, steps, num_workers)) * args.train_batch_size for worker_id in range(num_workers)],
+        }
+
+    def resume_data_position(self, args, train_sds, position):
+        saved = (position["world_size"], position["num_workers"], position["batch_size"], position["seed"])
+        current = (args.world_size, max(1, self.train_dataloader_worker_count), args.train_batch_size, train_sds.records.seed)
+        if saved != current:
+            logger.warning("Data position was saved with (world size, workers, batch size, seed) = %s, now %s; "
+                           "restarting epoch %d from its first batch", saved, current, position["epoch"])
+            return 0
+        logger.info("Resuming epoch %d at step %d", position["epoch"], position["step"])
+        train_sds.fast_forward(position["worker_offsets"], position["step"] % position["num_workers"])
+        return position["step"]
+
     def count_parameters(self):
         table = PrettyTable(["Modules", "Parameters"])
         total_params = 0
@@ -462,7 +658,7 @@ class ContentExtractionTrainer:
         self.val_tr_loss = 0.0
         total_val_steps = 0.0
 
-        val_datapath_iterator = DirectoryDataIteratorW_OffSetMap(self.val_data_path)
+        val_datapath_iterator = DirectoryDataIteratorW_OffSetMap(self.val_data_path, shards=args.shard_data)
         val_sds = DistributedAccessDataset(val_datapath_iterator, self.process_fn)
         dataloader = DataLoader(
             val_sds, batch_size=args.val_batch_size, num_workers= self.val_dataloader_worker_count, collate_fn=content_extraction_collate_fn)
@@ -482,7 +678,8 @@ class ContentExtractionTrainer:
             with torch.no_grad():
                 labels.to(self.model.device)
                 labels = labels.to(self.model.device).view(-1, args.max_sequence_len, args.num_classes)
-                output = self.model(batch)
+                with autocast(args):
+                    output = self.model(batch)
                 loss, class_loss = self.loss_calculator.weighted_crossentropy(labels, output)
                 
                 loss = loss.mean()
@@ -524,6 +721,7 @@ def main():
     args = parser.parse_args()
 
     setup_distributed(args, logger)
+    setup_mixed_precision(args, logger)
 
     if (
         os.path.exists(args.output_dir)
@@ -542,7 +740,7 @@ def main():
     args.log_dir=args.output_dir + "/log"
     logger.info(args)
 
-    loss_calculator = ContentExtractionLoss()
+    loss_calculator = ContentExtractionLoss(debug=args.debug_loss)
     model = ContentExtractionTextEncoder(args)
 
     tokenizer = XLMRobertaTokenizer.from_pretrained(
@@ -550,9 +748,17 @@ def main():
         do_lower_case=True,
         cache_dir=None,
     )
-    data_process_fn = wrapped_process_fn(args)
+    if args.cached_embeddings:
+        if not (args.shard_data and args.freeze_text_encoder):
+            raise ValueError("--cached_embeddings needs --shard_data and --freeze_text_encoder")
+        data_process_fn = wrapped_shard_embedding_process_fn(args)
+    else:
+        data_process_fn = wrapped_shard_process_fn(args) if args.shard_data else wrapped_process_fn(args)
 
     trainer = ContentExtractionTrainer(args, model, tokenizer, loss_calculator, data_process_fn)
+    if args.cached_embeddings:
+        # Checked against every shard, so embeddings from another encoder are never mixed in
+        args.encoder_fingerprint = encoder_fingerprint(model.text_roberta)
     if not args.eval_only:
         global_step, tr_loss, metrics_result = trainer.train(args)
 
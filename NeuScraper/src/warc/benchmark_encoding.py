@@ -0,0 +1,97 @@
+import os
+import random
+import time
+from argparse import ArgumentParser
+from collections import Counter
+
+import chardet
+from encoding_resolver import resolve_encoding, decode_html
+
+
+SAMPLES = {
+    'utf-8': 'Solusi perangkat lunak ERP terbaik — 日本語のテキスト — Ünïcödé café',
+    'cp1252': 'Café crème brûlée — “quoted” naïve façade',
+    'shift_jis': '日本語のウェブページです。会社概要と製品情報。',
+    'gb2312': '这是一个中文网页。公司简介和产品信息。',
+    'euc-kr': '한국어 웹 페이지입니다. 회사 소개 및 제품 정보.',
+    'koi8-r': 'Это русская веб-страница. О компании и продукции.',
+}
+# Western UTF-8 text whose bytes also decode (as mojibake) in cp1252
+LATIN_UTF8_SAMPLE = 'Café crème brûlée — naïve façade'
+
+
+def legacy_decode(raw):
+    # Behaviour before the resolver: chardet over the whole body
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        guess = chardet.detect(raw)['encoding']
+        if not guess or guess == 'UTF-8':
+            return None
+        try:
+            return raw.decode(guess)
+        except (UnicodeDecodeError, LookupError):
+            return None
+
+
+def synthetic_corpus(n_pages, seed=0):
+    """Pages in several encodings, with and without header/meta/BOM hints.
+
+    Some UTF-8 pages are served with the common default header charset
+    ISO-8859-1, which the previous UTF-8-first decoding handled correctly.
+    """
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n_pages):
+        encoding = rng.choice(list(SAMPLES))
+        hint = rng.choice(['none', 'header', 'meta', 'bom', 'latin1-header'] if encoding == 'utf-8' else ['none', 'header', 'meta'])
+        meta = f'<meta charset="{encoding}">' if hint == 'meta' else ''
+        text = LATIN_UTF8_SAMPLE if hint == 'latin1-header' else SAMPLES[encoding]
+        paragraphs = ''.join(f'<p>{text} {j}</p>\n' for j in range(rng.randint(20, 4000)))
+        html = f'<html><head>{meta}<title>Page {i}</title></head><body>{paragraphs}</body></html>'
+        raw = html.encode(encoding)
+        if hint == 'bom':
+            raw = b'\xef\xbb\xbf' + raw
+        content_type = f'text/html; charset={encoding}' if hint == 'header' else 'text/html'
+        if hint == 'latin1-header':
+            content_type = 'text/html; charset=ISO-8859-1'
+        pages.append((raw, content_type))
+    return pages
+
+
+def load_corpus(path):
+    pages = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as f:
+            pages.append((f.read(), None))
+    return pages
+
+
+def timed(fn, pages):
+    start = time.perf_counter()
+    results = [fn(raw, content_type) for raw, content_type in pages]
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--path', help="Directory of raw HTML pages (defaults to a synthetic corpus)")
+    parser.add_argument('--pages', type=int, default=300, help="Synthetic corpus size")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.path) if args.path else synthetic_corpus(args.pages)
+    total_mb = sum(len(raw) for raw, _ in pages) / 1e6
+
+    legacy, legacy_time = timed(lambda raw, _: legacy_decode(raw), pages)
+    resolved, resolved_time = timed(decode_html, pages)
+    sources = Counter(resolve_encoding(raw, content_type)[1] for raw, content_type in pages)
+
+    # A BOM is part of the text for the legacy path but stripped by the resolver
+    agree = sum(1 for a, b in zip(legacy, resolved) if (a or '').lstrip('﻿') == (b or ''))
+    only_resolved = sum(1 for a, b in zip(legacy, resolved) if a is None and b is not None)
+
+    print("Pages: %d (%.1f MB)" % (len(pages), total_mb))
+    print("chardet on full body: %.2f s, %.1f MB/s" % (legacy_time, total_mb / legacy_time))
+    print("encoding resolver:    %.2f s, %.1f MB/s" % (resolved_time, total_mb / resolved_time))
+    print("Agreement with previous decoding: %.1f%% (%d pages only decodable by the resolver)" % (100.0 * agree / len(pages), only_resolved))
+    print("Resolved from: " + ", ".join("%s=%d" % item for item in sources.most_common()))
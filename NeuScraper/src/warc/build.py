@@ -9,28 +9,33 @@ import csv
 from warcio import ArchiveIterator
 from argparse import ArgumentParser
 from bs4 import BeautifulSoup
-import chardet
+from encoding_resolver import decode_html
+from node_filter import is_boilerplate_node
 import pycld2 as cld2
 import unicodedata
 
 
 
 class FeatureExtractorApplierProcessor:
-    def __init__(self):
+    def __init__(self, prefilter=False, chunk_stride=384):
         self.comment = 'This is the constant comment for all rows returned'
         self.chunk_size = 384
+        self.chunk_stride = chunk_stride
         self.max_token_length = 50
+        # Drop nodes that can never be primary content before tokenization
+        self.prefilter = prefilter
 
 
     def _chunk_nodes(self, node_texts, node_seq, node_url):
         chunks = []
 
-        for i in range(0, len(node_texts), self.chunk_size):
-            start = i
-            end = i + self.chunk_size
+        # Windows overlap when chunk_stride < chunk_size; the last one ends with the document
+        for start in range(0, len(node_texts), self.chunk_stride):
+            end = start + self.chunk_size
             chunk = (node_texts[start:end], node_seq[start:end], node_url[start:end])
             chunks.append(chunk)
-            start += self.chunk_size
+            if end >= len(node_texts):
+                break
         
         return chunks
     
@@ -66,10 +71,6 @@ class FeatureExtractorApplierProcessor:
 
         return soup
     
-    def detect_encoding(self, html_content):
-        result = chardet.detect(html_content)
-        return result['encoding']
-    
    
     def Apply(self, url, api):
 
@@ -83,16 +84,19 @@ class FeatureExtractorApplierProcessor:
             for node_id, node in api.all_nodes.items():
                 if node.is_textnode:
                     text = node.html_node.text.strip('\r\n\t\xa0 ') 
-                    if len(text) > 0:
-                        node_sequence.append(node_id)
-                        node_texts_tokens.append(tokenizer.tokenize_sequence(text))
-                        node_url.append(url)
-
+                    if len(text) == 0:
+                        continue
                 elif node.html_node.name in ["ol", "dl", "table"]: # List and Table element nodes
                     text = node.html_node.text.strip('\r\n\t\xa0 ')
-                    node_sequence.append(node_id)
-                    node_texts_tokens.append(tokenizer.tokenize_sequence(text))
-                    node_url.append(url)
+                else:
+                    continue
+
+                # NodeIds carry the original node ids, so dropped nodes simply get no prediction
+                if self.prefilter and is_boilerplate_node(node, text):
+                    continue
+                node_sequence.append(node_id)
+                node_texts_tokens.append(tokenizer.tokenize_sequence(text))
+                node_url.append(url)
 
             # Chunk Document
             chunks = self._chunk_nodes(node_texts_tokens, node_sequence, node_url)
@@ -121,15 +125,14 @@ def process_file(input):
                         url = record.rec_headers.get_header('WARC-Target-URI')
 
                         raw_content = record.content_stream().read()
-                        encoding = generator.detect_encoding(raw_content)
+                        content_type = record.http_headers.get_header('Content-Type') if record.http_headers else None
+                        html_content = decode_html(raw_content, content_type)
 
-                        if encoding == None:
+                        if html_content == None:
                             #print("encode error")
                             continue
 
                         try:
-                            html_content = raw_content.encode('utf-8')
-                            
                             try:
                                 _,_,details = cld2.detect(html_content)
                             except:
@@ -171,9 +174,11 @@ if __name__ == "__main__":
 
     parser = ArgumentParser()
     parser.add_argument('--path', required=True, help="Path to the directory containing the CommonCrawl WARC files")
+    parser.add_argument('--prefilter', action='store_true', help="Skip script remnants, punctuation-only and other trivial nodes before tokenization")
+    parser.add_argument('--chunk_stride', type=int, default=384, help="Nodes between chunk starts; below 384 chunks overlap")
     args = parser.parse_args()
     
-    generator = FeatureExtractorApplierProcessor()
+    generator = FeatureExtractorApplierProcessor(prefilter=args.prefilter, chunk_stride=args.chunk_stride)
 
     CSV_COLUMN_NAMES = ['Url', 'TextNodeId', 'Text']
 
@@ -6,9 +6,21 @@ import os
 import streamlit as st
 from streamlit_chat import message
 from google import genai
-from google.genai import types
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from neuscraper_client import NeuScraperClient, CircuitOpenError
+from fetch_cache import FetchCache
+from company_index import CompanyIndex, DETAIL_FIELDS, is_dataset_file
+from search_index import CompanySearchIndex
+from vector_index import CompanyVectorIndex, XLMREmbedder
+from company_chat import (
+    ChatResponseCache,
+    CompanyChat,
+    CompanySummaryStore,
+    DatasetChat,
+)
 # Run the neural scraper server with
 # uvicorn app:app --reload --host 0.0.0.0 --port 1688
 
@@ -20,6 +32,12 @@ class CompanyIntelligencePipeline:
         neuscraper_endpoint="http://0.0.0.0:1688/predict/",
         gemini_api_key=os.getenv("GEMINI_API_KEY"),
         data_dir="company_data",
+        neuscraper_max_in_flight=4,
+        neuscraper_timeout=60,
+        neuscraper_crawl_pages=5,
+        cache_ttl=7 * 24 * 3600,
+        cache_max_bytes=256 * 1024 * 1024,
+        index_max_age=30 * 24 * 3600,
     ) -> None:
         self.neuscraper_endpoint = neuscraper_endpoint
         self.gemini_api_key = gemini_api_key
@@ -28,8 +46,66 @@ class CompanyIntelligencePipeline:
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
 
+        self.fetch_cache = FetchCache(
+            os.path.join(data_dir, "fetch_cache.sqlite"),
+            ttl=cache_ttl,
+            max_bytes=cache_max_bytes,
+        )
+        self.neuscraper_client = NeuScraperClient(
+            neuscraper_endpoint,
+            max_in_flight=neuscraper_max_in_flight,
+            timeout=neuscraper_timeout,
+            cache=self.fetch_cache,
+            crawl_pages=neuscraper_crawl_pages,
+        )
+        # Kept out of data_dir itself, where every *.json file is a dataset
+        summary_dir = os.path.join(data_dir, ".summaries")
+        os.makedirs(summary_dir, exist_ok=True)
+        summary_path = os.path.join(summary_dir, "summaries.json")
+        legacy_summary_path = os.path.join(data_dir, "summaries.json")
+        if (
+            os.path.exists(legacy_summary_path)
+            and not os.path.exists(summary_path)
+            and not is_dataset_file(legacy_summary_path)
+        ):
+            os.replace(legacy_summary_path, summary_path)
+        self.summary_store = CompanySummaryStore(summary_path)
+
+        self.company_index = CompanyIndex(data_dir, max_age=index_max_age)
+        self.search_index = CompanySearchIndex(os.path.join(data_dir, "search_index.sqlite"))
+        self.search_index.sync(self.company_index)
+
+        self.chat_cache = ChatResponseCache(self.fetch_cache)
+
+        # Semantic search needs torch/transformers; it is disabled without them
+        self.vector_index = None
+        self.vectors_ready = threading.Event()
+        self.vector_progress = (0, 0)
+        if XLMREmbedder.available():
+            self.vector_index = CompanyVectorIndex(
+                os.path.join(data_dir, "vector_index"), XLMREmbedder()
+            )
+            # Embedding the back-catalogue can take hours on CPU, so it runs on a
+            # background thread and keyword search answers until it has finished
+            self.vector_executor = ThreadPoolExecutor(max_workers=1)
+            self._index_vectors(list(self.company_index.entities.values()), initial=True)
+
         self.gemini_client = genai.Client(api_key=self.gemini_api_key)
 
+    def fetch_page(self, url):
+        """Return `(html, from_cache)`, or `(None, False)` if the page could not be fetched."""
+        cached = self.fetch_cache.get_text(url)
+        if cached is not None:
+            return cached, True
+
+        response = requests.get(url)
+        if response.status_code != 200:
+            print(f"Failed to access {url}. Status code: {response.status_code}")
+            return None, False
+
+        self.fetch_cache.put(url, response.text)
+        return response.text, False
+
     def scrape_yellow_pages(self, search_query, page_limit=1, delay=5):
         all_companies = []
 
@@ -40,15 +116,13 @@ class CompanyIntelligencePipeline:
                 url = f"https://www.yellowpages.id/listing/places/?bbox=&d=20&l=&lat=&lon=&q={search_query.replace(' ', '+')}&page={page}"
 
             print(f"Scraping Yellow Pages: {url}")
-            response = requests.get(url)
+            html, from_cache = self.fetch_page(url)
 
-            if response.status_code != 200:
-                print(
-                    f"Failed to access page {page}. Status code: {response.status_code}"
-                )
+            if html is None:
+                print(f"Failed to access page {page}.")
                 continue
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            soup = BeautifulSoup(html, "html.parser")
             cards = soup.find_all("div", class_="cc-content")
             print(f"Found {len(cards)} companies on page {page}")
 
@@ -68,7 +142,8 @@ class CompanyIntelligencePipeline:
                 }
                 all_companies.append(company)
 
-            time.sleep(delay)
+            if not from_cache:
+                time.sleep(delay)
 
         return all_companies
 
@@ -79,16 +154,25 @@ class CompanyIntelligencePipeline:
             if not company["url"]:
                 continue
 
+            known = self.company_index.fresh_details(company)
+            if known:
+                print(f"Using indexed details for {company['name']} ({i+1}/{len(companies)})")
+                for field in DETAIL_FIELDS:
+                    if field in known["record"]:
+                        company[field] = known["record"][field]
+                detailed_companies.append(company)
+                continue
+
             print(f"Scraping details for {company['name']} ({i+1}/{len(companies)})")
 
             try:
-                resp = requests.get(company["url"])
-                if resp.status_code != 200:
+                html, from_cache = self.fetch_page(company["url"])
+                if html is None:
                     print(f"Failed to access company page: {company['url']}")
                     detailed_companies.append(company)
                     continue
 
-                soup = BeautifulSoup(resp.text, "html.parser")
+                soup = BeautifulSoup(html, "html.parser")
                 sections = soup.find_all("section", attrs={"id": "company_card"})
 
                 for section in sections:
@@ -134,7 +218,8 @@ class CompanyIntelligencePipeline:
                             company["website"] = website_link
 
                 detailed_companies.append(company)
-                time.sleep(delay)
+                if not from_cache:
+                    time.sleep(delay)
 
             except Exception as e:
                 print(f"Error processing {company['name']}: {str(e)}")
@@ -143,37 +228,40 @@ class CompanyIntelligencePipeline:
 
         return detailed_companies
 
-    def scrape_company_content(self, companies):
-        for i, company in enumerate(companies):
+    def scrape_company_content(self, companies, progress_callback=None):
+        targets = []
+        for company in companies:
+            known = self.company_index.fresh_content(company)
             if "website" not in company or not company["website"]:
                 company["description"] = ""
-                continue
+            elif known:
+                company["description"] = known["record"]["description"]
+            else:
+                targets.append(company)
 
-            print(
-                f"Extracting content from website for {company['name']} ({i+1}/{len(companies)})"
-            )
+        print(
+            f"Extracting content from {len(targets)} company websites "
+            f"({self.neuscraper_client.max_in_flight} in flight)"
+        )
 
-            try:
-                response = requests.post(
-                    self.neuscraper_endpoint, json={"url": company["website"]}
-                )
+        by_website = {}
+        for company in targets:
+            by_website.setdefault(company["website"], []).append(company)
 
-                if response.status_code == 200:
-                    company["description"] = response.json()["Text"]
-                    print(
-                        f"Successfully extracted content ({len(company['description'])} characters)"
-                    )
+        def on_result(done, total, website, result):
+            for company in by_website[website]:
+                if isinstance(result, Exception):
+                    print(f"Error extracting content for {company['name']}: {str(result)}")
+                    company["description"] = ""
                 else:
+                    company["description"] = result
                     print(
-                        f"Failed to extract content. Status code: {response.status_code}"
+                        f"Successfully extracted content for {company['name']} ({len(result)} characters)"
                     )
-                    company["description"] = ""
+            if progress_callback is not None:
+                progress_callback(done, total, by_website[website][0])
 
-                time.sleep(5)
-
-            except Exception as e:
-                print(f"Error extracting content for {company['name']}: {str(e)}")
-                company["description"] = ""
+        self.neuscraper_client.extract_many(list(by_website), on_result=on_result)
 
         return companies
 
@@ -190,6 +278,12 @@ class CompanyIntelligencePipeline:
         with open(json_path, "w", encoding="utf-8") as f:
             json.dump(companies, f, ensure_ascii=False, indent=4)
 
+        entities = self.company_index.add_many(companies, filename)
+        self.search_index.sync(self.company_index)
+        self.summary_store.update(companies)
+        if self.vector_index is not None:
+            self._index_vectors(entities)
+
         print(f"Saved {len(companies)} companies to {csv_path} and {json_path}")
         return csv_path, json_path
 
@@ -205,15 +299,63 @@ class CompanyIntelligencePipeline:
         print(f"Loaded {len(companies)} companies from {json_path}")
         return companies
 
+    def search_companies(self, query, limit=20):
+        return self.search_index.search(query, limit)
+
+    def semantic_search(self, query, limit=10):
+        """Nearest companies by embedding; only valid once `vectors_ready` is set."""
+        return [
+            (self._entity_record(row), score)
+            for row, score in self.vector_index.search(query, limit)
+        ]
+
+    def similar_companies(self, company, limit=10):
+        entity = self.company_index.lookup(company)
+        if entity is None or not self.vectors_ready.is_set():
+            return []
+        return [
+            (self._entity_record(row), score)
+            for row, score in self.vector_index.similar(entity["id"], limit)
+        ]
+
+    def _entity_record(self, entity_id):
+        entity = self.company_index.entities[entity_id]
+        return dict(entity["record"], datasets=entity["datasets"])
+
+    def _index_vectors(self, entities, initial=False, batch_size=32):
+        # Small batches release the embedder between them, so query encoding
+        # does not wait for a whole save (or the whole back-catalogue). The index
+        # is saved once it has grown by its own size and at the end, so a pass
+        # costs linear rather than quadratic I/O and still survives a restart
+        def run():
+            try:
+                uncommitted = 0
+                for start in range(0, len(entities), batch_size):
+                    uncommitted += self.vector_index.add_entities(
+                        entities[start : start + batch_size], commit=False
+                    )
+                    if uncommitted >= max(1024, len(self.vector_index) // 2):
+                        self.vector_index.commit()
+                        uncommitted = 0
+                    if initial:
+                        self.vector_progress = (min(start + batch_size, len(entities)), len(entities))
+                self.vector_index.commit()
+                if initial:
+                    self.vectors_ready.set()
+            except Exception as e:
+                print(f"Error updating vector index: {str(e)}")
+
+        self.vector_executor.submit(run)
+
     def list_saved_datasets(self):
         json_files = [
             f.replace(".json", "")
             for f in os.listdir(self.data_dir)
-            if f.endswith(".json")
+            if f.endswith(".json") and is_dataset_file(os.path.join(self.data_dir, f))
         ]
         return json_files
 
-    def run_full_pipeline(self, search_query, page_limit=1):
+    def run_full_pipeline(self, search_query, page_limit=1, progress_callback=None):
         print(f"Starting pipeline for query: '{search_query}'")
 
         companies = self.scrape_yellow_pages(search_query, page_limit)
@@ -222,7 +364,9 @@ class CompanyIntelligencePipeline:
         detailed_companies = self.scrape_company_details(companies)
         print(f"Collected details for {len(detailed_companies)} companies")
 
-        enriched_companies = self.scrape_company_content(detailed_companies)
+        enriched_companies = self.scrape_company_content(
+            detailed_companies, progress_callback
+        )
         print(f"Enriched {len(enriched_companies)} companies with website content")
 
         timestamp = time.strftime("%Y%m%d_%H%M%S")
@@ -234,10 +378,32 @@ class CompanyIntelligencePipeline:
         return filename
 
 
+@st.cache_resource(show_spinner=False)
+def get_pipeline():
+    # One pipeline (and one genai.Client) per server process instead of per rerun
+    return CompanyIntelligencePipeline()
+
+
+@st.cache_data(show_spinner=False)
+def load_cached_company_data(_pipeline, filename):
+    return _pipeline.load_company_data(filename)
+
+
+@st.cache_data(show_spinner=False)
+def list_cached_datasets(_pipeline):
+    return _pipeline.list_saved_datasets()
+
+
+def invalidate_dataset_cache():
+    # Must be called after every dataset write so reruns see the new file
+    load_cached_company_data.clear()
+    list_cached_datasets.clear()
+
+
 def main():
     st.set_page_config(page_title="Company Intelligence Pipeline", layout="wide")
 
-    pipeline = CompanyIntelligencePipeline()
+    pipeline = get_pipeline()
 
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
@@ -251,6 +417,14 @@ def main():
     if "chat" not in st.session_state:
         st.session_state.chat = None
 
+    if "search_selection" not in st.session_state:
+        st.session_state.search_selection = None
+
+    if "dataset_chat" not in st.session_state:
+        st.session_state.dataset_chat = None
+        st.session_state.dataset_chat_name = None
+        st.session_state.dataset_chat_history = []
+
     st.title("Company Intelligence Platform")
 
     tab1, tab2, tab3 = st.tabs(
@@ -266,15 +440,26 @@ def main():
         )
 
         if st.button("🔍 Start Data Collection"):
+            progress_bar = st.progress(0.0, text="Extracting website content...")
+
+            def on_progress(done, total, company):
+                progress_bar.progress(
+                    done / total,
+                    text=f"Extracted website content for {company['name']} ({done}/{total})",
+                )
+
             with st.spinner("Collecting company data... This may take several minutes"):
-                filename = pipeline.run_full_pipeline(search_query)
+                filename = pipeline.run_full_pipeline(
+                    search_query, progress_callback=on_progress
+                )
+                invalidate_dataset_cache()
                 st.session_state.current_dataset = filename
                 st.success(
                     f"✅ Data collection completed! Collected data for search: '{search_query}'"
                 )
 
         st.subheader("Available Datasets")
-        datasets = pipeline.list_saved_datasets()
+        datasets = list_cached_datasets(pipeline)
         if datasets:
             selected_dataset = st.selectbox("Select a dataset to load", datasets)
             if st.button("Load Dataset"):
@@ -286,12 +471,51 @@ def main():
     with tab2:
         st.header("Explore Company Data")
 
+        explorer_query = st.text_input(
+            "Search all saved companies",
+            placeholder="e.g. ERP, cloud hosting, Jakarta",
+        )
+        search_mode = "Keyword"
+        if pipeline.vector_index is not None:
+            search_mode = st.radio(
+                "Search mode", ["Keyword", "Semantic"], horizontal=True
+            )
+        if search_mode == "Semantic" and not pipeline.vectors_ready.is_set():
+            done, total = pipeline.vector_progress
+            st.info(
+                f"The semantic index is still being built ({done}/{total} companies). Showing keyword results until it is ready."
+            )
+            search_mode = "Keyword"
+        if explorer_query:
+            if search_mode == "Semantic":
+                search_results = [
+                    (record, f"Similarity: {score:.2f}")
+                    for record, score in pipeline.semantic_search(explorer_query)
+                ]
+            else:
+                search_results = pipeline.search_companies(explorer_query)
+            if not search_results:
+                st.info("No saved companies match your search.")
+            for i, (record, snippet) in enumerate(search_results):
+                col1, col2 = st.columns([6, 1])
+                with col1:
+                    st.markdown(f"**{record['name']}** · {record.get('address', '')}")
+                    if snippet:
+                        st.caption(snippet)
+                with col2:
+                    if st.button("Open", key=f"search_open_{i}"):
+                        st.session_state.current_dataset = record["datasets"][-1]
+                        st.session_state.search_selection = record["name"]
+                        st.rerun()
+
         if not st.session_state.current_dataset:
             st.warning(
                 "Please select or collect a dataset first in the Data Collection tab."
             )
         else:
-            companies = pipeline.load_company_data(st.session_state.current_dataset)
+            companies = load_cached_company_data(
+                pipeline, st.session_state.current_dataset
+            )
 
             if not companies:
                 st.warning("Selected dataset is empty or could not be loaded.")
@@ -301,8 +525,15 @@ def main():
                 )
 
                 company_names = [company["name"] for company in companies]
+                selected_index = (
+                    company_names.index(st.session_state.search_selection)
+                    if st.session_state.search_selection in company_names
+                    else 0
+                )
                 selected_company_name = st.selectbox(
-                    "Select a company to view details", company_names
+                    "Select a company to view details",
+                    company_names,
+                    index=selected_index,
                 )
 
                 selected_company = next(
@@ -344,6 +575,20 @@ def main():
                                 f"**Country:** {selected_company.get('country', 'N/A')}"
                             )
 
+                    if pipeline.vector_index is not None and st.button(
+                        "🧭 Find similar companies"
+                    ):
+                        with st.spinner("Looking for similar companies..."):
+                            similar = pipeline.similar_companies(selected_company)
+                        if not pipeline.vectors_ready.is_set():
+                            st.info("The semantic index is still being built. Please try again later.")
+                        elif not similar:
+                            st.info("No similar companies found yet.")
+                        for record, score in similar:
+                            st.markdown(
+                                f"- **{record['name']}** ({', '.join(record['datasets'])}) · similarity {score:.2f}"
+                            )
+
                     st.subheader("Website Content")
 
                     if not has_website:
@@ -362,47 +607,44 @@ def main():
                                 f"Finding more information from {selected_company['website']}..."
                             ):
                                 try:
-                                    response = requests.post(
-                                        pipeline.neuscraper_endpoint,
-                                        json={"url": selected_company["website"]},
-                                        timeout=60,
+                                    text = pipeline.neuscraper_client.extract(
+                                        selected_company["website"], use_cache=False
                                     )
 
-                                    if response.status_code == 200:
-                                        result = response.json()
-                                        if "Text" in result and result["Text"].strip():
-                                            selected_company["description"] = result[
-                                                "Text"
-                                            ]
-                                            st.session_state.current_company[
-                                                "description"
-                                            ] = result["Text"]
-
-                                            for i, company in enumerate(companies):
-                                                if (
-                                                    company["name"]
-                                                    == selected_company["name"]
-                                                ):
-                                                    companies[i]["description"] = (
-                                                        result["Text"]
-                                                    )
-                                                    break
-
-                                            pipeline.save_company_data(
-                                                companies,
-                                                st.session_state.current_dataset,
-                                            )
-                                            st.success(
-                                                "✅ Successfully gather more information from the website!"
-                                            )
-                                        else:
-                                            st.error(
-                                                "⛔ No relevant information could be extracted from the website. The website might have special formatting or anti-scraping measures."
-                                            )
+                                    if text.strip():
+                                        selected_company["description"] = text
+                                        st.session_state.current_company[
+                                            "description"
+                                        ] = text
+
+                                        for i, company in enumerate(companies):
+                                            if (
+                                                company["name"]
+                                                == selected_company["name"]
+                                            ):
+                                                companies[i]["description"] = text
+                                                break
+
+                                        pipeline.save_company_data(
+                                            companies,
+                                            st.session_state.current_dataset,
+                                        )
+                                        invalidate_dataset_cache()
+                                        st.success(
+                                            "✅ Successfully gather more information from the website!"
+                                        )
                                     else:
                                         st.error(
-                                            f"⛔ Failed to find {selected_company["website"]}"
+                                            "⛔ No relevant information could be extracted from the website. The website might have special formatting or anti-scraping measures."
                                         )
+                                except CircuitOpenError:
+                                    st.error(
+                                        "🔌 NeuScraper is failing repeatedly. Requests are paused for a moment, please try again shortly."
+                                    )
+                                except requests.exceptions.HTTPError:
+                                    st.error(
+                                        f"⛔ Failed to find {selected_company['website']}"
+                                    )
                                 except requests.exceptions.Timeout:
                                     st.error(
                                         "⏱️ Request to NeuScraper timed out. The website might be slow or unresponsive."
@@ -430,7 +672,9 @@ def main():
 
                             if st.button("💬 Chat about this company"):
                                 st.session_state.chat = create_chat_for_company(
-                                    pipeline.gemini_client, selected_company
+                                    pipeline.gemini_client,
+                                    selected_company,
+                                    pipeline.chat_cache,
                                 )
                                 st.session_state.chat_history = []
                                 st.success(
@@ -447,77 +691,106 @@ def main():
     with tab3:
         st.header("Chat with AI assistant about Companies")
 
-        if not st.session_state.current_company:
+        chat_mode = st.radio(
+            "Chat about", ["Selected company", "Whole dataset"], horizontal=True
+        )
+
+        if chat_mode == "Whole dataset":
+            if not st.session_state.current_dataset:
+                st.warning(
+                    "Please select or collect a dataset first in the Data Collection tab."
+                )
+            else:
+                if (
+                    not st.session_state.dataset_chat
+                    or st.session_state.dataset_chat_name
+                    != st.session_state.current_dataset
+                ):
+                    st.session_state.dataset_chat = create_chat_for_dataset(
+                        pipeline.gemini_client,
+                        load_cached_company_data(
+                            pipeline, st.session_state.current_dataset
+                        ),
+                        pipeline.summary_store,
+                        st.session_state.current_dataset,
+                        pipeline.chat_cache,
+                    )
+                    st.session_state.dataset_chat_name = (
+                        st.session_state.current_dataset
+                    )
+                    st.session_state.dataset_chat_history = []
+
+                render_chat(
+                    st.session_state.dataset_chat,
+                    st.session_state.dataset_chat_history,
+                    "Ask about the companies in this dataset...",
+                    key_prefix="dataset_",
+                )
+        elif not st.session_state.current_company:
             st.warning("Please select a company in the Company Explorer tab first.")
         else:
-            chat_container = st.container()
-
             if not st.session_state.chat:
                 st.session_state.chat = create_chat_for_company(
-                    pipeline.gemini_client, st.session_state.current_company
+                    pipeline.gemini_client,
+                    st.session_state.current_company,
+                    pipeline.chat_cache,
                 )
                 st.session_state.chat_history = []
 
-            with chat_container:
-                for i, msg in enumerate(st.session_state.chat_history):
-                    if msg["role"] == "user":
-                        message(msg["content"], is_user=True, key=f"{i}_user")
-                    else:
-                        message(msg["content"], is_user=False, key=f"{i}_ai")
+            render_chat(
+                st.session_state.chat,
+                st.session_state.chat_history,
+                "Ask about this company...",
+            )
 
-            user_question = st.chat_input("Ask about this company...")
 
-            if user_question:
-                st.session_state.chat_history.append(
-                    {"role": "user", "content": user_question}
-                )
-                message(user_question, is_user=True, key="latest_user")
+def render_chat(chat, chat_history, placeholder, key_prefix=""):
+    chat_container = st.container()
+
+    with chat_container:
+        for i, msg in enumerate(chat_history):
+            if msg["role"] == "user":
+                message(msg["content"], is_user=True, key=f"{key_prefix}{i}_user")
+            else:
+                message(msg["content"], is_user=False, key=f"{key_prefix}{i}_ai")
 
-                try:
-                    with st.spinner("AI assistant is thinking..."):
-                        response = st.session_state.chat.send_message(user_question)
-                        bot_reply = response.text
+    user_question = st.chat_input(placeholder)
 
-                    st.session_state.chat_history.append(
-                        {"role": "assistant", "content": bot_reply}
-                    )
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Error getting response: {str(e)}")
-
-
-def create_chat_for_company(client, company):
-    company_info = f"""
-    Company Name: {company.get('name', 'N/A')}
-    Address: {company.get('street_address', '')} {company.get('postal_code', '')}
-    Country: {company.get('country', 'N/A')}
-    Phone: {company.get('phone', 'N/A')}
-    Website: {company.get('website', 'N/A')}
-    
-    Company Description:
-    {company.get('description', 'No description available')}
-    """
-
-    system_prompt = f"""You are a helpful business analyst assistant. Use the following information about the company to answer questions:
-    
-    {company_info}
-    
-    When answering questions, only use information from this content. If the information is not in the content, say so clearly.
-    Be concise and professional in your answers.
-    """
+    if user_question:
+        chat_history.append({"role": "user", "content": user_question})
+        message(user_question, is_user=True, key=f"{key_prefix}latest_user")
+
+        try:
+            with st.spinner("AI assistant is thinking..."):
+                response = chat.send_message(user_question)
+                bot_reply = response.text
 
+            chat_history.append({"role": "assistant", "content": bot_reply})
+            st.rerun()
+        except Exception as e:
+            st.error(f"Error getting response: {str(e)}")
+
+
+def create_chat_for_company(client, company, response_cache=None):
     try:
-        chat = client.chats.create(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt, seed=42
-            ),
-        )
-        return chat
+        return CompanyChat(client, company, response_cache=response_cache)
     except Exception as e:
         print(f"Error creating chat: {str(e)}")
         return None
 
 
+def create_chat_for_dataset(
+    client, companies, summary_store, dataset_name, response_cache=None
+):
+    try:
+        summaries = summary_store.update(companies)
+        return DatasetChat(
+            client, companies, summaries, dataset_name, response_cache=response_cache
+        )
+    except Exception as e:
+        print(f"Error creating dataset chat: {str(e)}")
+        return None
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,386 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import Future
+
+from google.genai import types
+
+CHAT_MODEL = "gemini-2.0-flash"
+
+# Too common to help ranking, and each would touch almost every posting list
+STOPWORDS = {
+    "a", "an", "and", "are", "do", "does", "for", "in", "is", "it", "of", "on",
+    "or", "the", "these", "this", "to", "what", "which", "who", "with",
+}
+
+
+def tokenize(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def split_passages(text, max_words=120, overlap=30):
+    """Split `text` into overlapping windows of at most `max_words` words."""
+    words = (text or "").split()
+    if not words:
+        return []
+    step = max(1, max_words - overlap)
+    passages = []
+    for start in range(0, len(words), step):
+        passages.append(" ".join(words[start : start + max_words]))
+        if start + max_words >= len(words):
+            break
+    return passages
+
+
+class PassageRetriever:
+    """In-memory BM25 over a list of passages.
+
+    Scores are accumulated from per-term postings, so a query only touches
+    the passages that contain one of its terms.
+    """
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        lengths = []
+        for i, passage in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((i, tf))
+        avg_length = sum(lengths) / len(lengths) if passages else 0.0
+        self.norms = [k1 * (1 - b + b * length / max(avg_length, 1e-9)) for length in lengths]
+        n = len(passages)
+        self.idf = {
+            term: math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def scores(self, query):
+        """Return `{passage index: score}` for passages matching any query term."""
+        scores = {}
+        for term in set(tokenize(query)) - STOPWORDS:
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.norms[i])
+        return scores
+
+    def top_k(self, query, k=4):
+        """Indices of the `k` best passages, in document order."""
+        if len(self.passages) <= k:
+            return list(range(len(self.passages)))
+        scores = self.scores(query)
+        if not scores:
+            # Nothing matched (e.g. "what does this company do?"): the start of
+            # the page is usually the best summary
+            return list(range(k))
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        return sorted(ranked)
+
+
+class CachedResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class ChatResponseCache:
+    """Caches chat answers and coalesces identical in-flight requests.
+
+    Answers are persisted in `store` (anything with `get_text`/`put`, e.g.
+    `FetchCache`) under a hash of everything that determines them. Calls
+    with a key that is already being answered wait for that call instead
+    of going upstream again. Generation uses a fixed seed, so a cached
+    answer is the one the model would give.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    @staticmethod
+    def key(*parts):
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return "gemini:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_or_call(self, key, call):
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                # The owning call may have stored its answer and left since the check above
+                cached = self._cached(key)
+                if cached is not None:
+                    return cached
+                future = Future()
+                self.in_flight[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            response = call()
+            if self.store is not None and response.text:
+                self.store.put(key, response.text)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def _cached(self, key):
+        if self.store is None:
+            return None
+        cached = self.store.get_text(key)
+        return CachedResponse(cached) if cached is not None else None
+
+
+class RetrievalChat(ABC):
+    """Base for chats that attach retrieved context to each question.
+
+    Subclasses set `system_prompt` and implement `build_turn`. Earlier turns
+    are replayed as plain question/answer pairs without their context, so
+    only the current question pays for retrieved text.
+    """
+
+    def __init__(self, client, model=CHAT_MODEL, response_cache=None):
+        self.client = client
+        self.model = model
+        self.response_cache = response_cache
+        self.history = []
+        self.system_prompt = ""
+        self.content_hash = ""
+
+    @abstractmethod
+    def build_turn(self, question):
+        """Return the user message for `question`, with its retrieved context."""
+
+    def send_message(self, question):
+        contents = list(self.history)
+        contents.append(types.Content(role="user", parts=[types.Part(text=self.build_turn(question))]))
+
+        def call():
+            return self.client.models.generate_content(
+                model=self.model,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    system_instruction=self.system_prompt, seed=42
+                ),
+            )
+
+        if self.response_cache is None:
+            response = call()
+        else:
+            key = ChatResponseCache.key(
+                self.model,
+                self.content_hash,
+                self.system_prompt,
+                [(c.role, c.parts[0].text) for c in self.history],
+                question,
+            )
+            response = self.response_cache.get_or_call(key, call)
+
+        self.history.append(types.Content(role="user", parts=[types.Part(text=question)]))
+        self.history.append(types.Content(role="model", parts=[types.Part(text=response.text or "")]))
+        return response
+
+
+class CompanyChat(RetrievalChat):
+    """Chat about one company that sends only the relevant description passages.
+
+    The system prompt carries the company's contact details. For each
+    question the `top_k` description passages are retrieved and sent with
+    that turn only, so the prompt does not grow with the size of the page.
+    """
+
+    def __init__(
+        self, client, company, top_k=4, max_words=120, model=CHAT_MODEL, response_cache=None
+    ):
+        super().__init__(client, model, response_cache)
+        self.company = company
+        self.content_hash = CompanySummaryStore.key(company)
+        self.top_k = top_k
+        self.retriever = PassageRetriever(
+            split_passages(company.get("description", ""), max_words=max_words)
+        )
+        self.system_prompt = f"""You are a helpful business analyst assistant. Use the following information about the company to answer questions:
+
+    Company Name: {company.get('name', 'N/A')}
+    Address: {company.get('street_address', '')} {company.get('postal_code', '')}
+    Country: {company.get('country', 'N/A')}
+    Phone: {company.get('phone', 'N/A')}
+    Website: {company.get('website', 'N/A')}
+
+    Each question comes with excerpts from the company website that are relevant to it.
+    When answering questions, only use information from this content. If the information is not in the content, say so clearly.
+    Be concise and professional in your answers.
+    """
+
+    def build_turn(self, question):
+        indices = self.retriever.top_k(question, self.top_k)
+        if not indices:
+            return f"No website description is available.\n\nQuestion: {question}"
+        excerpts = "\n\n".join(f"[{i + 1}] {self.retriever.passages[i]}" for i in indices)
+        return f"Website excerpts:\n{excerpts}\n\nQuestion: {question}"
+
+
+def summarize_company(company, max_words=50):
+    """Extractive summary: the leading sentences of the description."""
+    summary = []
+    for sentence in re.split(r"(?<=[.!?])\s+", " ".join((company.get("description") or "").split())):
+        summary.extend(sentence.split())
+        if len(summary) >= max_words:
+            break
+    return " ".join(summary[:max_words])
+
+
+class CompanySummaryStore:
+    """Per-company summaries, computed once per distinct company content.
+
+    Summaries are keyed by a hash of the fields they depend on and kept in
+    one JSON file, so re-saving or re-loading a dataset only summarizes
+    companies whose description changed. `summarizer` can be swapped for
+    e.g. an LLM call; the default is the local extractive one. The store
+    is shared by every Streamlit session, so access holds `lock`.
+    """
+
+    def __init__(self, path, summarizer=summarize_company):
+        self.path = path
+        self.summarizer = summarizer
+        self.summaries = {}
+        self.dirty = False
+        self.lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.summaries = json.load(f)
+
+    @staticmethod
+    def key(company):
+        content = "\x1f".join(
+            company.get(field) or "" for field in ("name", "url", "website", "description")
+        )
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def get(self, company):
+        key = self.key(company)
+        with self.lock:
+            if key not in self.summaries:
+                self.summaries[key] = self.summarizer(company)
+                self.dirty = True
+            return self.summaries[key]
+
+    def update(self, companies):
+        with self.lock:
+            summaries = [self.get(company) for company in companies]
+            self.save()
+            return summaries
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            # Written aside and swapped in, so a reader never sees a partial file
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.summaries, f, ensure_ascii=False)
+            os.replace(self.path + ".tmp", self.path)
+            self.dirty = False
+
+
+class DatasetChat(RetrievalChat):
+    """Chat over a whole dataset within a fixed prompt budget.
+
+    Every company contributes a profile passage (name, address, summary)
+    and its description passages to one BM25 index. A question is answered
+    from the best-scoring companies only: each gets its profile plus its
+    best matching passage, added in rank order until `max_prompt_words` is
+    reached, so the prompt size is independent of the dataset size.
+    """
+
+    def __init__(
+        self,
+        client,
+        companies,
+        summaries,
+        dataset_name="",
+        max_prompt_words=2000,
+        passage_words=80,
+        model=CHAT_MODEL,
+        response_cache=None,
+    ):
+        super().__init__(client, model, response_cache)
+        self.companies = companies
+        self.content_hash = hashlib.sha256(
+            "".join(CompanySummaryStore.key(c) for c in companies).encode("utf-8")
+        ).hexdigest()
+        self.summaries = summaries
+        self.max_prompt_words = max_prompt_words
+
+        passages, self.owners = [], []
+        self.profiles = []
+        for i, (company, summary) in enumerate(zip(companies, summaries)):
+            profile = (
+                f"{company.get('name', 'N/A')} | {company.get('address', '')} | "
+                f"Website: {company.get('website') or 'N/A'} | {summary}"
+            )
+            self.profiles.append(profile)
+            passages.append(profile)
+            self.owners.append(i)
+            for passage in split_passages(company.get("description", ""), max_words=passage_words):
+                passages.append(passage)
+                self.owners.append(i)
+        self.retriever = PassageRetriever(passages)
+
+        with_website = sum(1 for c in companies if c.get("website"))
+        with_description = sum(1 for c in companies if c.get("description"))
+        self.system_prompt = f"""You are a helpful business analyst assistant answering questions about a dataset of companies{f" ({dataset_name})" if dataset_name else ""}.
+    The dataset has {len(companies)} companies; {with_website} list a website and {with_description} have website content.
+
+    Each question comes with the profiles of the companies most relevant to it and, where available, a matching excerpt from their website.
+    Only use this content in your answers and name the companies you refer to. The companies shown may be a subset of the dataset; say so when it matters.
+    Be concise and professional in your answers.
+    """
+
+    def rank_companies(self, question):
+        """Return `[(company index, best passage index or None)]`, best first."""
+        best = {}
+        for passage, score in self.retriever.scores(question).items():
+            owner = self.owners[passage]
+            if owner not in best or score > best[owner][0]:
+                best[owner] = (score, passage)
+        ranked = sorted(best, key=lambda owner: best[owner][0], reverse=True)
+        return [(owner, best[owner][1]) for owner in ranked]
+
+    def build_turn(self, question):
+        ranked = self.rank_companies(question)
+        if not ranked:
+            ranked = [(i, None) for i in range(len(self.companies))]
+
+        blocks, used = [], 0
+        for owner, passage in ranked:
+            block = f"- {self.profiles[owner]}"
+            passage_text = self.retriever.passages[passage] if passage is not None else ""
+            if passage_text and passage_text != self.profiles[owner]:
+                block += f"\n  Excerpt: {passage_text}"
+            words = len(block.split())
+            if used + words > self.max_prompt_words:
+                break
+            blocks.append(block)
+            used += words
+
+        header = f"Relevant companies ({len(blocks)} of {len(self.companies)}):"
+        return f"{header}\n" + "\n".join(blocks) + f"\n\nQuestion: {question}"
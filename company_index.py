@@ -0,0 +1,242 @@
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+LEGAL_FORMS = {"pt", "cv", "tbk", "ud", "persero", "ltd", "inc", "co", "corp"}
+DETAIL_FIELDS = ("street_address", "postal_code", "country", "phone", "website")
+
+
+def normalize_name(name):
+    words = re.sub(r"[^\w\s]", " ", (name or "").lower()).split()
+    return " ".join(w for w in words if w not in LEGAL_FORMS)
+
+
+def normalize_phone(phone):
+    digits = re.sub(r"\D", "", phone or "")
+    if digits.startswith("62"):
+        digits = "0" + digits[2:]
+    return digits if len(digits) >= 6 else ""
+
+
+def normalize_domain(website):
+    if not website:
+        return ""
+    if "//" not in website:
+        website = "//" + website
+    domain = (urlparse(website).hostname or "").lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+def normalize_address(address):
+    return " ".join(re.sub(r"[^\w\s]", " ", (address or "").lower()).split())
+
+
+def is_dataset_file(path):
+    """True if `path` holds a JSON list, i.e. a saved dataset rather than other JSON state."""
+    with open(path, "rb") as f:
+        head = f.read(64).lstrip()
+    return head.startswith(b"[")
+
+
+def company_keys(company):
+    """Identity keys for a company record, strongest first.
+
+    A name alone is not a key: different companies share names, so it only
+    identifies a company together with its postal code or address.
+    """
+    keys = []
+    domain = normalize_domain(company.get("website"))
+    if domain:
+        keys.append("domain:" + domain)
+    phone = normalize_phone(company.get("phone"))
+    if phone:
+        keys.append("phone:" + phone)
+    if company.get("url"):
+        keys.append("listing:" + company["url"])
+    name = normalize_name(company.get("name"))
+    if name:
+        postal_code = re.sub(r"\s", "", company.get("postal_code") or "")
+        if postal_code:
+            keys.append(f"name_postal:{name}|{postal_code}")
+        address = normalize_address(company.get("street_address") or company.get("address"))
+        if address:
+            keys.append(f"name_address:{name}|{address}")
+    return keys
+
+
+class CompanyIndex:
+    """Deduplicated company entities shared by every dataset in `data_dir`.
+
+    Saved records are appended to `company_index.jsonl`; the in-memory
+    key -> entity dicts are rebuilt by replaying the log and refreshed by
+    reading only the bytes appended since the last load. Datasets written
+    before the index existed are folded in once on first use. Log entries
+    are numbered in replay order; `sequence` is the latest number and each
+    entity keeps the number of its latest entry in `seq`. One instance is
+    shared by every Streamlit session, so writes hold `lock`.
+    """
+
+    def __init__(self, data_dir, max_age=30 * 24 * 3600):
+        self.data_dir = data_dir
+        self.max_age = max_age
+        self.path = os.path.join(data_dir, "company_index.jsonl")
+        self.entities = {}
+        self.keys = {}
+        self.datasets = set()
+        self.offset = 0
+        self.sequence = 0
+        self.lock = threading.RLock()
+        self.refresh()
+        self._index_untracked_datasets()
+
+    def refresh(self):
+        with self.lock:
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                f.seek(self.offset)
+                while True:
+                    line = f.readline()
+                    # A partial trailing line is left for the next refresh
+                    if not line or not line.endswith("\n"):
+                        break
+                    self._apply(json.loads(line))
+                    self.offset = f.tell()
+
+    def changed_since(self, sequence):
+        """Return `(entities, sequence)`: entities changed after `sequence`, and the current one."""
+        with self.lock:
+            changed = [entity for entity in self.entities.values() if entity["seq"] > sequence]
+            return changed, self.sequence
+
+    def lookup(self, company):
+        for key in company_keys(company):
+            entity_id = self.keys.get(key)
+            if entity_id is not None:
+                return self.entities[entity_id]
+        return None
+
+    def fresh_details(self, company):
+        entity = self.lookup(company)
+        if entity and self._is_fresh(entity.get("details_at")):
+            return entity
+        return None
+
+    def fresh_content(self, company):
+        entity = self.lookup(company)
+        if entity and entity["record"].get("description") and self._is_fresh(
+            entity.get("content_at")
+        ):
+            return entity
+        return None
+
+    def add_many(self, companies, dataset, at=None):
+        """Merge `companies` into the index and return the entities they changed.
+
+        Records already indexed for `dataset` with identical fields are not
+        logged again, so re-saving a dataset only appends what was edited.
+        """
+        with self.lock:
+            return self._add_many(companies, dataset, at)
+
+    def _add_many(self, companies, dataset, at):
+        self.refresh()
+        now = at if at is not None else time.time()
+        touched = {}
+        with open(self.path, "a", encoding="utf-8") as f:
+            for company in companies:
+                entity = self.lookup(company)
+                if entity and self._is_unchanged(entity, company, dataset):
+                    continue
+                entry = {
+                    "id": entity["id"] if entity else self._next_id(),
+                    "dataset": dataset,
+                    "at": now,
+                    "record": company,
+                }
+                self._apply(entry)
+                touched[entry["id"]] = self.entities[entry["id"]]
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            # An empty dataset still needs a marker so it is not re-imported
+            if not companies and dataset not in self.datasets:
+                entry = {"id": None, "dataset": dataset, "at": now, "record": None}
+                self._apply(entry)
+                f.write(json.dumps(entry) + "\n")
+            self.offset = f.tell()
+        return list(touched.values())
+
+    def __len__(self):
+        return len(self.entities)
+
+    def _apply(self, entry):
+        self.sequence += 1
+        self.datasets.add(entry["dataset"])
+        if entry["id"] is None:
+            return
+
+        entity = self.entities.setdefault(
+            entry["id"],
+            {
+                "id": entry["id"],
+                "record": {},
+                "datasets": [],
+                "updated_at": 0.0,
+                "details_at": None,
+                "content_at": None,
+            },
+        )
+        record = entry["record"]
+        # Older entries (e.g. back-filled datasets) only fill in missing fields
+        newer = entry["at"] >= entity["updated_at"]
+        for field, value in record.items():
+            if field not in entity["record"] or (value and (newer or not entity["record"][field])):
+                entity["record"][field] = value
+        entity["updated_at"] = max(entity["updated_at"], entry["at"])
+        entity["seq"] = self.sequence
+        if entry["dataset"] not in entity["datasets"]:
+            entity["datasets"].append(entry["dataset"])
+        if any(record.get(field) for field in DETAIL_FIELDS):
+            entity["details_at"] = max(entity["details_at"] or 0.0, entry["at"])
+        if record.get("description"):
+            entity["content_at"] = max(entity["content_at"] or 0.0, entry["at"])
+
+        for key in company_keys(entity["record"]):
+            self.keys.setdefault(key, entry["id"])
+
+    @staticmethod
+    def _is_unchanged(entity, company, dataset):
+        record = entity["record"]
+        # Empty values never overwrite indexed ones (see _apply), so they count as unchanged
+        return dataset in entity["datasets"] and all(
+            field in record and (record[field] == value or not value)
+            for field, value in company.items()
+        )
+
+    def _next_id(self):
+        return len(self.entities)
+
+    def _is_fresh(self, timestamp):
+        return timestamp is not None and time.time() - timestamp <= self.max_age
+
+    def _index_untracked_datasets(self):
+        for filename in sorted(os.listdir(self.data_dir)):
+            if not filename.endswith(".json"):
+                continue
+            dataset = filename[: -len(".json")]
+            if dataset in self.datasets:
+                continue
+            json_path = os.path.join(self.data_dir, filename)
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    companies = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {filename} while building company index: {str(e)}")
+                continue
+            if not isinstance(companies, list):
+                print(f"Skipping {filename} while building company index: not a dataset")
+                continue
+            # Freshness of old datasets is judged by when they were written
+            self.add_many(companies, dataset, at=os.path.getmtime(json_path))
@@ -0,0 +1,128 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class FetchCache:
+    """Persistent URL -> response body cache backed by SQLite.
+
+    Bodies are stored once per sha256 content hash, so pages that several
+    urls resolve to (or that are re-fetched unchanged) share one blob.
+    Entries older than `ttl` seconds are misses; once the stored bodies
+    exceed `max_bytes` the least recently used urls are evicted.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL REFERENCES blobs(hash),
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS urls_accessed_at ON urls(accessed_at);
+            CREATE INDEX IF NOT EXISTS urls_hash ON urls(hash);
+            """
+        )
+        self.conn.commit()
+        self.stored_bytes = self._total_bytes()
+
+    def get(self, url):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT blobs.body, urls.fetched_at FROM urls "
+                "JOIN blobs ON blobs.hash = urls.hash WHERE urls.url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            body, fetched_at = row
+            if now - fetched_at > self.ttl:
+                return None
+            self.conn.execute(
+                "UPDATE urls SET accessed_at = ? WHERE url = ?", (now, url)
+            )
+            self.conn.commit()
+        return bytes(body)
+
+    def get_text(self, url):
+        body = self.get(url)
+        return body.decode("utf-8") if body is not None else None
+
+    def put(self, url, body):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        now = time.time()
+        with self.lock:
+            previous = self.conn.execute(
+                "SELECT hash FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO blobs (hash, body, size) VALUES (?, ?, ?)",
+                (digest, sqlite3.Binary(body), len(body)),
+            ).rowcount
+            self.stored_bytes += len(body) if inserted else 0
+            self.conn.execute(
+                "INSERT OR REPLACE INTO urls (url, hash, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (url, digest, now, now),
+            )
+            if previous is not None and previous[0] != digest:
+                self._drop_blobs([previous[0]])
+            if self.stored_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _total_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _drop_blobs(self, hashes):
+        # Only blobs no longer referenced by any url are removed
+        for digest in hashes:
+            if self.conn.execute(
+                "SELECT 1 FROM urls WHERE hash = ? LIMIT 1", (digest,)
+            ).fetchone():
+                continue
+            size = self.conn.execute(
+                "DELETE FROM blobs WHERE hash = ? RETURNING size", (digest,)
+            ).fetchone()
+            if size is not None:
+                self.stored_bytes -= size[0]
+
+    def _evict(self):
+        # Expired entries go first, then least recently used ones
+        expired = self.conn.execute(
+            "DELETE FROM urls WHERE fetched_at < ? RETURNING hash",
+            (time.time() - self.ttl,),
+        ).fetchall()
+        self._drop_blobs({h for (h,) in expired})
+
+        while self.stored_bytes > self.max_bytes:
+            oldest = self.conn.execute(
+                "SELECT url, hash FROM urls ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                break
+            for url, digest in oldest:
+                self.conn.execute("DELETE FROM urls WHERE url = ?", (url,))
+                self._drop_blobs([digest])
+                if self.stored_bytes <= self.max_bytes:
+                    break
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
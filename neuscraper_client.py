@@ -0,0 +1,143 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a service after repeated failures.
+
+    After `failure_threshold` consecutive failures the breaker opens and every
+    call fails fast. Once `reset_timeout` seconds have passed a single probe
+    call is let through; its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class NeuScraperClient:
+    """Keeps up to `max_in_flight` requests running against a NeuScraper service."""
+
+    def __init__(
+        self,
+        endpoint,
+        max_in_flight=4,
+        timeout=60,
+        failure_threshold=5,
+        reset_timeout=30.0,
+        cache=None,
+        crawl_pages=1,
+    ) -> None:
+        self.endpoint = endpoint
+        self.cache = cache
+        # > 1 asks the service to also extract up to that many same-site pages
+        self.crawl_pages = crawl_pages
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        # One pooled session so keep-alive connections are reused across calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def extract(self, url, use_cache=True):
+        cache_key = f"{self.endpoint}#{url}"
+        payload = {"url": url}
+        if self.crawl_pages > 1:
+            cache_key += f"#crawl={self.crawl_pages}"
+            payload.update(crawl=True, max_pages=self.crawl_pages)
+        if use_cache and self.cache is not None:
+            cached = self.cache.get_text(cache_key)
+            if cached is not None:
+                return cached
+
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"NeuScraper circuit is open, skipping {url}")
+
+        # Every way a call can end is recorded, so a half-open probe never stays pending
+        try:
+            response = self.session.post(
+                self.endpoint, json=payload, timeout=self.timeout
+            )
+            text = response.json()["Text"] if response.ok else None
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        # 4xx means the target site could not be scraped, not that the service is down
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        response.raise_for_status()
+        if self.cache is not None and text.strip():
+            self.cache.put(cache_key, text)
+        return text
+
+    def extract_many(self, urls, on_result=None):
+        """Extract every url concurrently and return `{url: text or exception}`.
+
+        `on_result(done, total, url, result)` is called from the calling thread
+        as each url finishes, so it is safe to update Streamlit widgets from it.
+        """
+        results = {}
+        unique_urls = list(dict.fromkeys(urls))
+        total = len(unique_urls)
+        if total == 0:
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            futures = {executor.submit(self.extract, url): url for url in unique_urls}
+            for done, future in enumerate(as_completed(futures), start=1):
+                url = futures[future]
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    results[url] = e
+                if on_result is not None:
+                    on_result(done, total, url, results[url])
+
+        return results
+
+    def close(self):
+        self.session.close()
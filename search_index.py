@@ -0,0 +1,115 @@
+import json
+import re
+import sqlite3
+import threading
+
+
+class CompanySearchIndex:
+    """Persistent full-text index over company entities.
+
+    Uses an SQLite FTS5 table (an on-disk inverted index with BM25 ranking)
+    with one row per `CompanyIndex` entity, so a company that appears in
+    several datasets is returned once. Rows are replaced in place whenever
+    `save_company_data` writes new records for an entity. The last synced
+    `CompanyIndex.sequence` is stored with the rows, so `sync` re-indexes
+    exactly the entities changed since, whoever appended them.
+    """
+
+    # BM25 column weights for name, address and description
+    WEIGHTS = (10.0, 3.0, 1.0)
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS companies USING fts5(
+                name, address, description, record UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+
+    def add_entities(self, entities, sequence=None):
+        rows = []
+        for entity in entities:
+            record = entity["record"]
+            address = " ".join(
+                part
+                for part in (record.get("address"), record.get("street_address"))
+                if part
+            )
+            stored = dict(record, datasets=entity["datasets"])
+            rows.append(
+                (
+                    entity["id"],
+                    record.get("name", ""),
+                    address,
+                    record.get("description", ""),
+                    json.dumps(stored, ensure_ascii=False),
+                )
+            )
+
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM companies WHERE rowid = ?", [(row[0],) for row in rows]
+            )
+            self.conn.executemany(
+                "INSERT INTO companies (rowid, name, address, description, record) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            if sequence is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (name, value) VALUES ('sequence', ?)",
+                    (sequence,),
+                )
+            self.conn.commit()
+
+    def synced_sequence(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM sync_state WHERE name = 'sequence'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def sync(self, company_index):
+        """Index every entity changed since the last sync, including ones merged or updated in place."""
+        company_index.refresh()
+        synced = self.synced_sequence()
+        if synced > company_index.sequence:
+            # The company log was replaced; start over
+            synced = 0
+        entities, sequence = company_index.changed_since(synced)
+        self.add_entities(entities, sequence)
+
+    def search(self, query, limit=20):
+        """Return up to `limit` `(record, snippet)` pairs ranked by BM25."""
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+
+        # Quote every term so user input can never be parsed as FTS syntax;
+        # the last term is a prefix so results show up while typing
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT record, snippet(companies, 2, '**', '**', '…', 16) "
+                "FROM companies WHERE companies MATCH ? "
+                "ORDER BY bm25(companies, ?, ?, ?) LIMIT ?",
+                (match, *self.WEIGHTS, limit),
+            ).fetchall()
+        return [(json.loads(record), snippet) for record, snippet in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
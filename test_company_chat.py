@@ -0,0 +1,188 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from company_chat import (
+    ChatResponseCache,
+    CompanyChat,
+    CompanySummaryStore,
+    DatasetChat,
+    PassageRetriever,
+    summarize_company,
+)
+
+
+def test_top_k_returns_best_passages_in_document_order():
+    passages = [
+        "We are a family business founded in 1990.",
+        "Our cloud hosting plans include managed backups.",
+        "Contact us by phone or email.",
+        "Cloud hosting and cloud storage for enterprises.",
+        "Visit our office in Jakarta.",
+    ]
+    retriever = PassageRetriever(passages)
+
+    assert retriever.top_k("cloud hosting", k=2) == [1, 3]
+
+
+def test_top_k_falls_back_to_leading_passages_without_matches():
+    passages = ["first", "second", "third", "fourth"]
+    retriever = PassageRetriever(passages)
+
+    assert retriever.top_k("what does this company do?", k=2) == [0, 1]
+
+
+def test_top_k_returns_everything_when_there_are_few_passages():
+    retriever = PassageRetriever(["only one"])
+
+    assert retriever.top_k("anything", k=4) == [0]
+
+
+def make_company(i, description):
+    return {"name": f"Company {i}", "address": f"Street {i}", "description": description}
+
+
+def test_dataset_chat_turn_stays_within_word_budget():
+    companies = [
+        make_company(i, "cloud hosting " + " ".join(f"word{i}_{j}" for j in range(200)))
+        for i in range(50)
+    ]
+    summaries = [summarize_company(c) for c in companies]
+    chat = DatasetChat(None, companies, summaries, max_prompt_words=300, passage_words=80)
+
+    turn = chat.build_turn("Who offers cloud hosting?")
+    context = turn.split("\n\nQuestion:")[0].split("\n", 1)[1]
+
+    assert len(context.split()) <= 300
+    assert turn.startswith("Relevant companies (")
+    shown = int(turn.split("(")[1].split(" of ")[0])
+    assert 0 < shown < len(companies)
+    assert turn.endswith("Question: Who offers cloud hosting?")
+
+
+def test_summary_store_persists_and_only_summarizes_new_content(tmp_path):
+    path = tmp_path / "summaries.json"
+    calls = []
+
+    def summarizer(company):
+        calls.append(company["name"])
+        return "summary of " + company["name"]
+
+    companies = [make_company(1, "First."), make_company(2, "Second.")]
+    store = CompanySummaryStore(str(path), summarizer=summarizer)
+    assert store.update(companies) == ["summary of Company 1", "summary of Company 2"]
+
+    reloaded = CompanySummaryStore(str(path), summarizer=summarizer)
+    changed = dict(companies[1], description="Rewritten.")
+    assert reloaded.update([companies[0], changed]) == ["summary of Company 1", "summary of Company 2"]
+    assert calls == ["Company 1", "Company 2", "Company 2"]
+    assert len(CompanySummaryStore(str(path)).summaries) == 3
+
+
+
+def test_summary_store_keeps_concurrent_updates(tmp_path):
+    path = tmp_path / "summaries.json"
+
+    def slow_summarizer(company):
+        time.sleep(0.001)
+        return "summary of " + company["name"]
+
+    store = CompanySummaryStore(str(path), summarizer=slow_summarizer)
+
+    def update(worker):
+        companies = [make_company(f"{worker}-{i}", "Text.") for i in range(10)]
+        store.update(companies)
+        # Each update is on disk when it returns, whatever other sessions are doing
+        saved = CompanySummaryStore(str(path)).summaries
+        return all(CompanySummaryStore.key(c) in saved for c in companies)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(pool.map(update, range(8)))
+    assert len(CompanySummaryStore(str(path)).summaries) == 80
+
+class MemoryStore:
+    def __init__(self):
+        self.items = {}
+
+    def get_text(self, key):
+        return self.items.get(key)
+
+    def put(self, key, text):
+        self.items[key] = text
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_response_cache_coalesces_concurrent_identical_calls():
+    cache = ChatResponseCache(MemoryStore())
+    calls = []
+    release = threading.Event()
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return StubResponse("answer")
+
+    key = ChatResponseCache.key("model", "question")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.get_or_call, key, call) for _ in range(8)]
+        time.sleep(0.2)
+        release.set()
+        texts = [future.result().text for future in futures]
+
+    assert texts == ["answer"] * 8
+    assert len(calls) == 1
+    assert cache.get_or_call(key, call).text == "answer"
+    assert len(calls) == 1
+
+
+
+def test_response_cache_rechecks_store_after_owner_finishes():
+    cache = ChatResponseCache(MemoryStore())
+    key = ChatResponseCache.key("model", "question")
+    calls = []
+
+    def call():
+        calls.append(1)
+        return StubResponse("answer")
+
+    class RacyStore(MemoryStore):
+        """The first lookup misses, and an identical call completes right after it."""
+
+        def __init__(self):
+            super().__init__()
+            self.racing = True
+
+        def get_text(self, key):
+            text = super().get_text(key)
+            if self.racing:
+                self.racing = False
+                cache.get_or_call(key, call)
+            return text
+
+    cache.store = RacyStore()
+    assert cache.get_or_call(key, call).text == "answer"
+    assert len(calls) == 1
+
+def test_company_chat_repeats_are_served_from_cache():
+    class StubModels:
+        def __init__(self):
+            self.calls = 0
+
+        def generate_content(self, model, contents, config):
+            self.calls += 1
+            return StubResponse(f"answer {self.calls}")
+
+    client = type("StubClient", (), {})()
+    client.models = StubModels()
+    cache = ChatResponseCache(MemoryStore())
+    company = make_company(1, "We build cloud hosting platforms.")
+
+    first = CompanyChat(client, company, response_cache=cache).send_message("What do they do?")
+    second = CompanyChat(client, company, response_cache=cache).send_message("What do they do?")
+
+    assert first.text == second.text == "answer 1"
+    assert client.models.calls == 1
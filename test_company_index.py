@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+
+from company_index import CompanyIndex, company_keys
+
+
+def company(name, **fields):
+    return dict({"name": name}, **fields)
+
+
+def log_lines(index):
+    with open(index.path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_name_alone_does_not_merge_companies(tmp_path):
+    index = CompanyIndex(str(tmp_path))
+    first, second = index.add_many(
+        [company("PT Maju Jaya", postal_code="10110"), company("Maju Jaya", postal_code="60111")],
+        "a",
+    )
+
+    assert first["id"] != second["id"]
+    assert company_keys(company("Maju Jaya")) == []
+
+
+def test_newer_values_win_and_empty_values_never_overwrite(tmp_path):
+    index = CompanyIndex(str(tmp_path))
+    index.add_many([company("Acme", website="acme.co.id", phone="021 555 0100")], "a", at=100.0)
+    index.add_many([company("Acme Indonesia", website="https://www.acme.co.id/", phone="")], "b", at=200.0)
+
+    entity = index.lookup(company("", website="acme.co.id"))
+    assert entity["record"]["name"] == "Acme Indonesia"
+    assert entity["record"]["phone"] == "021 555 0100"
+    assert entity["datasets"] == ["a", "b"]
+    assert len(index) == 1
+
+
+def test_older_entries_only_fill_missing_fields(tmp_path):
+    index = CompanyIndex(str(tmp_path))
+    index.add_many([company("Acme New", website="acme.co.id")], "new", at=200.0)
+    index.add_many([company("Acme Old", website="acme.co.id", phone="0215550100")], "old", at=100.0)
+
+    record = index.lookup(company("", website="acme.co.id"))["record"]
+    assert record["name"] == "Acme New"
+    assert record["phone"] == "0215550100"
+
+
+def test_resaving_unchanged_records_appends_nothing(tmp_path):
+    index = CompanyIndex(str(tmp_path))
+    companies = [company("Acme", website="acme.co.id"), company("Beta", phone="0215550101")]
+    index.add_many(companies, "a")
+    lines = log_lines(index)
+
+    assert index.add_many(companies, "a") == []
+    assert log_lines(index) == lines
+    index.add_many([], "empty")
+    index.add_many([], "empty")
+    assert len(log_lines(index)) == len(lines) + 1
+
+
+def test_refresh_reads_only_complete_lines_appended_elsewhere(tmp_path):
+    index = CompanyIndex(str(tmp_path))
+    other = CompanyIndex(str(tmp_path))
+    other.add_many([company("Acme", website="acme.co.id")], "a")
+
+    with open(index.path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": 1, "dataset": "b", "at": 1.0, "record": {"name": "Beta"}})[:20])
+    index.refresh()
+    assert index.lookup(company("", website="acme.co.id"))["datasets"] == ["a"]
+    assert len(index) == 1
+
+
+def test_untracked_datasets_are_indexed_once(tmp_path):
+    (tmp_path / "old.json").write_text(json.dumps([company("Acme", website="acme.co.id")]))
+    (tmp_path / "state.json").write_text(json.dumps({"not": "a dataset"}))
+
+    index = CompanyIndex(str(tmp_path))
+    assert len(index) == 1
+    lines = log_lines(index)
+    assert len(log_lines(CompanyIndex(str(tmp_path)))) == len(lines)
+
+
+def test_concurrent_saves_get_distinct_ids(tmp_path, monkeypatch):
+    index = CompanyIndex(str(tmp_path))
+    barrier = threading.Barrier(8)
+    apply = index._apply
+
+    def slow_apply(entry):
+        # Yield between picking an id and recording it, where unsynchronized saves collide
+        time.sleep(0.001)
+        apply(entry)
+
+    monkeypatch.setattr(index, "_apply", slow_apply)
+
+    def save(worker):
+        barrier.wait()
+        for i in range(20):
+            index.add_many([company(f"Company {worker}-{i}", phone=f"021{worker:02d}{i:04d}")], f"d{worker}")
+
+    threads = [threading.Thread(target=save, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(index) == 160
+    replayed = CompanyIndex(str(tmp_path))
+    assert {e["id"]: e["record"] for e in replayed.entities.values()} == {
+        e["id"]: e["record"] for e in index.entities.values()
+    }
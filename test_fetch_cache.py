@@ -0,0 +1,87 @@
+import pytest
+
+import fetch_cache
+from fetch_cache import FetchCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fetch_cache.time, "time", lambda: now[0])
+    return now
+
+
+def blob_count(cache):
+    return cache.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+
+def test_identical_bodies_are_stored_once(tmp_path, clock):
+    cache = FetchCache(str(tmp_path / "cache.sqlite"))
+    cache.put("http://a.example/", "same page")
+    cache.put("http://www.a.example/", "same page")
+
+    assert blob_count(cache) == 1
+    assert cache.stored_bytes == len("same page")
+    assert cache.get_text("http://www.a.example/") == "same page"
+
+    # Re-fetching a url with new content drops its old blob only once nothing points at it
+    cache.put("http://a.example/", "new page")
+    assert blob_count(cache) == 2
+    cache.put("http://www.a.example/", "new page")
+    assert blob_count(cache) == 1
+    assert cache.stored_bytes == len("new page")
+
+
+def test_entries_older_than_ttl_are_misses(tmp_path, clock):
+    cache = FetchCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.put("http://a.example/", "page")
+
+    clock[0] += 59
+    assert cache.get_text("http://a.example/") == "page"
+    clock[0] += 2
+    assert cache.get_text("http://a.example/") is None
+
+
+def test_least_recently_used_urls_are_evicted_past_max_bytes(tmp_path, clock):
+    cache = FetchCache(str(tmp_path / "cache.sqlite"), max_bytes=25)
+    cache.put("http://a.example/", "a" * 10)
+    clock[0] += 1
+    cache.put("http://b.example/", "b" * 10)
+    clock[0] += 1
+    assert cache.get_text("http://a.example/") == "a" * 10
+    clock[0] += 1
+    cache.put("http://c.example/", "c" * 10)
+
+    assert cache.get_text("http://b.example/") is None
+    assert cache.get_text("http://a.example/") == "a" * 10
+    assert cache.get_text("http://c.example/") == "c" * 10
+    assert cache.stored_bytes == 20
+
+
+def test_expired_entries_are_evicted_before_recently_used_ones(tmp_path, clock):
+    cache = FetchCache(str(tmp_path / "cache.sqlite"), ttl=60, max_bytes=25)
+    cache.put("http://old.example/", "o" * 10)
+    clock[0] += 30
+    cache.put("http://a.example/", "a" * 10)
+    clock[0] += 1
+    # Read last, but expired by the time the cache overflows
+    cache.conn.execute("UPDATE urls SET accessed_at = ? WHERE url = ?", (clock[0] + 100, "http://old.example/"))
+    clock[0] += 40
+    cache.put("http://b.example/", "b" * 10)
+
+    assert cache.conn.execute("SELECT url FROM urls ORDER BY url").fetchall() == [
+        ("http://a.example/",),
+        ("http://b.example/",),
+    ]
+    assert cache.stored_bytes == 20
+
+
+def test_stored_bytes_survive_reopening(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = FetchCache(path)
+    cache.put("http://a.example/", "x" * 7)
+    cache.close()
+
+    reopened = FetchCache(path)
+    assert reopened.stored_bytes == 7
+    assert reopened.get_text("http://a.example/") == "x" * 7
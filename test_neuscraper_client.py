@@ -0,0 +1,73 @@
+import pytest
+import requests
+
+from neuscraper_client import CircuitOpenError, NeuScraperClient
+
+
+class StubResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("not JSON")
+        return self.body
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class StubSession:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def post(self, endpoint, json, timeout):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_client(outcomes):
+    client = NeuScraperClient("http://service/predict/", failure_threshold=1, reset_timeout=0.0)
+    client.session = StubSession(outcomes)
+    return client
+
+
+@pytest.mark.parametrize(
+    "probe",
+    [requests.exceptions.TooManyRedirects(), requests.exceptions.ChunkedEncodingError(), StubResponse(200, None)],
+)
+def test_failed_probe_reopens_breaker_and_allows_the_next_probe(probe):
+    client = make_client([requests.exceptions.ConnectionError(), probe, StubResponse(200, {"Text": "ok"})])
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.extract("http://a.example")
+    assert client.breaker.is_open
+
+    with pytest.raises(Exception):
+        client.extract("http://b.example")
+    assert client.breaker.is_open and not client.breaker.probing
+
+    assert client.extract("http://c.example") == "ok"
+    assert not client.breaker.is_open
+
+
+def test_open_breaker_fails_fast_and_site_errors_do_not_count():
+    client = make_client([StubResponse(404), StubResponse(503)])
+    client.breaker.reset_timeout = 60.0
+
+    with pytest.raises(requests.HTTPError):
+        client.extract("http://missing.example")
+    assert not client.breaker.is_open
+
+    with pytest.raises(requests.HTTPError):
+        client.extract("http://down.example")
+    with pytest.raises(CircuitOpenError):
+        client.extract("http://next.example")
@@ -0,0 +1,53 @@
+from company_index import CompanyIndex
+from search_index import CompanySearchIndex
+
+
+def names(results):
+    return [record["name"] for record, _ in results]
+
+
+def make_indexes(tmp_path):
+    company_index = CompanyIndex(str(tmp_path))
+    search_index = CompanySearchIndex(str(tmp_path / "search_index.sqlite"))
+    return company_index, search_index
+
+
+def test_sync_picks_up_entities_appended_by_another_instance(tmp_path):
+    company_index, search_index = make_indexes(tmp_path)
+    company_index.add_many([{"name": "Acme Hosting", "website": "acme.co.id"}], "a")
+    search_index.sync(company_index)
+
+    CompanyIndex(str(tmp_path)).add_many([{"name": "Beta Logistics", "phone": "0215550101"}], "b")
+    search_index.sync(company_index)
+
+    assert names(search_index.search("logistics")) == ["Beta Logistics"]
+    assert len(search_index) == 2
+
+
+def test_sync_reindexes_updates_that_keep_the_entity_count(tmp_path):
+    company_index, search_index = make_indexes(tmp_path)
+    company_index.add_many([{"name": "Acme", "website": "acme.co.id", "description": "Printing."}], "a")
+    search_index.sync(company_index)
+
+    # Same entity, new description: the count does not change
+    CompanyIndex(str(tmp_path)).add_many(
+        [{"name": "Acme", "website": "acme.co.id", "description": "Cloud hosting."}], "b"
+    )
+    search_index.sync(company_index)
+
+    assert names(search_index.search("hosting")) == ["Acme"]
+    assert search_index.search("printing") == []
+    record, _ = search_index.search("acme")[0]
+    assert record["datasets"] == ["a", "b"]
+
+
+def test_sync_state_survives_reopening(tmp_path):
+    company_index, search_index = make_indexes(tmp_path)
+    company_index.add_many([{"name": "Acme", "website": "acme.co.id"}], "a")
+    search_index.sync(company_index)
+    search_index.close()
+
+    reopened = CompanySearchIndex(str(tmp_path / "search_index.sqlite"))
+    assert reopened.synced_sequence() == company_index.sequence
+    changed, _ = company_index.changed_since(reopened.synced_sequence())
+    assert changed == []
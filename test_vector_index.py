@@ -0,0 +1,51 @@
+import numpy as np
+
+from vector_index import CompanyVectorIndex
+
+
+class HashEmbedder:
+    """Deterministic unit vectors, one per distinct text."""
+
+    dim = 16
+
+    def encode(self, texts, max_length=None):
+        vectors = np.stack(
+            [np.random.RandomState(abs(hash(text)) % 2**32).randn(self.dim) for text in texts]
+        ).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def entities(start, stop, prefix="company"):
+    return [{"id": i, "record": {"name": f"{prefix} {i}"}} for i in range(start, stop)]
+
+
+def test_uncommitted_rows_are_searchable_and_commit_persists_them(tmp_path):
+    embedder = HashEmbedder()
+    index = CompanyVectorIndex(str(tmp_path), embedder, min_train_rows=64)
+    for start in range(0, 200, 32):
+        index.add_entities(entities(start, min(start + 32, 200)), commit=False)
+
+    vector = embedder.encode(["company 150"])[0]
+    assert index.search_vector(vector, 1)[0][0] == 150
+
+    # Re-embedding a row already filed in a bucket must not return it twice
+    index.commit()
+    index.add_entities([{"id": 150, "record": {"name": "renamed"}}], commit=False)
+    rows = [row for row, _ in index.search_vector(embedder.encode(["renamed"])[0], 200)]
+    assert rows[0] == 150 and rows.count(150) == 1
+    index.commit()
+
+    reopened = CompanyVectorIndex(str(tmp_path), embedder, min_train_rows=64)
+    assert len(reopened) == 200
+    assert reopened.centroids is not None
+    assert reopened.add_entities(entities(0, 100)) == 0
+
+
+def test_similar_excludes_the_row_itself(tmp_path):
+    index = CompanyVectorIndex(str(tmp_path), HashEmbedder())
+    index.add_entities(entities(0, 10))
+
+    similar = index.similar(3, k=5)
+    assert len(similar) == 5
+    assert 3 not in [row for row, _ in similar]
+    assert index.similar(99) == []
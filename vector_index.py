@@ -0,0 +1,275 @@
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+
+import numpy as np
+
+
+def company_text(record, max_chars=2000):
+    parts = [record.get("name", ""), record.get("address", ""), record.get("description", "")]
+    return " ".join(part for part in parts if part)[:max_chars]
+
+
+def text_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+class XLMREmbedder:
+    """Mean-pooled XLM-R sentence embeddings, computed locally.
+
+    Uses the same `xlm-roberta-base` weights NeuScraper initialises its text
+    encoder from. torch/transformers are only imported on first use.
+    """
+
+    def __init__(self, model_name="xlm-roberta-base", max_length=256, batch_size=32):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.dim = 768
+        self.model = None
+        self.tokenizer = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return all(importlib.util.find_spec(m) is not None for m in ("torch", "transformers"))
+
+    def _load(self):
+        import torch
+        from transformers import XLMRobertaModel, XLMRobertaTokenizer
+
+        self.tokenizer = XLMRobertaTokenizer.from_pretrained(self.model_name)
+        self.model = XLMRobertaModel.from_pretrained(self.model_name)
+        self.model.eval()
+        self.dim = self.model.config.hidden_size
+        self.torch = torch
+
+    def encode(self, texts, max_length=None):
+        with self.lock:
+            if self.model is None:
+                self._load()
+            vectors = []
+            for start in range(0, len(texts), self.batch_size):
+                batch = self.tokenizer(
+                    texts[start : start + self.batch_size],
+                    max_length=max_length or self.max_length,
+                    truncation=True,
+                    padding=True,
+                    return_tensors="pt",
+                )
+                with self.torch.no_grad():
+                    hidden = self.model(**batch).last_hidden_state
+                mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1)
+                vectors.append(pooled.float().numpy())
+        vectors = np.concatenate(vectors) if vectors else np.zeros((0, self.dim), np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class CompanyVectorIndex:
+    """Approximate nearest-neighbour index over company embeddings.
+
+    Row `i` of the memory-mapped float32 matrix holds the unit-normalised
+    embedding of `CompanyIndex` entity `i`. Search is an IVF index: rows are
+    bucketed by their nearest k-means centroid and a query only scores the
+    rows in its `nprobe` closest buckets. Below `min_train_rows` rows every
+    row is scored exactly. Rows are re-embedded only when their text changes.
+    Rows added since the last `commit` are scored exactly until `commit`
+    saves the index and files them into their buckets.
+    """
+
+    def __init__(self, directory, embedder, nprobe=16, min_train_rows=1024, query_max_length=32):
+        self.directory = directory
+        self.embedder = embedder
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        # Search box queries are short; the cap bounds the worst-case encoding time
+        self.query_max_length = query_max_length
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.matrix_path = os.path.join(directory, "embeddings.f32")
+        self.hashes_path = os.path.join(directory, "hashes.npy")
+        self.assign_path = os.path.join(directory, "assign.npy")
+        self.centroids_path = os.path.join(directory, "centroids.npy")
+
+        meta = {"dim": None, "capacity": 0, "trained_rows": 0}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                meta.update(json.load(f))
+        self.dim = meta["dim"]
+        self.capacity = meta["capacity"]
+        self.trained_rows = meta["trained_rows"]
+
+        self.matrix = None
+        if self.capacity:
+            self.matrix = np.memmap(
+                self.matrix_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim)
+            )
+        self.hashes = np.load(self.hashes_path) if os.path.exists(self.hashes_path) else np.zeros(0, np.int64)
+        # -1 marks rows without an embedding, -2 rows not yet assigned to a bucket
+        self.assign = np.load(self.assign_path) if os.path.exists(self.assign_path) else np.zeros(0, np.int32)
+        self.centroids = np.load(self.centroids_path) if os.path.exists(self.centroids_path) else None
+        self.pending_rows = []
+        self._build_lists()
+
+    def __len__(self):
+        return int((self.assign != -1).sum())
+
+    def add_entities(self, entities, commit=True):
+        """Embed entities whose text changed since they were last indexed.
+
+        With `commit=False` the rows are searchable but not yet saved; call
+        `commit` once after a series of calls.
+        """
+        pending = []
+        for entity in entities:
+            text = company_text(entity["record"])
+            digest = text_hash(text)
+            row = entity["id"]
+            if row < len(self.hashes) and self.hashes[row] == digest and self.assign[row] != -1:
+                continue
+            pending.append((row, text, digest))
+        if not pending:
+            return 0
+
+        vectors = self.embedder.encode([text for _, text, _ in pending])
+        with self.lock:
+            rows = np.array([row for row, _, _ in pending])
+            self._ensure_capacity(int(rows.max()) + 1, vectors.shape[1])
+            self.matrix[rows] = vectors
+            self.hashes[rows] = [digest for _, _, digest in pending]
+            self.assign[rows] = self._nearest_centroid(vectors) if self.centroids is not None else -2
+            self.pending_rows.append(rows)
+
+            present = int((self.assign != -1).sum())
+            if present >= self.min_train_rows and present >= 2 * self.trained_rows:
+                # Training reassigns every row, so the lists must match the new centroids at once
+                self._train()
+                self._build_lists()
+        if commit:
+            self.commit()
+        return len(pending)
+
+    def commit(self):
+        """Save the index and file pending rows into their buckets."""
+        with self.lock:
+            if self.matrix is not None:
+                self.matrix.flush()
+            self._save()
+            self._build_lists()
+
+    def search(self, query, k=10):
+        vector = self.embedder.encode([query], max_length=self.query_max_length)[0]
+        return self.search_vector(vector, k)
+
+    def similar(self, row, k=10):
+        # The matrix can be remapped by a concurrent add_entities
+        with self.lock:
+            if row >= len(self.assign) or self.assign[row] == -1:
+                return []
+            vector = np.array(self.matrix[row])
+        return self.search_vector(vector, k, exclude=row)
+
+    def search_vector(self, vector, k=10, exclude=None):
+        """Return up to `k` `(row, cosine similarity)` pairs, best first."""
+        with self.lock:
+            if self.matrix is None:
+                return []
+            if self.centroids is None:
+                candidates = np.flatnonzero(self.assign != -1)
+            else:
+                nprobe = min(self.nprobe, len(self.centroids))
+                probe = np.argpartition(-(self.centroids @ vector), nprobe - 1)[:nprobe]
+                candidates = np.concatenate(
+                    [self.list_rows[self.list_offsets[c] : self.list_offsets[c + 1]] for c in probe]
+                    + [self.unassigned_rows]
+                    + self.pending_rows
+                )
+            if exclude is not None:
+                candidates = candidates[candidates != exclude]
+            if len(candidates) == 0:
+                return []
+
+            # Sorted rows keep the memmap reads in file order; re-embedded pending rows may also sit in a list
+            candidates = np.unique(candidates)
+            scores = self.matrix[candidates] @ vector
+            top = np.argsort(-scores)[:k]
+            return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def _ensure_capacity(self, rows, dim):
+        if self.dim is None:
+            self.dim = dim
+        if rows > len(self.hashes):
+            grow = rows - len(self.hashes)
+            self.hashes = np.concatenate([self.hashes, np.zeros(grow, np.int64)])
+            self.assign = np.concatenate([self.assign, np.full(grow, -1, np.int32)])
+        if rows <= self.capacity:
+            return
+
+        # Grow geometrically so appends stay amortised O(1)
+        new_capacity = max(rows, 2 * self.capacity, 1024)
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self.matrix = np.memmap(
+            self.matrix_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim)
+        )
+
+    def _nearest_centroid(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _train(self, iterations=10, sample_size=20000, seed=0):
+        rows = np.flatnonzero(self.assign != -1)
+        nlist = max(1, int(2 * np.sqrt(len(rows))))
+        rng = np.random.RandomState(seed)
+        sample = np.array(self.matrix[np.sort(rng.choice(rows, min(sample_size, len(rows)), replace=False))])
+
+        # Spherical k-means: centroids stay unit length so dot product ranks buckets
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids.astype(np.float32)
+        for start in range(0, len(rows), 8192):
+            chunk = rows[start : start + 8192]
+            self.assign[chunk] = self._nearest_centroid(np.array(self.matrix[chunk]))
+        self.trained_rows = len(rows)
+
+    def _build_lists(self):
+        # CSR layout: rows of bucket c are list_rows[list_offsets[c]:list_offsets[c + 1]]
+        self.unassigned_rows = np.flatnonzero(self.assign == -2)
+        self.pending_rows = []
+        if self.centroids is None:
+            self.list_rows = np.zeros(0, np.int64)
+            self.list_offsets = np.zeros(1, np.int64)
+            return
+        assigned = np.flatnonzero(self.assign >= 0)
+        buckets = self.assign[assigned]
+        order = np.argsort(buckets, kind="stable")
+        self.list_rows = assigned[order]
+        self.list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(buckets, minlength=len(self.centroids)))]
+        )
+
+    def _save(self):
+        np.save(self.hashes_path, self.hashes)
+        np.save(self.assign_path, self.assign)
+        if self.centroids is not None:
+            np.save(self.centroids_path, self.centroids)
+        with open(self.meta_path, "w") as f:
+            json.dump(
+                {"dim": self.dim, "capacity": self.capacity, "trained_rows": self.trained_rows}, f
+            )